@@ -0,0 +1,280 @@
+#
+# orbit-partitioned local store of the AEBS products
+#
+# The AEJxLPL, AEJxPBL, AEJxLPS, AEJxPBS and AOBxFAC data are retrieved from
+# VirES in partitions of consecutive orbits which are kept locally as NumPy
+# .npz files (one array per variable). Only the partitions not yet stored
+# are fetched, concurrently, and the long-term analyses are then served
+# from the local store.
+#
+# Usage:
+#
+#   store = AEBSStore()
+#   boundaries = store.get_data(
+#       "AEJ_PBL", "A", "2015-01-01T00:00:00Z", "2016-01-01T00:00:00Z",
+#       measurements=["Latitude_QD", "MLT_QD", "J_QD", "Flags", "PointType"],
+#       auxiliaries=["QDOrbitDirection", "Kp"],
+#   )
+#
+
+import os
+import json
+import hashlib
+import datetime
+import threading
+from os.path import join, exists
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+import xarray
+from viresclient import SwarmRequest
+from viresclient._wps.time_util import parse_datetime
+
+STORE_PATH = "./data/aebs"
+ORBITS_PER_PARTITION = 32
+MAX_WORKERS = 4
+
+# Partitions ending less than FINAL_AGE ago may still be reprocessed
+# or completed and they are not stored.
+FINAL_AGE = datetime.timedelta(days=30)
+
+AEBS_COLLECTIONS = {
+    "AEJ_LPL": "SW_OPER_AEJ{spacecraft}LPL_2F",
+    "AEJ_PBL": "SW_OPER_AEJ{spacecraft}PBL_2F",
+    "AEJ_LPS": "SW_OPER_AEJ{spacecraft}LPS_2F",
+    "AEJ_PBS": "SW_OPER_AEJ{spacecraft}PBS_2F",
+    "AOB_FAC": "SW_OPER_AOB{spacecraft}FAC_2F",
+}
+
+# AOBxFAC pair indicator values
+PI_START = +1
+PI_STOP = -1
+
+DIMENSIONS_KEY = "__dimensions__"
+
+
+class AEBSStore:
+    """ Local orbit-partitioned store of the AEBS products.
+
+    The partitions are stored as
+
+        <path>/<product>/<spacecraft>/<request-hash>/<partition>.npz
+
+    where the request hash is calculated from the requested variables
+    and options and the partition number is the first orbit number
+    divided by the number of orbits per partition.
+    """
+
+    def __init__(self, path=STORE_PATH, server_url=None,
+                 orbits_per_partition=ORBITS_PER_PARTITION,
+                 max_workers=MAX_WORKERS):
+        self.path = path
+        self.server_url = server_url
+        self.orbits_per_partition = orbits_per_partition
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_data(self, product, spacecraft, start_time, end_time,
+                 measurements, auxiliaries=(), **options):
+        """ Get product data for the given time window as an xarray dataset.
+
+        The data of the orbits overlapping the time window are read from
+        the local store and the missing partitions are retrieved from
+        the server.
+        """
+        start_time, end_time = _parse_time(start_time), _parse_time(end_time)
+        auxiliaries = list(auxiliaries)
+        if "OrbitNumber" not in auxiliaries:
+            auxiliaries.append("OrbitNumber")
+        request = {
+            "collection": AEBS_COLLECTIONS[product].format(spacecraft=spacecraft),
+            "measurements": list(measurements),
+            "auxiliaries": auxiliaries,
+            **options,
+        }
+        directory = join(self.path, product, spacecraft, get_request_hash(request))
+
+        vires_request = self._get_vires_request()
+        start_orbit = vires_request.get_orbit_number(spacecraft, start_time)
+        end_orbit = vires_request.get_orbit_number(spacecraft, end_time)
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._get_partition, directory, partition, spacecraft,
+                    end_orbit, request,
+                ) for partition in range(
+                    start_orbit // self.orbits_per_partition,
+                    end_orbit // self.orbits_per_partition + 1,
+                )
+            ]
+            partitions = [future.result() for future in futures]
+
+        return _get_dataset(_slice_columns(
+            _concatenate_columns(partitions), start_time, end_time
+        ))
+
+    def get_statistics(self):
+        """ Get the store statistics. """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _get_partition(self, directory, partition, spacecraft, end_orbit, request):
+        filename = join(directory, f"{partition:06d}.npz")
+        if exists(filename):
+            with self._lock:
+                self.hits += 1
+            return load_partition(filename)
+
+        with self._lock:
+            self.misses += 1
+        first_orbit = max(partition * self.orbits_per_partition, 1)
+        last_orbit = (partition + 1) * self.orbits_per_partition - 1
+        is_complete = last_orbit <= end_orbit
+        last_orbit = min(last_orbit, end_orbit)
+
+        vires_request = self._get_vires_request()
+        start_time, end_time = vires_request.get_times_for_orbits(
+            first_orbit, last_orbit, spacecraft=spacecraft,
+        )
+        vires_request.set_collection(request["collection"])
+        vires_request.set_products(
+            measurements=request["measurements"],
+            auxiliaries=request["auxiliaries"],
+            **{
+                key: value for key, value in request.items()
+                if key not in ("collection", "measurements", "auxiliaries")
+            }
+        )
+        data = vires_request.get_between(
+            start_time=start_time,
+            end_time=end_time,
+            asynchronous=False,
+            show_progress=False,
+        ).as_xarray()
+        columns = _select_orbits(
+            _get_columns(data, request), first_orbit, last_orbit
+        )
+
+        now = _to_naive(datetime.datetime.now(datetime.timezone.utc))
+        if is_complete and _to_naive(end_time) < now - FINAL_AGE:
+            save_partition(filename, columns)
+        return columns
+
+    def _get_vires_request(self):
+        return SwarmRequest(self.server_url) if self.server_url else SwarmRequest()
+
+
+def get_pair_indices(time, pair_indicator):
+    """ Get indices of the start and stop points of the AOBxFAC boundary
+    pairs. Only a start point immediately followed by a stop point makes
+    a pair and the unmatched points are skipped.
+    """
+    time = numpy.asarray(time)
+    pair_indicator = numpy.asarray(pair_indicator)
+    index = numpy.argsort(time, kind="stable")
+    index = index[pair_indicator[index] != 0]
+    is_pair = (
+        (pair_indicator[index[:-1]] == PI_START) &
+        (pair_indicator[index[1:]] == PI_STOP)
+    )
+    return numpy.stack((index[:-1][is_pair], index[1:][is_pair]), axis=1)
+
+
+def get_request_hash(request):
+    """ Get hash of the request parameters (a JSON serializable dictionary).
+    """
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, default=str).encode("utf8")
+    ).hexdigest()
+
+
+def save_partition(filename, columns):
+    """ Save partition columns to a NumPy .npz file. """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename = f"{filename[:-4]}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    numpy.savez(tmp_filename, **{
+        variable: values for variable, (_, values) in columns.items()
+    }, **{DIMENSIONS_KEY: json.dumps({
+        variable: dims for variable, (dims, _) in columns.items()
+    })})
+    os.replace(tmp_filename, filename)
+
+
+def load_partition(filename):
+    """ Load partition columns from a NumPy .npz file. """
+    with numpy.load(filename) as data:
+        dimensions = json.loads(str(data[DIMENSIONS_KEY]))
+        return {
+            variable: (tuple(dimensions[variable]), data[variable])
+            for variable in data.files if variable != DIMENSIONS_KEY
+        }
+
+
+def _get_columns(data, request):
+    variables = ["Timestamp", "Latitude", "Longitude", "Radius"]
+    variables += [
+        variable for variable in request["measurements"] + request["auxiliaries"]
+        if variable not in variables
+    ]
+    return {
+        variable: (tuple(data[variable].dims), data[variable].values)
+        for variable in variables if variable in data.variables
+    }
+
+
+def _select_orbits(columns, first_orbit, last_orbit):
+    """ Select records of the given orbit range. """
+    if "OrbitNumber" not in columns:
+        return columns
+    orbit_number = columns["OrbitNumber"][1]
+    mask = (orbit_number >= first_orbit) & (orbit_number <= last_orbit)
+    return {
+        variable: (dims, values[mask])
+        for variable, (dims, values) in columns.items()
+    }
+
+
+def _slice_columns(columns, start_time, end_time):
+    times = columns["Timestamp"][1]
+    start, end = numpy.searchsorted(times, (
+        numpy.datetime64(start_time, "ns"), numpy.datetime64(end_time, "ns"),
+    ))
+    return {
+        variable: (dims, values[start:end])
+        for variable, (dims, values) in columns.items()
+    }
+
+
+def _concatenate_columns(partitions):
+    partitions = [
+        partition for partition in partitions
+        if "Timestamp" in partition and partition["Timestamp"][1].size
+    ] or partitions[:1]
+    return {
+        variable: (dims, numpy.concatenate([
+            partition[variable][1] for partition in partitions
+        ]))
+        for variable, (dims, _) in partitions[0].items()
+    }
+
+
+def _get_dataset(columns):
+    dims, times = columns.pop("Timestamp")
+    return xarray.Dataset(
+        {variable: (dims, values) for variable, (dims, values) in columns.items()},
+        coords={"Timestamp": (dims, times)},
+    )
+
+
+def _parse_time(time):
+    if isinstance(time, str):
+        time = parse_datetime(time)
+    return _to_naive(time)
+
+
+def _to_naive(time):
+    """ Convert datetime to naive UTC datetime. """
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time
@@ -0,0 +1,280 @@
+#
+# batched interpolation of spacecraft trajectories
+#
+# The trajectory (time-sorted table of positions and other attributes
+# from MAGx_LR or MODx_SC) is interpolated to arbitrary times, all columns
+# at once, with a single search of the trajectory nodes. The latitude and
+# longitude are interpolated as unit vectors, i.e., the interpolation
+# is correct also across the +/-180 deg longitude wrap-around.
+#
+
+import os
+import json
+import hashlib
+import datetime
+from os.path import join, exists
+from numpy import (
+    asarray, empty, full, stack, concatenate, searchsorted, median, diff,
+    sin, cos, arctan2, hypot, radians, degrees, nan, timedelta64,
+)
+from viresclient import SwarmRequest
+import numpy
+
+CACHE_PATH = "./data/cache/trajectory"
+
+TRAJECTORY_COLLECTIONS = {
+    "MAG_LR": "SW_OPER_MAG{spacecraft}_LR_1B",
+    "MOD_SC": "SW_OPER_MOD{spacecraft}_SC_1B",
+}
+TRAJECTORY_VARIABLES = ["Timestamp", "Latitude", "Longitude", "Radius"]
+
+# maximum interpolated gap relative to the nominal sampling step
+MAX_GAP_FACTOR = 1.5
+
+# in-process cache of the daily trajectory tables
+_TRAJECTORY_CACHE = {}
+
+ONE_DAY = datetime.timedelta(days=1)
+
+# Days ending less than FINAL_AGE ago may still be incomplete
+# and they are not cached.
+FINAL_AGE = datetime.timedelta(days=7)
+
+
+class TrajectoryInterpolator:
+    """ Piecewise linear interpolation of a spacecraft trajectory.
+
+    The trajectory is defined by the time-sorted `times` and a dictionary
+    of the interpolated `columns` (arrays with the first dimension matching
+    the times). The `Latitude` and `Longitude` columns, if present, are
+    interpolated as unit vectors.
+
+    The interpolated values are NaN for times outside the trajectory and
+    within gaps longer than `max_gap` (by default 1.5 times the median
+    sampling step). The trajectory nodes themselves are always valid.
+    """
+    LATITUDE = "Latitude"
+    LONGITUDE = "Longitude"
+
+    def __init__(self, times, columns, max_gap=None):
+        self.times = _to_nanoseconds(times)
+        if self.times.size > 1 and (diff(self.times) < 0).any():
+            raise ValueError("Trajectory times are not sorted!")
+        if max_gap is None:
+            max_gap = (
+                MAX_GAP_FACTOR * median(diff(self.times))
+                if self.times.size > 1 else 0
+            )
+        else:
+            max_gap = timedelta64(max_gap, "ns").astype("int64")
+        self.max_gap = max_gap
+        self.columns = {}
+        self.has_latlon = self.LATITUDE in columns and self.LONGITUDE in columns
+
+        # all interpolated values are stored in one matrix
+        blocks, offset = [], 0
+        if self.has_latlon:
+            blocks.append(_get_unit_vectors(
+                asarray(columns[self.LATITUDE]), asarray(columns[self.LONGITUDE])
+            ))
+            offset = 3
+        for name, values in columns.items():
+            if self.has_latlon and name in (self.LATITUDE, self.LONGITUDE):
+                continue
+            values = asarray(values, dtype="float64")
+            if values.shape[:1] != self.times.shape:
+                raise ValueError(f"Shape mismatch of the {name} column!")
+            shape = values.shape[1:]
+            size = int(numpy.prod(shape))
+            blocks.append(values.reshape((values.shape[0], size)))
+            self.columns[name] = (slice(offset, offset + size), shape)
+            offset += size
+        self.values = (
+            concatenate(blocks, axis=1) if blocks else
+            empty((self.times.size, 0))
+        )
+        # differences between the neighbouring nodes
+        self.slopes = diff(self.values, axis=0)
+
+    def __call__(self, times):
+        """ Interpolate the trajectory to the given times. Returns dictionary
+        of the interpolated columns.
+        """
+        times = _to_nanoseconds(times)
+        values = self._interpolate(times.ravel())
+        result = {}
+        if self.has_latlon:
+            latitude, longitude = _get_latlon(values[:, :3])
+            result[self.LATITUDE] = latitude.reshape(times.shape)
+            result[self.LONGITUDE] = longitude.reshape(times.shape)
+        for name, (slice_, shape) in self.columns.items():
+            result[name] = values[:, slice_].reshape(times.shape + shape)
+        return result
+
+    def _interpolate(self, times):
+        size = self.times.size
+        if size < 2:
+            return full((times.size, self.values.shape[1]), nan)
+        index = searchsorted(self.times, times, side="right") - 1
+        index.clip(0, size - 2, out=index)
+        time0, time1 = self.times[index], self.times[index + 1]
+        weight = ((times - time0) / (time1 - time0))[:, None]
+        values = self.values[index]
+        values += self.slopes[index] * weight
+        is_invalid = (
+            (times < self.times[0]) | (times > self.times[-1]) | (
+                (time1 - time0 > self.max_gap) &
+                (times != time0) & (times != time1)
+            )
+        )
+        values[is_invalid] = nan
+        return values
+
+
+def get_trajectory(spacecraft, start_time, end_time, product="MOD_SC",
+                   auxiliaries=(), cache_path=CACHE_PATH,
+                   final_age=FINAL_AGE, **options):
+    """ Get trajectory interpolator of a Swarm spacecraft from the MAGx_LR
+    or MODx_SC product covering the whole days of the given time window.
+
+    The trajectory tables are retrieved and cached per day in memory and
+    on disk (set `cache_path` to None to disable the disk cache) so that
+    the interpolators of different time windows share the tables.
+    The days ending less than `final_age` ago are not cached and they
+    are retrieved again by each call.
+    """
+    request = {
+        "collection": TRAJECTORY_COLLECTIONS[product].format(spacecraft=spacecraft),
+        "auxiliaries": list(auxiliaries),
+        **options,
+    }
+    data = _concatenate_tables([
+        _get_day_table(day, request, cache_path, final_age)
+        for day in _get_days(start_time, end_time)
+    ])
+    return TrajectoryInterpolator(data.pop("Timestamp"), data)
+
+
+def clear_cache(on_disk=False, cache_path=CACHE_PATH):
+    """ Clear the in-process and optionally the on-disk trajectory cache. """
+    _TRAJECTORY_CACHE.clear()
+    if on_disk and cache_path and os.path.isdir(cache_path):
+        for filename in os.listdir(cache_path):
+            if filename.endswith(".npz"):
+                os.remove(join(cache_path, filename))
+
+
+def _get_day_table(day, request, cache_path, final_age=FINAL_AGE):
+    """ Get trajectory table of one day. """
+    request = {
+        **request,
+        "startTime": f"{day.isoformat()}Z",
+        "endTime": f"{(day + ONE_DAY).isoformat()}Z",
+    }
+    now = _parse_time(datetime.datetime.now(datetime.timezone.utc))
+    if day + ONE_DAY >= now - final_age:
+        return _fetch_trajectory_table(request)
+    key = hashlib.sha256(
+        json.dumps(request, sort_keys=True, default=str).encode("utf8")
+    ).hexdigest()
+    data = _TRAJECTORY_CACHE.get(key)
+    if data is None:
+        data = _load_trajectory_table(key, request, cache_path)
+        _TRAJECTORY_CACHE[key] = data
+    return data
+
+
+def _get_days(start_time, end_time):
+    """ Get start times of the days overlapping the time window. """
+    start_time, end_time = _parse_time(start_time), _parse_time(end_time)
+    day = datetime.datetime.combine(start_time.date(), datetime.time())
+    days = [day]
+    while day + ONE_DAY < end_time:
+        day += ONE_DAY
+        days.append(day)
+    return days
+
+
+def _concatenate_tables(tables):
+    """ Concatenate the daily tables dropping the times not following
+    the previous tables (e.g., duplicate samples at the day boundaries).
+    """
+    tables = [table for table in tables if table["Timestamp"].size] or tables[:1]
+    masks, last_time = [], None
+    for table in tables:
+        times = table["Timestamp"]
+        masks.append(
+            times > last_time if last_time is not None else
+            numpy.ones(times.shape, dtype="bool")
+        )
+        if times.size:
+            last_time = times[-1] if last_time is None else max(last_time, times[-1])
+    return {
+        variable: concatenate([
+            table[variable][mask] for table, mask in zip(tables, masks)
+        ])
+        for variable in tables[0]
+    }
+
+
+def _parse_time(time):
+    """ Convert ISO-8601 string or datetime to naive UTC datetime. """
+    if isinstance(time, str):
+        time = datetime.datetime.fromisoformat(time.replace("Z", "+00:00"))
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time
+
+
+def _load_trajectory_table(key, request, cache_path):
+    filename = join(cache_path, f"{key}.npz") if cache_path else None
+    if filename and exists(filename):
+        with numpy.load(filename) as data:
+            return {variable: data[variable] for variable in data.files}
+    data = _fetch_trajectory_table(request)
+    if filename:
+        os.makedirs(cache_path, exist_ok=True)
+        tmp_filename = f"{filename[:-4]}.{os.getpid()}.tmp.npz"
+        numpy.savez(tmp_filename, **data)
+        os.replace(tmp_filename, filename)
+    return data
+
+
+def _fetch_trajectory_table(request):
+    options = {
+        key: value for key, value in request.items()
+        if key not in ("collection", "auxiliaries", "startTime", "endTime")
+    }
+    server_url = options.pop("server_url", None)
+    vires_request = SwarmRequest(server_url) if server_url else SwarmRequest()
+    vires_request.set_collection(request["collection"])
+    vires_request.set_products(
+        measurements=[], auxiliaries=request["auxiliaries"], **options
+    )
+    data = vires_request.get_between(
+        start_time=request["startTime"],
+        end_time=request["endTime"],
+    ).as_xarray()
+    return {
+        variable: data[variable].values
+        for variable in TRAJECTORY_VARIABLES + request["auxiliaries"]
+    }
+
+
+def _to_nanoseconds(times):
+    return asarray(times).astype("datetime64[ns]").astype("int64")
+
+
+def _get_unit_vectors(latitude, longitude):
+    latitude, longitude = radians(latitude), radians(longitude)
+    cos_latitude = cos(latitude)
+    return stack((
+        cos_latitude * cos(longitude),
+        cos_latitude * sin(longitude),
+        sin(latitude),
+    ), axis=-1)
+
+
+def _get_latlon(vectors):
+    x, y, z = vectors[..., 0], vectors[..., 1], vectors[..., 2]
+    return degrees(arctan2(z, hypot(x, y))), degrees(arctan2(y, x))
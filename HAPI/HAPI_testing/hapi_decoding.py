@@ -0,0 +1,213 @@
+#
+# HAPI data response decoding subroutines
+#
+
+import io
+import numpy
+
+HEADER_PREFIX = b"#"
+
+# mapping of the HAPI parameter types to the Numpy little-endian types
+HAPI_TYPES = {
+    "double": "<f8",
+    "integer": "<i4",
+}
+HAPI_STRING_TYPES = ("string", "isotime")
+
+
+def decode_data(buffer, parameters, format):
+    """ Decode a complete HAPI data response into a Numpy structured array. """
+    try:
+        decode = DECODERS[format]
+    except KeyError:
+        raise ValueError(f"Unsupported HAPI format {format!r}!") from None
+    return decode(buffer, parameters)
+
+
+def decode_binary(buffer, parameters):
+    """ Decode a complete HAPI binary response into a Numpy structured array.
+    The returned array is a read-only view of the input buffer, i.e., no data
+    are copied.
+    """
+    dtype = get_dtype(parameters)
+    offset = get_header_size(buffer, final=True)
+    count = (len(buffer) - offset) // dtype.itemsize
+    return numpy.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+
+def decode_csv(buffer, parameters):
+    """ Decode a complete HAPI CSV response into a Numpy structured array. """
+    decoder = CsvDecoder(parameters)
+    return _concatenate(
+        [decoder.feed(buffer), decoder.close()], decoder.dtype
+    )
+
+
+def parse_isotime(values):
+    """ Convert array of HAPI ISO-8601 time strings to datetime64[ns] array. """
+    values = numpy.char.rstrip(numpy.asarray(values).astype("U"), "Z")
+    return values.astype("datetime64[ns]")
+
+
+def get_dtype(parameters):
+    """ Get Numpy structured array data type from the HAPI dataset parameters
+    (the `parameters` block of the HAPI info response).
+    """
+    def _get_field(parameter):
+        type_ = parameter["type"]
+        if type_ in HAPI_STRING_TYPES:
+            type_ = f"S{parameter['length']}"
+        else:
+            type_ = HAPI_TYPES[type_]
+        shape = tuple(parameter.get("size") or ())
+        return (parameter["name"], type_, shape) if shape else (parameter["name"], type_)
+
+    return numpy.dtype([_get_field(parameter) for parameter in parameters])
+
+
+def get_header_size(buffer, final=False):
+    """ Get size of the leading header lines prefixed by the `#` character.
+    For a partial (non-final) buffer None is returned if the end of the header
+    cannot be determined yet.
+    """
+    offset = 0
+    while buffer[offset:offset + 1] == HEADER_PREFIX:
+        end_of_line = buffer.find(b"\n", offset)
+        if end_of_line < 0:
+            return len(buffer) if final else None
+        offset = end_of_line + 1
+    if offset == len(buffer) and not final:
+        # more header lines may follow
+        return None
+    return offset
+
+
+class BinaryDecoder:
+    """ Incremental HAPI binary response decoder.
+
+    The received chunks are decoded by the `feed()` method into Numpy
+    structured arrays of complete records. The arrays are views of the
+    received chunks and only the records split between two chunks are copied.
+    """
+
+    def __init__(self, parameters):
+        self.dtype = get_dtype(parameters)
+        self.header = b""
+        self._header_parsed = False
+        self._remainder = b""
+
+    def feed(self, chunk):
+        """ Decode chunk of data and return array of the complete records. """
+        if not self._header_parsed:
+            chunk = self._parse_header(chunk)
+            if chunk is None:
+                return numpy.empty(0, dtype=self.dtype)
+
+        arrays = []
+        record_size = self.dtype.itemsize
+        offset = 0
+        if self._remainder:
+            offset = record_size - len(self._remainder)
+            if offset > len(chunk):
+                self._remainder += chunk
+                return numpy.empty(0, dtype=self.dtype)
+            arrays.append(numpy.frombuffer(
+                self._remainder + chunk[:offset], dtype=self.dtype
+            ))
+
+        count = (len(chunk) - offset) // record_size
+        arrays.append(numpy.frombuffer(
+            chunk, dtype=self.dtype, count=count, offset=offset
+        ))
+        self._remainder = bytes(chunk[offset + count * record_size:])
+
+        return _concatenate(arrays, self.dtype)
+
+    def close(self):
+        """ Finish decoding and check there is no incomplete record left. """
+        if not self._header_parsed:
+            self.header = self._remainder[:get_header_size(self._remainder, final=True)]
+            self._remainder = self._remainder[len(self.header):]
+            self._header_parsed = True
+        if self._remainder:
+            raise ValueError(
+                f"Incomplete binary record ({len(self._remainder)} bytes)!"
+            )
+        return numpy.empty(0, dtype=self.dtype)
+
+    def _parse_header(self, chunk):
+        buffer = self._remainder + chunk
+        offset = get_header_size(buffer)
+        if offset is None:
+            self._remainder = buffer
+            return None
+        self.header = buffer[:offset]
+        self._header_parsed = True
+        self._remainder = b""
+        return memoryview(buffer)[offset:]
+
+
+class CsvDecoder:
+    """ Incremental HAPI CSV response decoder.
+
+    The received chunks are split at the last complete line and the complete
+    lines are parsed in one vectorized `numpy.loadtxt()` call per chunk.
+    """
+
+    def __init__(self, parameters):
+        self.dtype = get_dtype(parameters)
+        self._remainder = b""
+
+    def feed(self, chunk):
+        """ Decode chunk of data and return array of the complete records. """
+        buffer = self._remainder + chunk
+        end_of_lines = buffer.rfind(b"\n") + 1
+        self._remainder = buffer[end_of_lines:]
+        return self._parse(buffer[:end_of_lines])
+
+    def close(self):
+        """ Decode the last line not terminated by the newline character. """
+        buffer, self._remainder = self._remainder, b""
+        return self._parse(buffer)
+
+    def _parse(self, buffer):
+        # Note: the buffer always starts at the beginning of a line.
+        buffer = buffer[get_header_size(buffer, final=True):]
+        if not buffer.strip():
+            return numpy.empty(0, dtype=self.dtype)
+        return numpy.loadtxt(
+            io.StringIO(buffer.decode("utf-8")),
+            dtype=self.dtype,
+            delimiter=",",
+            comments=None,
+            quotechar='"',
+            ndmin=1,
+        )
+
+
+def get_decoder(format, parameters):
+    """ Get incremental decoder for the given format or None if the format
+    is not supported.
+    """
+    decoder_class = INCREMENTAL_DECODERS.get(format)
+    return decoder_class(parameters) if decoder_class else None
+
+
+def _concatenate(arrays, dtype):
+    arrays = [array for array in arrays if array.size > 0]
+    if not arrays:
+        return numpy.empty(0, dtype=dtype)
+    if len(arrays) == 1:
+        return arrays[0]
+    return numpy.concatenate(arrays)
+
+
+DECODERS = {
+    "binary": decode_binary,
+    "csv": decode_csv,
+}
+
+INCREMENTAL_DECODERS = {
+    "binary": BinaryDecoder,
+    "csv": CsvDecoder,
+}
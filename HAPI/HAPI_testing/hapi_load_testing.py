@@ -0,0 +1,247 @@
+#
+# concurrent HAPI load testing subroutines
+#
+
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from viresclient._wps.time_util import parse_datetime, parse_duration
+from hapi_testing import (
+    get_capabilities, get_catalog, get_info, get_random_time,
+    measure_data_request,
+)
+
+PERCENTILES = (50, 95, 99)
+
+
+def test_hapi_load(url, n_requests, concurrency=8, rate=None, datasets=None,
+                   formats=None, seed=None):
+    """ Run a concurrent HAPI load test and print the per-dataset and
+    per-format statistics.
+
+    The load is either closed-loop, i.e., a fixed number of requests
+    in flight (`concurrency`), or open-loop, i.e., requests started at
+    the target `rate` (requests per second) with at most `concurrency`
+    requests in flight.
+    """
+    return _run_coroutine(test_hapi_load_async(
+        url, n_requests, concurrency=concurrency, rate=rate,
+        datasets=datasets, formats=formats, seed=seed,
+    ))
+
+
+async def test_hapi_load_async(url, n_requests, concurrency=8, rate=None,
+                               datasets=None, formats=None, seed=None):
+    """ Asynchronous variant of the `test_hapi_load()` which can be awaited
+    directly from a running event loop (e.g., a Jupyter notebook).
+    """
+    session = get_session(concurrency)
+    with session:
+        jobs = generate_jobs(
+            url, n_requests, datasets=datasets, formats=formats,
+            rng=random.Random(seed), session=session,
+        )
+        print(
+            f"{url} {n_requests} requests, concurrency: {concurrency}, "
+            f"rate: {f'{rate:g}/s' if rate else 'unlimited'}"
+        )
+        results = await run_jobs(url, jobs, session, concurrency, rate)
+    statistics = get_statistics(results)
+    print_statistics(statistics)
+    return statistics
+
+
+def get_session(pool_size):
+    """ Get HTTP session sharing a connection pool of the given size. """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def generate_jobs(url, n_requests, datasets=None, formats=None, rng=random,
+                  session=requests):
+    """ Generate list of random data requests (dataset, format, start and
+    end time) spread evenly over the datasets and formats.
+    """
+    if not formats:
+        formats = get_capabilities(url, session=session)["outputFormats"]
+    if not datasets:
+        datasets = [
+            item["id"] for item in get_catalog(url, session=session)["catalog"]
+        ]
+
+    time_ranges = {}
+    for dataset in datasets:
+        info = get_info(url, dataset, session=session)
+        dataset_start = parse_datetime(info["startDate"])
+        dataset_end = parse_datetime(info["stopDate"])
+        time_selection = parse_duration(info["x_maxTimeSelection"]) / 10
+        if dataset_end - dataset_start < time_selection:
+            time_selection = dataset_end - dataset_start
+        time_ranges[dataset] = (dataset_start, dataset_end, time_selection)
+
+    combinations = [
+        (dataset, format_) for dataset in datasets for format_ in formats
+    ]
+
+    jobs = []
+    for idx in range(n_requests):
+        dataset, format_ = combinations[idx % len(combinations)]
+        dataset_start, dataset_end, time_selection = time_ranges[dataset]
+        start_time = get_random_time(
+            dataset_start, dataset_end - time_selection, rng=rng
+        )
+        jobs.append((dataset, format_, start_time, start_time + time_selection))
+
+    rng.shuffle(jobs)
+    return jobs
+
+
+async def run_jobs(url, jobs, session, concurrency, rate=None):
+    """ Execute the data requests concurrently and collect the results. """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    test_start = time.perf_counter()
+
+    async def _run_job(idx, job):
+        if rate:
+            delay = test_start + idx / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with semaphore:
+            return await loop.run_in_executor(
+                executor, measure_request, url, *job, session
+            )
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(*(
+            _run_job(idx, job) for idx, job in enumerate(jobs)
+        ))
+
+
+def measure_request(url, dataset, format, start_time, end_time, session=requests):
+    """ Perform one streamed data request and return its result record. """
+    result = {
+        "dataset": dataset,
+        "format": format,
+        "startTime": start_time,
+        "endTime": end_time,
+        "error": None,
+        "size": 0,
+    }
+    result["requestStart"] = time.perf_counter()
+    try:
+        measurement = measure_data_request(
+            url, dataset, format, start_time, end_time, session=session
+        )
+        result["error"] = measurement["error"]
+        result["size"] = measurement["size"]
+        result["firstByteTime"] = measurement["firstByteTime"]
+    except Exception as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+    result["requestEnd"] = time.perf_counter()
+    result["duration"] = result["requestEnd"] - result["requestStart"]
+    return result
+
+
+def get_statistics(results):
+    """ Aggregate the request results per dataset and format followed by
+    the overall statistics of all requests (dataset and format "*").
+
+    Two throughputs are reported: the aggregate throughput, i.e., the total
+    received bytes over the wall-clock time from the first request start
+    to the last request end, and the mean per-request throughput, i.e.,
+    the total received bytes over the sum of the request durations.
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault((result["dataset"], result["format"]), []).append(result)
+    statistics = [
+        _get_group_statistics(dataset, format_, items)
+        for (dataset, format_), items in sorted(groups.items())
+    ]
+    if results:
+        statistics.append(_get_group_statistics("*", "*", results))
+    return statistics
+
+
+def _get_group_statistics(dataset, format_, items):
+    durations = sorted(item["duration"] for item in items if not item["error"])
+    n_errors = sum(1 for item in items if item["error"])
+    size = sum(item["size"] for item in items if not item["error"])
+    busy_time = sum(durations)
+    wall_time = (
+        max(item["requestEnd"] for item in items) -
+        min(item["requestStart"] for item in items)
+    )
+    return {
+        "dataset": dataset,
+        "format": format_,
+        "numberOfRequests": len(items),
+        "numberOfErrors": n_errors,
+        "errorRate": n_errors / len(items),
+        **{
+            f"p{percentile}": get_percentile(durations, percentile)
+            for percentile in PERCENTILES
+        },
+        "size": size,
+        "wallTime": wall_time,
+        "aggregateThroughput": size / wall_time if wall_time > 0 else None,
+        "perRequestThroughput": size / busy_time if busy_time > 0 else None,
+    }
+
+
+def print_statistics(statistics):
+    """ Print table of the load test statistics. """
+    for item in statistics:
+        latencies = " ".join(
+            f"p{percentile}: {_format_value(item[f'p{percentile}'], 's')}"
+            for percentile in PERCENTILES
+        )
+        aggregate_throughput, per_request_throughput = (
+            _format_value(value and value / (1024*1024), "MB/s")
+            for value in (
+                item["aggregateThroughput"], item["perRequestThroughput"]
+            )
+        )
+        print(
+            f" - {item['dataset']} {item['format']} "
+            f"n: {item['numberOfRequests']} "
+            f"errors: {100 * item['errorRate']:.1f}% "
+            f"{latencies} "
+            f"aggregate: {aggregate_throughput} "
+            f"per request: {per_request_throughput}"
+        )
+
+
+def get_percentile(sorted_values, percentile):
+    """ Get percentile of sorted values (linear interpolation). """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percentile / 100
+    index = int(position)
+    if index + 1 >= len(sorted_values):
+        return sorted_values[-1]
+    weight = position - index
+    return (1 - weight) * sorted_values[index] + weight * sorted_values[index + 1]
+
+
+def _format_value(value, unit):
+    return "n/a" if value is None else f"{value:.3g}{unit}"
+
+
+def _run_coroutine(coroutine):
+    """ Run coroutine to completion, also from a thread with a running event
+    loop (e.g., Jupyter notebook).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
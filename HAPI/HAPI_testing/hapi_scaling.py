@@ -0,0 +1,231 @@
+#
+# HAPI response scaling subroutines
+#
+
+import random
+import datetime
+import statistics
+import requests
+from viresclient._wps.time_util import parse_datetime, parse_duration
+from hapi_testing import (
+    get_capabilities, get_catalog, get_info, get_random_time,
+    measure_data_request,
+)
+from hapi_decoding import get_decoder, INCREMENTAL_DECODERS
+
+MB = 1024 * 1024 # bytes
+
+DEFAULT_TARGET_SIZE = 10 * MB # bytes
+SCALE_FACTORS = (0.125, 0.25, 0.5, 1.0, 2.0, 4.0)
+MIN_TIME_SELECTION = datetime.timedelta(seconds=1)
+# The search starts from a small time selection grown geometrically
+# until the target is passed.
+INITIAL_TIME_SELECTION = datetime.timedelta(minutes=1)
+GROWTH_FACTOR = 4
+
+
+def test_hapi_scaling(url, target_size=None, target_records=None,
+                      factors=SCALE_FACTORS, datasets=None, formats=None,
+                      tolerance=0.2, max_iterations=16, decode=False,
+                      seed=None, session=requests):
+    """ Measure response time scaling of the HAPI datasets and formats.
+
+    For each dataset (and format) the time selection producing the target
+    response size (`target_size` in bytes) or record count (`target_records`)
+    is searched for (see `find_time_selection()`). The requests are then repeated for the time
+    selections scaled by the given `factors` and a fixed-overhead + per-MB
+    cost model is fitted to the measured durations. If `decode` is True,
+    the measured durations include decoding of the responses.
+    """
+    if target_size is None and target_records is None:
+        target_size = DEFAULT_TARGET_SIZE
+
+    if not formats:
+        formats = get_capabilities(url, session=session)["outputFormats"]
+    if not datasets:
+        datasets = [
+            item["id"] for item in get_catalog(url, session=session)["catalog"]
+        ]
+
+    rng = random.Random(seed)
+    results = []
+    for dataset in datasets:
+        results.extend(test_dataset_scaling(
+            url, dataset, formats, target_size=target_size,
+            target_records=target_records, factors=factors,
+            tolerance=tolerance, max_iterations=max_iterations,
+            decode=decode, rng=rng, session=session,
+        ))
+    return results
+
+
+def test_dataset_scaling(url, dataset, formats, target_size=None,
+                         target_records=None, factors=SCALE_FACTORS,
+                         tolerance=0.2, max_iterations=16, decode=False,
+                         rng=random, session=requests):
+    """ Measure response time scaling of one dataset for the given formats. """
+    info = get_info(url, dataset, session=session)
+    dataset_start = parse_datetime(info["startDate"])
+    dataset_end = parse_datetime(info["stopDate"])
+    max_time_selection = min(
+        parse_duration(info["x_maxTimeSelection"]),
+        dataset_end - dataset_start,
+    )
+    start_time = get_random_time(
+        dataset_start, dataset_end - max_time_selection, rng=rng
+    )
+    print(f"{dataset} {start_time.isoformat()} (max. {max_time_selection})")
+
+    def _measure(format_, time_selection, decode=decode):
+        measurement = measure_data_request(
+            url, dataset, format_, start_time, start_time + time_selection,
+            session=session, decoder=(
+                get_decoder(format_, info["parameters"]) if decode else None
+            ),
+        )
+        if measurement["error"]:
+            raise RuntimeError(measurement["error"])
+        return measurement
+
+    if target_records is not None:
+        # The record count does not depend on the format and the time
+        # selection is searched only once with a decodable format.
+        decodable_formats = [
+            format_ for format_ in formats if format_ in INCREMENTAL_DECODERS
+        ]
+        try:
+            if not decodable_formats:
+                raise ValueError("No decodable format to count records!")
+            probe_format = decodable_formats[0]
+            time_selection = find_time_selection(
+                lambda time_selection: _measure(probe_format, time_selection, decode=True)["numberOfRecords"],
+                target_records, max_time_selection, tolerance, max_iterations,
+            )
+        except Exception as error:
+            print(f" - {dataset} ERROR: {error}")
+            return []
+
+    results = []
+    initial_time_selection = INITIAL_TIME_SELECTION
+    for format_ in formats:
+        try:
+            if target_records is None:
+                # the search starts from the result of the previous format
+                time_selection = find_time_selection(
+                    lambda time_selection: _measure(format_, time_selection)["size"],
+                    target_size, max_time_selection, tolerance, max_iterations,
+                    initial_time_selection,
+                )
+                initial_time_selection = time_selection
+            points = []
+            for factor in factors:
+                scaled_time_selection = max(MIN_TIME_SELECTION, min(
+                    max_time_selection, time_selection * factor
+                ))
+                measurement = _measure(format_, scaled_time_selection)
+                points.append({
+                    "timeSelection": scaled_time_selection,
+                    "size": measurement["size"],
+                    "numberOfRecords": measurement.get("numberOfRecords"),
+                    "duration": measurement["lastByteTime"],
+                    "firstByteTime": measurement["firstByteTime"],
+                })
+            model = fit_cost_model(points)
+        except Exception as error:
+            print(f" - {dataset} {format_} ERROR: {error}")
+            continue
+        result = {
+            "dataset": dataset,
+            "format": format_,
+            "startTime": start_time,
+            "timeSelection": time_selection,
+            "points": points,
+            **model,
+        }
+        print_scaling_result(result)
+        results.append(result)
+    return results
+
+
+def find_time_selection(measure, target, max_time_selection, tolerance=0.2,
+                        max_iterations=16,
+                        initial_time_selection=INITIAL_TIME_SELECTION):
+    """ Find the time selection for which the measured quantity (response
+    size or number of records) matches the target value within the relative
+    tolerance.
+
+    The search starts from the initial time selection, which is grown
+    (or shrunk) by the GROWTH_FACTOR until the target is passed, and the target
+    is then found by bisection on the logarithmic scale of the time
+    selection. The large time selections are thus requested only if needed.
+    """
+    lower, upper = None, None
+    time_selection = max(MIN_TIME_SELECTION, min(
+        max_time_selection, initial_time_selection
+    ))
+    for _ in range(max_iterations):
+        value = measure(time_selection)
+        if abs(value - target) <= tolerance * target:
+            break
+        if value < target:
+            if time_selection >= max_time_selection:
+                break # target not reachable
+            lower = time_selection
+        else:
+            if time_selection <= MIN_TIME_SELECTION:
+                break # target not reachable
+            upper = time_selection
+        if upper is None:
+            time_selection = min(max_time_selection, time_selection * GROWTH_FACTOR)
+        elif lower is None:
+            time_selection = max(MIN_TIME_SELECTION, time_selection / GROWTH_FACTOR)
+        else:
+            time_selection = _geometric_mean(lower, upper)
+    return time_selection
+
+
+def fit_cost_model(points):
+    """ Fit the fixed-overhead + per-MB cost model
+        duration = overhead + cost_per_mb * size_in_mb
+    to the measured points by the least squares method.
+    """
+    sizes = [point["size"] / MB for point in points]
+    durations = [point["duration"] for point in points]
+    if len(set(sizes)) < 2:
+        return {"overhead": None, "costPerMB": None, "rSquared": None}
+    slope, intercept = statistics.linear_regression(sizes, durations)
+    try:
+        r_squared = statistics.correlation(sizes, durations) ** 2
+    except statistics.StatisticsError: # constant durations
+        r_squared = None
+    return {
+        "overhead": intercept,
+        "costPerMB": slope,
+        "rSquared": r_squared,
+    }
+
+
+def print_scaling_result(result):
+    """ Print summary of the dataset scaling result. """
+    sizes = ", ".join(
+        f"{point['size']/MB:.3g}MB/{point['duration']:.3g}s"
+        for point in result["points"]
+    )
+    if result["costPerMB"] is None:
+        model = "model: n/a"
+    else:
+        model = (
+            f"overhead: {result['overhead']:.3g}s, "
+            f"cost: {result['costPerMB']:.3g}s/MB, "
+            f"R2: {result['rSquared'] or 0:.3f}"
+        )
+    print(
+        f" - {result['dataset']} {result['format']} "
+        f"{result['timeSelection']} {model} [{sizes}]"
+    )
+
+
+def _geometric_mean(lower, upper):
+    return datetime.timedelta(seconds=(
+        lower.total_seconds() * upper.total_seconds()
+    ) ** 0.5)
@@ -5,11 +5,18 @@
 import time
 import datetime
 import random
+import threading
+import tracemalloc
+from contextlib import contextmanager
 import requests
 from viresclient._wps.time_util import parse_datetime, parse_duration
+from hapi_decoding import get_decoder, decode_data
 
+CHUNK_SIZE = 16 * 1024 # bytes
+SAMPLING_INTERVAL = 0.1 # seconds
 
-def test_hapi(url):
+
+def test_hapi(url, decode=False, trace_memory=False):
 
     capabilities = get_capabilities(url)
     formats = capabilities["outputFormats"]
@@ -18,10 +25,12 @@ def test_hapi(url):
     datasets = [item["id"] for item in catalog["catalog"]]
 
     for dataset in datasets:
-        test_dataset(url, dataset, formats)
+        test_dataset(
+            url, dataset, formats, decode=decode, trace_memory=trace_memory,
+        )
 
           
-def test_dataset(url, dataset, formats):
+def test_dataset(url, dataset, formats, decode=False, trace_memory=False):
     print(dataset, end=" ")
 
     info = get_info(url, dataset)
@@ -39,59 +48,244 @@ def test_dataset(url, dataset, formats):
     
     for format_ in formats:
         try:
-            test_dataset_request(url, dataset, format_, start_time, end_time)
-            request_stop = time.perf_counter_ns()
+            test_dataset_request(
+                url, dataset, format_, start_time, end_time,
+                parameters=(info["parameters"] if decode else None),
+                trace_memory=trace_memory,
+            )
         except Exception as error:
             print(f"ERROR: {error}")
 
 
-def test_dataset_request(url, dataset, format, start_time, end_time):
+def test_dataset_request(url, dataset, format, start_time, end_time,
+                         parameters=None, trace_memory=False):
+    # Note: the memory tracing slows down the allocations and the timings
+    #       measured with the tracing enabled include its overhead.
     print(f" - {dataset} {format} {start_time.isoformat()}/{end_time.isoformat()} ...", end=" ")
-    request_start = time.perf_counter_ns()
-    response = get_data(url, dataset, start_time, end_time, format)
-    request_end = time.perf_counter_ns()
-    if response.status_code != 200:
-        print("ERROR:", f"{response.status_code} {response.json()}")
+    decoder = get_decoder(format, parameters) if parameters else None
+    result = measure_data_request(
+        url, dataset, format, start_time, end_time, decoder=decoder,
+        trace_memory=trace_memory,
+    )
+    if result["error"]:
+        print("ERROR:", result["error"])
         return
-    request_duration = (request_end - request_start) * 1e-9
-    response_size = len(response.content)
-    print(f"{response_size/(1024*1024):.1f}MB {request_duration:.3g}s")
+    if parameters and not decoder:
+        records = ", no decoder"
+    elif decoder:
+        records = (
+            f", {result['numberOfRecords']} records, "
+            f"{result['recordRate']:.3g} records/s"
+        )
+    else:
+        records = ""
+    if trace_memory:
+        memory = (
+            ", peak memory increase "
+            f"{result['peakMemoryIncrease']/(1024*1024):.1f}MB"
+        )
+    else:
+        memory = ""
+    print(
+        f"{result['size']/(1024*1024):.1f}MB "
+        f"{result['lastByteTime']:.3g}s "
+        f"(TTFB {result['firstByteTime']:.3g}s, "
+        f"{result['throughput']/(1024*1024):.3g}MB/s"
+        f"{memory}{records})"
+    )
+
+
+def measure_data_request(url, dataset, format, start_time, end_time,
+                         session=requests, chunk_size=CHUNK_SIZE,
+                         sampling_interval=SAMPLING_INTERVAL, decoder=None,
+                         trace_memory=False):
+    """ Stream data response in chunks and measure its timing without keeping
+    the response body in memory.
+
+    The returned record contains the time to the response headers, time to
+    the first and last byte of the body (all in seconds since the request
+    start), response size in bytes, average throughput in bytes per second
+    and timeline of the (elapsed time, received bytes) samples recorded
+    every `sampling_interval` seconds.
+
+    If `trace_memory` is set, the Python memory allocations are traced
+    and the record contains also the peak increase of the allocated memory
+    during the request (`peakMemoryIncrease`, in bytes). Note that the traced
+    memory includes allocations of any concurrent requests.
+
+    If an incremental decoder is provided (see `hapi_decoding.get_decoder()`)
+    the received chunks are decoded on the fly and the record contains
+    also the number of decoded records and the end-to-end record rate
+    (records per second including the decoding).
+    """
+    result = {
+        "error": None,
+        "size": 0,
+        "headersTime": None,
+        "firstByteTime": None,
+        "lastByteTime": None,
+        "throughput": None,
+        "timeline": [],
+        "peakMemoryIncrease": None,
+    }
+    with _trace_memory(trace_memory) as memory_monitor:
+        _measure_data_request(
+            result, memory_monitor, url, dataset, format, start_time, end_time,
+            session, chunk_size, sampling_interval, decoder,
+        )
+    if memory_monitor:
+        result["peakMemoryIncrease"] = memory_monitor.peak_increase
+    return result
+
+
+def _measure_data_request(result, memory_monitor, url, dataset, format,
+                          start_time, end_time, session, chunk_size,
+                          sampling_interval, decoder):
+    request_start = time.perf_counter()
+
+    def _elapsed_time():
+        return time.perf_counter() - request_start
+
+    def _update_memory():
+        if memory_monitor:
+            memory_monitor.update()
+
+    with get_data(url, dataset, start_time, end_time, format, session=session, stream=True) as response:
+        result["headersTime"] = _elapsed_time()
+        if response.status_code != 200:
+            result["error"] = f"{response.status_code} {_get_error_message(response)}"
+            return
+
+        size = 0
+        n_records = 0
+        n_samples = 0
+
+        def _receive(chunk):
+            nonlocal size, n_records, n_samples
+            elapsed_time = _elapsed_time()
+            if chunk and result["firstByteTime"] is None:
+                result["firstByteTime"] = elapsed_time
+            # received bytes sampled on a fixed time grid
+            while elapsed_time >= (n_samples + 1) * sampling_interval:
+                n_samples += 1
+                result["timeline"].append((n_samples * sampling_interval, size))
+            size += len(chunk)
+            if decoder:
+                n_records += decoder.feed(chunk).size
+            _update_memory()
+
+        # Note: the first byte is read separately as a full chunk read
+        # blocks until the whole chunk is received.
+        _receive(response.raw.read(1, decode_content=True))
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            _receive(chunk)
+        if decoder:
+            n_records += decoder.close().size
+            _update_memory()
+
+        result["lastByteTime"] = elapsed_time = _elapsed_time()
+        if result["firstByteTime"] is None:
+            result["firstByteTime"] = elapsed_time
+        result["timeline"].append((elapsed_time, size))
+        result["size"] = size
+        if elapsed_time > 0:
+            result["throughput"] = size / elapsed_time
+        if decoder:
+            result["numberOfRecords"] = n_records
+            result["recordRate"] = (
+                n_records / elapsed_time if elapsed_time > 0 else None
+            )
+
+
+class _MemoryMonitor:
+    """ Peak increase of the traced memory since the monitor creation. """
+
+    def __init__(self):
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        self.peak_increase = 0
+
+    def update(self):
+        current = tracemalloc.get_traced_memory()[0]
+        self.peak_increase = max(self.peak_increase, current - self.baseline)
+
+
+_tracing_lock = threading.Lock()
+_tracing_count = 0
+_tracing_started = False
+
+
+@contextmanager
+def _trace_memory(enabled=True):
+    """ Trace memory allocations while at least one of the measured requests
+    is in progress. Yields memory monitor or None if not enabled.
+    """
+    global _tracing_count, _tracing_started
+    if not enabled:
+        yield None
+        return
+    with _tracing_lock:
+        if not _tracing_count and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_count += 1
+        monitor = _MemoryMonitor()
+    try:
+        yield monitor
+    finally:
+        monitor.update()
+        with _tracing_lock:
+            _tracing_count -= 1
+            if not _tracing_count and _tracing_started:
+                tracemalloc.stop()
+                _tracing_started = False
+
+
+def _get_error_message(response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text[:1024]
 
     
-def get_capabilities(url):
+def get_hapi_data(url, dataset, start_time, end_time, format="binary",
+                  session=requests):
+    """ Get HAPI data decoded as a Numpy structured array. """
+    parameters = get_info(url, dataset, session=session)["parameters"]
+    with get_data(url, dataset, start_time, end_time, format, session=session) as response:
+        response.raise_for_status()
+        return decode_data(response.content, parameters, format)
+
+
+def get_capabilities(url, session=requests):
     """ Get HAPI server capabilities. """
-    return requests.get(f"{url}/hapi/capabilities").json()
+    return session.get(f"{url}/hapi/capabilities").json()
 
     
-def get_catalog(url):
+def get_catalog(url, session=requests):
     """ List datasets offered by the server. """
-    return requests.get(f"{url}/hapi/catalog").json()
+    return session.get(f"{url}/hapi/catalog").json()
     
 
-def get_info(url, dataset):
-    """ Get dataset description. """
-    return requests.get(f"{url}/hapi/capabilities").json()
-
-
-def get_info(url, dataset):
+def get_info(url, dataset, session=requests):
     """ Get dataset description. """
-    return requests.get(f"{url}/hapi/info?dataset={dataset}").json()
+    return session.get(f"{url}/hapi/info?dataset={dataset}").json()
 
 
-def get_data(url, dataset, start_time, end_time, format):
+def get_data(url, dataset, start_time, end_time, format, session=requests, stream=False):
     """ Get data response. """
     #https://staging.viresdisc.vires.services/hapi/data?dataset=SW_OPER_MAGA_LR_1B&parameters=Latitude,Longitude,Radius,B_NEC,Flags_B&start=2013-11-25T11:02:52Z&stop=2013-11-25T11:03:02Z&format=json&include=header
-    return requests.get(
+    return session.get(
         f"{url}/hapi/data"
         f"?dataset={dataset}"
         f"&start={start_time.isoformat()}"
         f"&stop={end_time.isoformat()}"
         f"&format={format}"
-        "&include=header"
+        "&include=header",
+        stream=stream,
     )
 
 
-def get_random_time(start, end):
+def get_random_time(start, end, rng=random):
     total_seconds = max(0, int((end - start).total_seconds()))
-    random_seconds = random.randrange(total_seconds) if total_seconds > 0 else 0.0
+    random_seconds = rng.randrange(total_seconds) if total_seconds > 0 else 0.0
     return start + datetime.timedelta(seconds=random_seconds)
\ No newline at end of file
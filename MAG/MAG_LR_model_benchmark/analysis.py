@@ -0,0 +1,170 @@
+#
+# benchmark results analysis subroutines
+#
+
+import json
+import numpy
+import pandas as pd
+
+LABELS = [
+    "plain request",
+    "plain request (cached)",
+    "filter: Flags_B != 255",
+    "aux.var.: MLT,  QDLat",
+    "aux.var.: MLT, QDLat",
+    "model: CHAOS",
+    "model: CHAOS80",
+    "model: CHAOS-Static",
+    "model: CHAOS-Static80",
+    "model: CHAOS-Core",
+    "model: CHAOS-MMA",
+    "model: CHAOS-MMA-Primary",
+    "model: CHAOS-MMA-Secondary",
+    "model: MIO_SHA_2C",
+    "model: MIO_SHA_2C-Primary",
+    "model: MIO_SHA_2C-Secondary",
+]
+
+LABEL_ORDER = {label: index for index, label in enumerate(LABELS, 1)}
+
+DURATION_PER_1K_SAMPLES = "durationPer1kSamples"
+N_RESAMPLES = 2000
+CONFIDENCE_LEVEL = 0.95
+MIN_SAMPLES = 1000
+
+
+def load_data_from_json_log(filename, min_samples=MIN_SAMPLES):
+    """ Load benchmark JSON log into a pandas data-frame with the request
+    duration normalized per 1k samples. Records with less than `min_samples`
+    samples are dropped as they are dominated by the fixed overhead.
+    """
+    with open(filename, encoding="utf8") as input_file:
+        records = [json.loads(line) for line in input_file if line.strip()]
+    return prepare_data(pd.DataFrame(records), min_samples=min_samples)
+
+
+def load_data_from_store(store, min_samples=MIN_SAMPLES, **filters):
+    """ Load benchmark records from a `result_store.ResultStore` into
+    a pandas data-frame with the request duration normalized per 1k samples.
+    The filters are passed to the `ResultStore.load()` method.
+    """
+    return prepare_data(store.load(**filters), min_samples=min_samples)
+
+
+def prepare_data(df, min_samples=MIN_SAMPLES):
+    """ Drop records with less than `min_samples` samples, add the request
+    duration normalized per 1k samples and sort the records by the test case.
+    """
+    df = df[df["numberOfSamples"] >= max(1, min_samples)].copy()
+    df[DURATION_PER_1K_SAMPLES] = (
+        1e3 * df["requestDuration"] / df["numberOfSamples"]
+    )
+    df["_labelSortingIndex"] = df["description"].map(
+        lambda label: LABEL_ORDER.get(label, 0)
+    )
+    return df.sort_values("_labelSortingIndex")
+
+
+def bootstrap(values, statistic=numpy.median, n_resamples=N_RESAMPLES,
+              rng=None):
+    """ Get bootstrap distribution of the statistic of the given values. """
+    values = numpy.asarray(values)
+    rng = numpy.random.default_rng(rng)
+    indices = rng.integers(0, values.size, size=(n_resamples, values.size))
+    return statistic(values[indices], axis=1)
+
+
+def get_confidence_interval(distribution, confidence_level=CONFIDENCE_LEVEL):
+    """ Get percentile confidence interval from a bootstrap distribution. """
+    alpha = 0.5 * (1.0 - confidence_level)
+    return tuple(numpy.quantile(distribution, [alpha, 1.0 - alpha]))
+
+
+def summarize(df, by=("serverURL", "description"),
+              column=DURATION_PER_1K_SAMPLES, n_resamples=N_RESAMPLES,
+              confidence_level=CONFIDENCE_LEVEL, seed=None):
+    """ Get per-group median of the normalized duration with its bootstrap
+    confidence interval.
+    """
+    rng = numpy.random.default_rng(seed)
+    rows = []
+    for key, group in df.groupby(list(by), sort=False):
+        values = group[column].values
+        low, high = get_confidence_interval(
+            bootstrap(values, n_resamples=n_resamples, rng=rng),
+            confidence_level,
+        )
+        rows.append({
+            **dict(zip(by, key if isinstance(key, tuple) else (key,))),
+            "count": values.size,
+            "median": numpy.median(values),
+            "ciLow": low,
+            "ciHigh": high,
+        })
+    return pd.DataFrame(rows)
+
+
+def compare(df_before, df_after, by=("description",),
+            column=DURATION_PER_1K_SAMPLES, n_resamples=N_RESAMPLES,
+            confidence_level=CONFIDENCE_LEVEL, tolerance=0.05, seed=None):
+    """ Compare two benchmark results and flag statistically significant
+    changes.
+
+    For each group the speed-up, i.e., the ratio of the before and after
+    medians of the normalized durations, is calculated with its bootstrap
+    confidence interval. The change is flagged as a regression ("slower")
+    or a speed-up ("faster") if the whole confidence interval is outside
+    the `tolerance` band around 1.
+    """
+    rng = numpy.random.default_rng(seed)
+    groups_before = dict(_iter_groups(df_before, by))
+    groups_after = dict(_iter_groups(df_after, by))
+    rows = []
+    for key, before in groups_before.items():
+        after = groups_after.get(key)
+        if after is None:
+            continue
+        before, after = before[column].values, after[column].values
+        speed_up = bootstrap(before, n_resamples=n_resamples, rng=rng) / bootstrap(
+            after, n_resamples=n_resamples, rng=rng
+        )
+        low, high = get_confidence_interval(speed_up, confidence_level)
+        if low > 1.0 + tolerance:
+            status = "faster"
+        elif high < 1.0 / (1.0 + tolerance):
+            status = "slower"
+        else:
+            status = "unchanged"
+        rows.append({
+            **dict(zip(by, key)),
+            "countBefore": before.size,
+            "countAfter": after.size,
+            "medianBefore": numpy.median(before),
+            "medianAfter": numpy.median(after),
+            "speedUp": numpy.median(before) / numpy.median(after),
+            "speedUpCiLow": low,
+            "speedUpCiHigh": high,
+            "status": status,
+        })
+    df = pd.DataFrame(rows)
+    if "description" in by and not df.empty:
+        df["_labelSortingIndex"] = df["description"].map(
+            lambda label: LABEL_ORDER.get(label, 0)
+        )
+        df = df.sort_values("_labelSortingIndex").drop(columns="_labelSortingIndex")
+    return df
+
+
+def is_passed(comparison):
+    """ True if the comparison does not contain any significant regression. """
+    return not (comparison["status"] == "slower").any()
+
+
+def export_summary(comparison, filename):
+    """ Export the compact comparison table to a CSV file. """
+    comparison.to_csv(filename, index=False, float_format="%.6g")
+
+
+def _iter_groups(df, by):
+    for key, group in df.groupby(list(by), sort=False):
+        yield (key if isinstance(key, tuple) else (key,)), group
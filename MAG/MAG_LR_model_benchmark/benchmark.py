@@ -2,25 +2,28 @@
 # common benchmark subroutines
 #
 
+import os
 import requests
 import random
 import time
 import json
 import datetime
 import zoneinfo
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from viresclient import SwarmRequest
+from viresclient._data_handling import FileReader
 from viresclient._wps.time_util import parse_datetime, parse_duration
 
 TZ_UTC = zoneinfo.ZoneInfo("UTC")
 
 
-def get_random_collection(collections):
-    return random.choice(collections)
+def get_random_collection(collections, rng=random):
+    return rng.choice(collections)
 
 
-def get_random_time(start, end):
+def get_random_time(start, end, rng=random):
     total_seconds = max(0, int((end - start).total_seconds()))
-    random_seconds = random.randrange(total_seconds)
+    random_seconds = rng.randrange(total_seconds)
     return start + datetime.timedelta(seconds=random_seconds)
 
 
@@ -33,7 +36,14 @@ def get_collection_date_range(url, collection):
     )
 
 
-def measure_request_duration(url, collection, start_time, end_time, auxiliaries=None, models=None, filters=None):
+def measure_request_duration(url, collection, start_time, end_time, auxiliaries=None, models=None, filters=None, asynchronous=False):
+    """ Measure duration of a data request.
+
+    Returns the total request duration, number of samples and the timing
+    breakdown of the request phases (see `instrument_wps_service()`)
+    extended by the response file size, CDF file decoding and xarray
+    dataset construction times.
+    """
     request = SwarmRequest(f"{url}/ows")
     request.set_collection(collection)
     request.set_products(
@@ -43,29 +53,127 @@ def measure_request_duration(url, collection, start_time, end_time, auxiliaries=
     )
     for filter_ in filters or ():
         request.add_filter(filter_)
+    phases = instrument_wps_service(request._wps_service)
     request_start = time.perf_counter_ns()
     data = request.get_between(
         start_time=start_time,
         end_time=end_time,
-        asynchronous=False,
+        asynchronous=asynchronous,
         show_progress=False,
     )
     request_stop = time.perf_counter_ns()
     request_duration = (request_stop - request_start) * 1e-9
-    xdata = data.as_xarray() 
+    phases["fileSize"] = sum(
+        os.path.getsize(item._file.name) for item in data.contents
+    )
+    phases["fileDecodeDuration"] = measure_file_decode_duration(data)
+    xarray_start = time.perf_counter_ns()
+    xdata = data.as_xarray()
+    xarray_stop = time.perf_counter_ns()
+    phases["xarrayDuration"] = (xarray_stop - xarray_start) * 1e-9
     size = xdata["Timestamp"].shape[0]
-    return request_duration, size
+    return request_duration, size, phases
+
+
+def measure_file_decode_duration(data):
+    """ Measure time needed to read all variables from the returned CDF files.
+    """
+    decode_start = time.perf_counter_ns()
+    for item in data.contents:
+        with FileReader(item._file, **item._file_options) as reader:
+            for variable in reader.variables:
+                reader.get_variable(variable)
+    decode_stop = time.perf_counter_ns()
+    return (decode_stop - decode_start) * 1e-9
+
+
+def instrument_wps_service(wps_service):
+    """ Instrument the WPS service of a viresclient request object to collect
+    timing of the request phases. The returned dictionary is updated
+    by the subsequent requests:
+
+        submitDuration      asynchronous job submission (0 for synchronous
+                            requests)
+        serverWaitDuration  waiting for the server to process the request,
+                            i.e., job status polling for asynchronous
+                            requests or time to the response headers for
+                            synchronous requests
+        downloadDuration    retrieval of the response content
+        downloadSize        downloaded bytes (as reported by the server)
+
+    The times are in seconds and cumulative for requests split into
+    multiple chunks.
+    """
+    phases = {
+        "submitDuration": 0.0,
+        "serverWaitDuration": 0.0,
+        "downloadDuration": 0.0,
+        "downloadSize": 0,
+    }
+    state = {"submitStop": None}
+    retrieve = wps_service.retrieve
+    submit_async = wps_service.submit_async
+    retrieve_async_output = wps_service.retrieve_async_output
+
+    def _timed_handler(handler, start, wait_phase):
+        handler = handler or wps_service._default_handler
+
+        def _handler(file_obj):
+            handler_start = time.perf_counter()
+            phases[wait_phase] += handler_start - start
+            phases["downloadSize"] += int(file_obj.info().get("Content-Length") or 0)
+            try:
+                return handler(file_obj)
+            finally:
+                phases["downloadDuration"] += time.perf_counter() - handler_start
+
+        return _handler
+
+    def _retrieve(request, handler=None, **kwargs):
+        start = time.perf_counter()
+        return retrieve(
+            request, _timed_handler(handler, start, "serverWaitDuration"), **kwargs
+        )
+
+    def _submit_async(request, **kwargs):
+        start = time.perf_counter()
+        try:
+            return submit_async(request, **kwargs)
+        finally:
+            state["submitStop"] = time.perf_counter()
+            phases["submitDuration"] += state["submitStop"] - start
+
+    def _retrieve_async_output(status_url, output_name, handler=None):
+        start = time.perf_counter()
+        if state["submitStop"] is not None:
+            phases["serverWaitDuration"] += start - state["submitStop"]
+            state["submitStop"] = None
+        return retrieve_async_output(
+            status_url, output_name, _timed_handler(handler, start, "downloadDuration")
+        )
+
+    wps_service.retrieve = _retrieve
+    wps_service.submit_async = _submit_async
+    wps_service.retrieve_async_output = _retrieve_async_output
+
+    return phases
 
 
 def run_benchmark(url, description, collection, start_time, end_time, **options):
-    elapsed_time, size = measure_request_duration(
+    elapsed_time, size, phases = measure_request_duration(
         url=url,
         collection=collection,
         start_time=start_time,
         end_time=end_time,
         **options
     )
-    print(f"{size} {elapsed_time:.3g}s {description}")
+    print(
+        f"{size} {elapsed_time:.3g}s "
+        f"(wait {phases['serverWaitDuration']:.3g}s, "
+        f"download {phases['downloadDuration']:.3g}s, "
+        f"decode {phases['fileDecodeDuration']:.3g}s, "
+        f"xarray {phases['xarrayDuration']:.3g}s) {description}"
+    )
     return {
         "timestamp": datetime.datetime.now(TZ_UTC),
         "serverURL": url,
@@ -75,15 +183,97 @@ def run_benchmark(url, description, collection, start_time, end_time, **options)
         "requestDuration": elapsed_time,
         "numberOfSamples": size,
         "description": description,
+        **phases,
+    }
+
+
+def get_common_collection_date_range(urls, collection):
+    """ Get collection date range available on all given servers. """
+    start_times, end_times = zip(*(
+        get_collection_date_range(url, collection) for url in urls
+    ))
+    return max(start_times), min(end_times)
+
+
+def build_schedule(urls, collections, selection_times, test_cases, n_runs, seed=None):
+    """ Build reproducible benchmark schedule, i.e., list of
+    (collection, start time, end time, test case) items.
+    The random collections and time windows are drawn from a generator
+    initialized with the given seed within the collections' date ranges
+    common to all the servers.
+    """
+    rng = random.Random(seed)
+    date_ranges = {
+        collection: get_common_collection_date_range(urls, collection)
+        for collection in collections
     }
+    schedule = []
+    for selection_time in selection_times:
+        selection_duration = parse_duration(selection_time)
+        for idx in range(n_runs):
+            collection = get_random_collection(collections, rng=rng)
+            collection_start_time, collection_end_time = date_ranges[collection]
+            start_time = get_random_time(
+                collection_start_time,
+                collection_end_time - selection_duration,
+                rng=rng,
+            )
+            for test_case in test_cases:
+                schedule.append({
+                    "scheduleIndex": len(schedule),
+                    "selectionTime": selection_time,
+                    "run": idx + 1,
+                    "collection": collection,
+                    "startTime": start_time,
+                    "endTime": start_time + selection_duration,
+                    "testCase": test_case,
+                    "seed": seed,
+                })
+    return schedule
+
+
+def run_schedule(urls, schedule, file, store=None):
+    """ Run the same benchmark schedule against multiple servers in parallel.
+    Each schedule item is executed concurrently on all servers (in rotated
+    order) before the next item is started so that the varying load
+    of the infrastructure affects all servers equally. The records are
+    appended to the given log file as they complete and optionally also
+    to a result store (see `result_store.ResultStore`).
+    """
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        for item in schedule:
+            shift = item["scheduleIndex"] % len(urls)
+            futures = {
+                executor.submit(
+                    run_benchmark,
+                    url=url,
+                    collection=item["collection"],
+                    start_time=item["startTime"],
+                    end_time=item["endTime"],
+                    **item["testCase"],
+                ): url
+                for url in urls[shift:] + urls[:shift]
+            }
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as error:
+                    print(f"ERROR: {futures[future]} {error}")
+                    continue
+                record["scheduleIndex"] = item["scheduleIndex"]
+                record["seed"] = item["seed"]
+                write_record(record, file)
+                if store is not None:
+                    store.append(record)
 
 
-def run_benchmark_set(url, collection, selection_time, test_cases):
+def run_benchmark_set(url, collection, selection_time, test_cases, rng=random):
     selection_time = parse_duration(selection_time)
     collection_start_time, collection_end_time = get_collection_date_range(url, collection)
     start_time = get_random_time(
         collection_start_time,
-        collection_end_time - selection_time
+        collection_end_time - selection_time,
+        rng=rng,
     )
     end_time = start_time + selection_time
     common_options = {
@@ -0,0 +1,183 @@
+#
+# columnar benchmark result store
+#
+
+import os
+import re
+import json
+import uuid
+import datetime
+from urllib.parse import urlparse
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+# record schema (see benchmark.run_benchmark and benchmark.run_schedule)
+SCHEMA = pa.schema([
+    ("timestamp", TIMESTAMP),
+    ("serverURL", pa.string()),
+    ("collection", pa.string()),
+    ("startTime", TIMESTAMP),
+    ("endTime", TIMESTAMP),
+    ("requestDuration", pa.float64()),
+    ("numberOfSamples", pa.int64()),
+    ("description", pa.string()),
+    ("submitDuration", pa.float64()),
+    ("serverWaitDuration", pa.float64()),
+    ("downloadDuration", pa.float64()),
+    ("downloadSize", pa.int64()),
+    ("fileSize", pa.int64()),
+    ("fileDecodeDuration", pa.float64()),
+    ("xarrayDuration", pa.float64()),
+    ("scheduleIndex", pa.int64()),
+    ("seed", pa.int64()),
+])
+
+TIME_FIELDS = [
+    field.name for field in SCHEMA if field.type == TIMESTAMP
+]
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("server", pa.string()), ("date", pa.string())]),
+    flavor="hive",
+)
+
+BATCH_SIZE = 100
+
+
+class ResultStore:
+    """ Benchmark result store.
+
+    The records are buffered and appended in batches as Parquet files
+    partitioned by the server and date, i.e.,
+
+        <path>/server=<server>/date=<YYYY-MM-DD>/<batch-id>.parquet
+
+    The stored records are loaded by the `load()` method which pushes
+    the selection predicates down to the partitions and row groups.
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._records = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def append(self, record):
+        """ Append one record. The records are written in batches. """
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered records. """
+        records, self._records = self._records, []
+        partitions = {}
+        for record in records:
+            record = _normalize_record(record)
+            key = (
+                get_server_name(record["serverURL"]),
+                record["timestamp"].date().isoformat(),
+            )
+            partitions.setdefault(key, []).append(record)
+        batch_id = uuid.uuid4().hex
+        for (server, date), records in partitions.items():
+            directory = os.path.join(self.path, f"server={server}", f"date={date}")
+            os.makedirs(directory, exist_ok=True)
+            pq.write_table(
+                pa.Table.from_pylist(records, schema=SCHEMA),
+                os.path.join(directory, f"{batch_id}.parquet"),
+            )
+
+    def load(self, servers=None, collections=None, descriptions=None,
+             start=None, end=None, columns=None):
+        """ Load the stored records as a pandas data-frame.
+
+        The records can be restricted to the given server URLs, collections,
+        test case descriptions and to the time range (`start` <= timestamp
+        < `end`) of the benchmark run.
+        """
+        if not os.path.isdir(self.path):
+            return SCHEMA.empty_table().to_pandas()
+
+        filters = []
+        if servers is not None:
+            filters.append(
+                ds.field("server").isin([get_server_name(url) for url in servers])
+            )
+        if collections is not None:
+            filters.append(ds.field("collection").isin(list(collections)))
+        if descriptions is not None:
+            filters.append(ds.field("description").isin(list(descriptions)))
+        if start is not None:
+            start = _parse_datetime(start)
+            filters.append(ds.field("date") >= start.date().isoformat())
+            filters.append(ds.field("timestamp") >= pa.scalar(start, TIMESTAMP))
+        if end is not None:
+            end = _parse_datetime(end)
+            filters.append(ds.field("date") <= end.date().isoformat())
+            filters.append(ds.field("timestamp") < pa.scalar(end, TIMESTAMP))
+
+        dataset = ds.dataset(
+            self.path, schema=_get_dataset_schema(), format="parquet",
+            partitioning=PARTITIONING,
+        )
+        table = dataset.to_table(
+            columns=columns, filter=_and(filters),
+        )
+        return table.to_pandas()
+
+
+def import_json_log(filename, store):
+    """ Import records from a benchmark JSON log into the result store. """
+    with open(filename, encoding="utf8") as input_file:
+        for line in input_file:
+            if line.strip():
+                store.append(json.loads(line))
+    store.flush()
+
+
+def get_server_name(url):
+    """ Get partition-safe server name from the server URL. """
+    server = urlparse(url).netloc or url
+    return re.sub(r"[^A-Za-z0-9.\-]", "_", server)
+
+
+def _get_dataset_schema():
+    return pa.schema([*SCHEMA, *PARTITIONING.schema])
+
+
+def _normalize_record(record):
+    record = {
+        name: value for name, value in record.items()
+        if name in SCHEMA.names
+    }
+    for name in TIME_FIELDS:
+        if record.get(name) is not None:
+            record[name] = _parse_datetime(record[name])
+    return record
+
+
+def _parse_datetime(value):
+    """ Parse ISO-8601 timestamp and convert it to UTC. Naive times
+    are assumed to be in UTC.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def _and(filters):
+    expression = None
+    for filter_ in filters:
+        expression = filter_ if expression is None else expression & filter_
+    return expression
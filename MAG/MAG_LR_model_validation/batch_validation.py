@@ -0,0 +1,314 @@
+#
+# batch validation and streaming residual statistics subroutines
+#
+
+import json
+import heapq
+import itertools
+import random
+import datetime
+import numpy
+from validation import (
+    get_collection_date_range, get_random_time, get_compared_model_values,
+)
+
+COMPONENTS = ("N", "E", "C")
+
+# logarithmic histogram of the absolute differences used by the percentiles
+HISTOGRAM_EDGES = numpy.logspace(-12, 6, 18 * 20 + 1) # nT, 20 bins per decade
+PERCENTILES = (50, 90, 99, 99.9)
+N_WORST = 10
+
+
+class ResidualStatistics:
+    """ Streaming statistics of the model differences of one component.
+
+    The statistics are computed in a single pass and two statistics can
+    be merged. The percentiles are approximated from a logarithmic histogram
+    of the absolute differences with 20 bins per decade and the upper bin
+    edge (limited by the maximum) is returned.
+    """
+
+    def __init__(self, n_worst=N_WORST):
+        self.n_worst = n_worst
+        self.count = 0
+        self.nan_count = 0
+        self.sum = 0.0
+        self.sum_of_squares = 0.0
+        self.max_abs = 0.0
+        self.histogram = numpy.zeros(HISTOGRAM_EDGES.size + 1, dtype="int64")
+        # min-heap of (abs. difference, timestamp, sequence, window)
+        # Note: the unique sequence number breaks the ties so that
+        #       the windows are never compared.
+        self.worst = []
+        self._sequence = itertools.count()
+
+    def update(self, timestamps, differences, window=None):
+        """ Update the statistics by an array of differences. """
+        differences = numpy.asarray(differences, dtype="float64")
+        mask = numpy.isnan(differences)
+        self.nan_count += int(mask.sum())
+        if mask.any():
+            differences = differences[~mask]
+            timestamps = numpy.asarray(timestamps)[~mask]
+        if not differences.size:
+            return
+        abs_differences = numpy.abs(differences)
+        self.count += differences.size
+        self.sum += float(differences.sum())
+        self.sum_of_squares += float(numpy.dot(differences, differences))
+        self.max_abs = max(self.max_abs, float(abs_differences.max()))
+        self.histogram += numpy.bincount(
+            numpy.searchsorted(HISTOGRAM_EDGES, abs_differences),
+            minlength=self.histogram.size,
+        )
+        n_candidates = min(self.n_worst, abs_differences.size)
+        candidates = numpy.argpartition(
+            abs_differences, abs_differences.size - n_candidates
+        )[-n_candidates:]
+        for index in candidates:
+            self._push_worst(
+                float(abs_differences[index]),
+                str(numpy.datetime64(timestamps[index], "ms")),
+                window,
+            )
+
+    def merge(self, other):
+        """ Merge other statistics into this one. """
+        self.count += other.count
+        self.nan_count += other.nan_count
+        self.sum += other.sum
+        self.sum_of_squares += other.sum_of_squares
+        self.max_abs = max(self.max_abs, other.max_abs)
+        self.histogram += other.histogram
+        for value, timestamp, _, window in other.worst:
+            self._push_worst(value, timestamp, window)
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    @property
+    def rms(self):
+        return (self.sum_of_squares / self.count) ** 0.5 if self.count else None
+
+    def percentile(self, percent):
+        """ Get approximate percentile of the absolute differences. """
+        if not self.count:
+            return None
+        index = int(numpy.searchsorted(
+            numpy.cumsum(self.histogram), percent / 100 * self.count
+        ))
+        edge = HISTOGRAM_EDGES[min(index, HISTOGRAM_EDGES.size - 1)]
+        return min(float(edge), self.max_abs)
+
+    def get_summary(self, percentiles=PERCENTILES):
+        """ Get summary of the statistics as a dictionary. """
+        return {
+            "count": self.count,
+            "nanCount": self.nan_count,
+            "maxAbs": self.max_abs,
+            "mean": self.mean,
+            "rms": self.rms,
+            **{
+                f"p{percent:g}": self.percentile(percent)
+                for percent in percentiles
+            },
+            "worst": [
+                {"absDifference": value, "timestamp": timestamp, "window": window}
+                for value, timestamp, _, window in sorted(self.worst, reverse=True)
+            ],
+        }
+
+    def to_dict(self):
+        """ Get mergeable state of the statistics as a compact dictionary. """
+        bins = numpy.flatnonzero(self.histogram)
+        return {
+            "count": self.count,
+            "nanCount": self.nan_count,
+            "sum": self.sum,
+            "sumOfSquares": self.sum_of_squares,
+            "maxAbs": self.max_abs,
+            "histogram": dict(zip(bins.tolist(), self.histogram[bins].tolist())),
+            "worst": [
+                (value, timestamp, window)
+                for value, timestamp, _, window in self.worst
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data, n_worst=N_WORST):
+        """ Restore statistics from a dictionary (see `to_dict()`). """
+        statistics = cls(n_worst=n_worst)
+        statistics.count = data["count"]
+        statistics.nan_count = data["nanCount"]
+        statistics.sum = data["sum"]
+        statistics.sum_of_squares = data["sumOfSquares"]
+        statistics.max_abs = data["maxAbs"]
+        for index, count in data["histogram"].items():
+            statistics.histogram[int(index)] = count
+        for value, timestamp, window in data["worst"]:
+            statistics._push_worst(value, timestamp, window)
+        return statistics
+
+    def _push_worst(self, value, timestamp, window):
+        item = (value, timestamp, next(self._sequence), window)
+        if len(self.worst) < self.n_worst:
+            heapq.heappush(self.worst, item)
+        elif item[0] > self.worst[0][0]:
+            heapq.heapreplace(self.worst, item)
+
+
+def run_batch_validation(tested_url, reference_url, collections, models,
+                         n_windows, window_duration=datetime.timedelta(hours=1),
+                         seed=None, summary_file=None, **options):
+    """ Compare models evaluated by the tested and reference servers
+    for `n_windows` random (seeded) time windows and collect streaming
+    statistics of the differences per model and NEC component.
+
+    Only the statistics are kept in memory. The per-window summaries
+    and mergeable statistics are appended to the optional JSON-lines
+    `summary_file` followed by the final summary of all windows so that
+    the statistics of an interrupted run can be loaded by
+    `load_statistics()`. A failed window is recorded as an error
+    and skipped.
+
+    Returns dictionary of the statistics indexed by (model, component).
+    """
+    rng = random.Random(seed)
+    date_ranges = {
+        collection: _get_common_date_range(
+            [tested_url, reference_url], collection
+        ) for collection in collections
+    }
+    statistics = {}
+    n_errors = 0
+    for index in range(n_windows):
+        collection = rng.choice(collections)
+        range_start, range_end = date_ranges[collection]
+        start_time = get_random_time(range_start, range_end - window_duration, rng=rng)
+        end_time = start_time + window_duration
+        window = f"{collection}/{start_time.isoformat()}/{end_time.isoformat()}"
+        record = {
+            "index": index,
+            "collection": collection,
+            "startTime": start_time.isoformat(),
+            "endTime": end_time.isoformat(),
+        }
+        try:
+            result = get_compared_model_values(
+                tested_url, reference_url, collection, start_time, end_time,
+                models, **options
+            )
+            window_statistics = get_residual_statistics(result, window=window)
+        except Exception as error:
+            n_errors += 1
+            print(f"{window}: {error.__class__.__name__}: {error}")
+            if summary_file:
+                write_summary_record(summary_file, {
+                    "type": "error",
+                    **record,
+                    "error": f"{error.__class__.__name__}: {error}",
+                })
+            continue
+        for key, item in window_statistics.items():
+            statistics.setdefault(key, ResidualStatistics()).merge(item)
+        if summary_file:
+            write_summary_record(summary_file, {
+                "type": "window",
+                **record,
+                "statistics": {
+                    f"{model}/{component}": item.get_summary()
+                    for (model, component), item in window_statistics.items()
+                },
+                "state": {
+                    f"{model}/{component}": item.to_dict()
+                    for (model, component), item in window_statistics.items()
+                },
+            })
+    if summary_file:
+        write_summary_record(summary_file, {
+            "type": "summary",
+            "tested_url": tested_url,
+            "reference_url": reference_url,
+            "nWindows": n_windows,
+            "nErrors": n_errors,
+            "seed": seed,
+            "statistics": {
+                f"{model}/{component}": item.get_summary()
+                for (model, component), item in statistics.items()
+            },
+        })
+    return statistics
+
+
+def get_residual_statistics(result, window=None):
+    """ Get residual statistics per model and component from the output
+    of `validation.get_compared_model_values()`.
+    """
+    statistics = {}
+    for model in result["info"]["model_names"]:
+        differences = (
+            numpy.asarray(result["tested"][model]) -
+            numpy.asarray(result["reference"][model])
+        )
+        for index, component in enumerate(COMPONENTS):
+            item = ResidualStatistics()
+            item.update(result["Timestamp"], differences[:, index], window=window)
+            statistics[(model, component)] = item
+    return statistics
+
+
+def load_statistics(summary_file):
+    """ Load and merge the statistics of all successfully processed windows
+    from a JSON-lines summary file, including the windows of interrupted
+    runs.
+    """
+    statistics = {}
+    with open(summary_file, encoding="utf8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # incomplete last record of an interrupted run
+                continue
+            if record.get("type") != "window":
+                continue
+            for key, data in record["state"].items():
+                model, _, component = key.rpartition("/")
+                statistics.setdefault(
+                    (model, component), ResidualStatistics()
+                ).merge(ResidualStatistics.from_dict(data))
+    return statistics
+
+
+def print_statistics(statistics):
+    """ Print summary of the residual statistics. """
+    for (model, component), item in statistics.items():
+        summary = item.get_summary()
+        if not summary["count"]:
+            print(f"{model} {component}: no data")
+            continue
+        print(
+            f"{model} {component}: n={summary['count']} "
+            f"max={summary['maxAbs']:.3g}nT rms={summary['rms']:.3g}nT "
+            + " ".join(
+                f"p{percent:g}<={summary[f'p{percent:g}']:.3g}nT"
+                for percent in PERCENTILES
+            )
+        )
+
+
+def write_summary_record(filename, record):
+    """ Append one record to the JSON-lines summary file. """
+    with open(filename, "a", encoding="utf8") as file:
+        file.write(json.dumps(record) + "\n")
+
+
+def _get_common_date_range(urls, collection):
+    date_ranges = [get_collection_date_range(url, collection) for url in urls]
+    return (
+        max(start for start, _ in date_ranges),
+        min(end for _, end in date_ranges),
+    )
@@ -0,0 +1,258 @@
+#
+# local cache of the VirES data responses
+#
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import datetime
+import threading
+from os.path import join, exists
+import numpy
+import xarray
+from viresclient._data_handling import FileReader
+
+CACHE_PATH = "./data/cache/vires"
+MAX_SIZE = 2 * 1024**3 # bytes
+
+TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+RE_ENTRY = re.compile(r"^(\d{8}T\d{12})_(\d{8}T\d{12})\.cdf$")
+
+
+class DataCache:
+    """ Local content-addressed cache of the VirES data responses.
+
+    The responses are stored as CDF files
+
+        <path>/<request-hash>/<start>_<end>.cdf
+
+    where the request hash is calculated from the request parameters
+    (server URL, collection, variables, filters, sampling step, ...) and
+    the file name records the time window of the response.
+
+    A requested time window is assembled from the cached responses
+    overlapping it and only the missing parts are fetched from the server.
+    The least recently used responses are removed when the total size
+    of the cache exceeds `max_size`.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_size=MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_data(self, request, start_time, end_time, fetch, data_file=None):
+        """ Get data for the given request parameters and time window
+        as an xarray dataset.
+
+        The `fetch(start_time, end_time, filename)` callback downloads
+        the data of the given time window from the server to a CDF file.
+
+        If `data_file` is given, a CDF file containing exactly the requested
+        time window is copied to it. In this case only a cached response of
+        the same time window is reused.
+
+        The least recently used responses are evicted only after the dataset
+        is assembled.
+        """
+        start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+
+        if data_file:
+            filename = self._get_data_file(request, start_time, end_time, fetch)
+            shutil.copyfile(filename, data_file)
+            dataset = load_dataset(filename)
+            self._evict(keep={filename})
+            return dataset
+
+        directory = join(self.path, get_request_hash(request))
+        pieces = []
+        cursor = start_time
+        for entry_start, entry_end, filename in self._list_entries(directory):
+            if entry_end <= cursor or entry_start >= end_time:
+                continue
+            if entry_start > cursor:
+                pieces.append((cursor, entry_start, self._fetch(
+                    fetch, cursor, entry_start,
+                    join(directory, _get_entry_name(cursor, entry_start)),
+                )))
+                cursor = entry_start
+            self._touch(filename)
+            pieces.append((cursor, min(entry_end, end_time), filename))
+            cursor = min(entry_end, end_time)
+            if cursor >= end_time:
+                break
+        if cursor < end_time:
+            pieces.append((cursor, end_time, self._fetch(
+                fetch, cursor, end_time,
+                join(directory, _get_entry_name(cursor, end_time)),
+            )))
+
+        dataset = concatenate_datasets([
+            _slice_dataset(load_dataset(filename), start, end)
+            for start, end, filename in pieces
+        ])
+        self._evict(keep={filename for _, _, filename in pieces})
+        return dataset
+
+    def get_data_file(self, request, start_time, end_time, fetch):
+        """ Get path of the cached CDF file containing exactly the requested
+        time window. Only a cached response of the same time window is reused.
+        See `get_data()` for the `fetch` callback.
+        """
+        start_time, end_time = _to_utc(start_time), _to_utc(end_time)
+        filename = self._get_data_file(request, start_time, end_time, fetch)
+        self._evict(keep={filename})
+        return filename
+
+    def get_statistics(self):
+        """ Get the cache statistics. """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": sum(size for _, size, _ in self._iter_files()),
+        }
+
+    def clear(self):
+        """ Remove all cached responses. """
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+
+    def _get_data_file(self, request, start_time, end_time, fetch):
+        filename = join(
+            self.path, get_request_hash(request),
+            _get_entry_name(start_time, end_time),
+        )
+        if exists(filename):
+            self._touch(filename)
+        else:
+            self._fetch(fetch, start_time, end_time, filename)
+        return filename
+
+    def _fetch(self, fetch, start_time, end_time, filename):
+        with self._lock:
+            self.misses += 1
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # Note: the temporary file name must keep the .cdf extension
+        tmp_filename = join(
+            os.path.dirname(filename), f".{os.getpid()}_{threading.get_ident()}.cdf"
+        )
+        try:
+            fetch(start_time, end_time, tmp_filename)
+            os.replace(tmp_filename, filename)
+        finally:
+            if exists(tmp_filename):
+                os.remove(tmp_filename)
+        return filename
+
+    def _touch(self, filename):
+        with self._lock:
+            self.hits += 1
+        os.utime(filename)
+
+    def _evict(self, keep=()):
+        """ Remove the least recently used responses exceeding the maximum
+        cache size except for the files to be kept.
+        """
+        files = sorted(self._iter_files(), key=lambda item: item[2])
+        total_size = sum(size for _, size, _ in files)
+        for filename, size, _ in files:
+            if total_size <= self.max_size:
+                break
+            if filename in keep:
+                continue
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def _iter_files(self):
+        if not os.path.isdir(self.path):
+            return
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if RE_ENTRY.match(filename):
+                    path = join(directory, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def _list_entries(directory):
+        if not os.path.isdir(directory):
+            return []
+        entries = []
+        for filename in os.listdir(directory):
+            match = RE_ENTRY.match(filename)
+            if match:
+                start, end = (
+                    datetime.datetime.strptime(value, TIME_FORMAT)
+                    for value in match.groups()
+                )
+                entries.append((start, end, join(directory, filename)))
+        return sorted(entries)
+
+
+def get_request_hash(request):
+    """ Get hash of the request parameters (a JSON serializable dictionary).
+    """
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, default=str).encode("utf8")
+    ).hexdigest()
+
+
+def load_dataset(filename):
+    """ Load VirES CDF file as an xarray dataset. """
+    with FileReader(filename) as reader:
+        dataset = reader.as_xarray_dataset()
+        dataset.attrs["Sources"] = reader.sources
+        dataset.attrs["MagneticModels"] = reader.magnetic_models
+        dataset.attrs["AppliedFilters"] = reader.data_filters
+    return dataset
+
+
+def _slice_dataset(dataset, start_time, end_time):
+    times = dataset["Timestamp"].values
+    mask = (
+        (times >= numpy.datetime64(start_time)) &
+        (times < numpy.datetime64(end_time))
+    )
+    if mask.all():
+        return dataset
+    return dataset.isel(Timestamp=mask)
+
+
+def concatenate_datasets(datasets):
+    """ Concatenate VirES xarray datasets along the Timestamp dimension
+    and merge their Sources, MagneticModels and AppliedFilters attributes.
+    """
+    if len(datasets) == 1:
+        return datasets[0]
+    attrs = {}
+    for dataset in datasets:
+        for key, values in dataset.attrs.items():
+            merged = attrs.setdefault(key, [])
+            merged.extend(value for value in values if value not in merged)
+    datasets = [
+        dataset for dataset in datasets if dataset["Timestamp"].size
+    ] or datasets[:1]
+    dataset = xarray.concat(datasets, dim="Timestamp", combine_attrs="drop")
+    dataset.attrs.update(attrs)
+    return dataset
+
+
+def _get_entry_name(start_time, end_time):
+    return f"{start_time:{TIME_FORMAT}}_{end_time:{TIME_FORMAT}}.cdf"
+
+
+def _to_utc(time):
+    """ Convert datetime to naive UTC datetime. """
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time
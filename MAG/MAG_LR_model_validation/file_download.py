@@ -0,0 +1,291 @@
+#
+# resumable file download and ZIP extraction subroutines
+#
+
+import os
+import zlib
+import struct
+import hashlib
+from os.path import exists, getsize, basename, dirname, join
+from contextlib import contextmanager
+from shutil import copyfileobj
+from ftplib import FTP, error_perm
+from urllib.parse import urlparse, unquote
+from urllib.request import urlopen, url2pathname, Request
+from zipfile import ZipFile, BadZipFile
+
+CHUNK_SIZE = 1024 * 1024 # bytes
+PARTIAL_FILE_EXTENSION = ".part"
+
+# ZIP local file header
+ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+ZIP_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+ZIP_FLAG_ENCRYPTED = 0x0001
+ZIP_FLAG_DATA_DESCRIPTOR = 0x0008
+ZIP_FLAG_UTF8 = 0x0800
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP64_SIZE = 0xFFFFFFFF
+
+
+class UnsupportedZipStream(Exception):
+    """ ZIP archive cannot be extracted from a sequential stream. """
+
+
+def download_file(source, destination, checksum=None):
+    """ Download file from a URL (supports HTTP, FTP and local files).
+
+    The file is downloaded to a temporary partial file which is renamed
+    to the destination only after the size and the optional SHA-256
+    `checksum` are verified. An interrupted download is resumed from
+    the partial file if the server supports it (HTTP range requests,
+    FTP REST command and local files).
+    """
+    partial_file = destination + PARTIAL_FILE_EXTENSION
+    offset = getsize(partial_file) if exists(partial_file) else 0
+    with _open_url(source, offset) as (response, offset, size):
+        with open(partial_file, "r+b" if offset else "wb") as file:
+            file.seek(offset)
+            file.truncate()
+            copyfileobj(response, file, CHUNK_SIZE)
+    _verify_file(partial_file, size=size, checksum=checksum)
+    os.replace(partial_file, destination)
+    print(f"downloaded {source} --> {destination}")
+
+
+def download_zipped_file(source, destination, checksum=None):
+    """ Download a ZIP archive from a URL and extract the member matching
+    the destination file name.
+
+    Local archives are read directly. Remote archives are extracted while
+    they are streamed and the streamed data are also written to a partial
+    archive file. If the archive cannot be extracted from the stream or if
+    the download is interrupted, the partial archive file is kept and
+    the next call resumes the archive download (see `download_file()`)
+    and extracts the downloaded archive.
+    The extracted file is renamed to the destination only after the optional
+    SHA-256 `checksum` is verified.
+    """
+    member = basename(destination)
+    partial_file = destination + PARTIAL_FILE_EXTENSION
+    local_path = _get_local_path(source)
+    zip_file = join(dirname(destination), basename(urlparse(source).path))
+    partial_zip_file = zip_file + PARTIAL_FILE_EXTENSION
+    try:
+        if local_path:
+            unzip_file(local_path, partial_file, member)
+        elif exists(partial_zip_file):
+            _download_and_unzip(source, zip_file, partial_file, member)
+        else:
+            try:
+                with _open_url(source) as (response, _, _):
+                    with open(partial_zip_file, "wb") as zip_output:
+                        with open(partial_file, "wb") as file:
+                            extract_zip_stream(
+                                _TeeStream(response, zip_output), member, file
+                            )
+                os.remove(partial_zip_file)
+            except UnsupportedZipStream:
+                _download_and_unzip(source, zip_file, partial_file, member)
+        _verify_file(partial_file, checksum=checksum)
+    except (KeyError, BadZipFile):
+        # invalid archive, nothing to be resumed
+        for path in (partial_zip_file, zip_file, partial_file):
+            if exists(path):
+                os.remove(path)
+        raise
+    except BaseException:
+        if exists(partial_file):
+            os.remove(partial_file)
+        raise
+    os.replace(partial_file, destination)
+    print(f"extracted {source} --> {destination}")
+
+
+def _download_and_unzip(source, zip_file, destination, member):
+    download_file(source, zip_file)
+    unzip_file(zip_file, destination, member)
+    os.remove(zip_file)
+
+
+def unzip_file(source, destination, member=None):
+    """ Extract file from a Zip archive. By default, the extracted member
+    is matched by the destination file name.
+    """
+    member = member or basename(destination)
+    with ZipFile(source) as zip_:
+        for zipped_file in zip_.namelist():
+            if basename(zipped_file) == member:
+                break
+        else:
+            raise KeyError(f"{member} not found in {source}!")
+        with zip_.open(zipped_file) as file_in:
+            with open(destination, "wb") as file_out:
+                copyfileobj(file_in, file_out, CHUNK_SIZE)
+
+
+def extract_zip_stream(stream, member, output):
+    """ Extract member of a ZIP archive read sequentially from a stream.
+
+    Only the local file headers are parsed and the archive is not seekable.
+    UnsupportedZipStream is raised for entries whose size is not known
+    from the local header (data descriptors, ZIP64) and for encrypted
+    or unsupported compression methods.
+    """
+    while True:
+        (
+            signature, _, flags, method, _, _, crc, compressed_size, size,
+            name_size, extra_size,
+        ) = ZIP_LOCAL_HEADER.unpack(_read(stream, ZIP_LOCAL_HEADER.size))
+        if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+            # end of the local entries
+            raise KeyError(f"{member} not found in the ZIP archive!")
+        name = _read(stream, name_size).decode(
+            "utf8" if flags & ZIP_FLAG_UTF8 else "cp437"
+        )
+        _read(stream, extra_size)
+        if flags & (ZIP_FLAG_ENCRYPTED | ZIP_FLAG_DATA_DESCRIPTOR) or (
+            ZIP64_SIZE in (compressed_size, size)
+        ):
+            raise UnsupportedZipStream(f"Unsupported ZIP entry {name}!")
+        if basename(name) != member:
+            _skip(stream, compressed_size)
+            continue
+        if method == ZIP_STORED:
+            decompress, flush = (lambda data: data), (lambda: b"")
+        elif method == ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            decompress, flush = decompressor.decompress, decompressor.flush
+        else:
+            raise UnsupportedZipStream(f"Unsupported ZIP compression {method}!")
+
+        actual_crc, actual_size = 0, 0
+        remaining = compressed_size
+        while remaining > 0:
+            chunk = _read(stream, min(CHUNK_SIZE, remaining))
+            remaining -= len(chunk)
+            for data in (decompress(chunk), flush() if remaining == 0 else b""):
+                actual_crc = zlib.crc32(data, actual_crc)
+                actual_size += len(data)
+                output.write(data)
+        if (actual_crc, actual_size) != (crc, size):
+            raise BadZipFile(f"Corrupted ZIP entry {name}!")
+        return
+
+
+def get_sha256(path):
+    """ Get SHA-256 hex-digest of a file. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verify_file(path, size=None, checksum=None):
+    if size is not None and getsize(path) != size:
+        raise IOError(
+            f"Incomplete file {path}! ({getsize(path)} of {size} bytes)"
+        )
+    if checksum and get_sha256(path) != checksum.lower():
+        os.remove(path)
+        raise IOError(f"Checksum mismatch of {path}!")
+
+
+@contextmanager
+def _open_url(url, offset=0):
+    """ Open URL for reading from the given offset. Yields the response,
+    the actual offset (0 if the resume is not supported) and the total size
+    (None if not known).
+    """
+    local_path = _get_local_path(url)
+    if local_path:
+        with open(local_path, "rb") as file:
+            file.seek(offset)
+            yield file, offset, os.fstat(file.fileno()).st_size
+        return
+
+    if urlparse(url).scheme == "ftp":
+        with _open_ftp_url(url, offset) as result:
+            yield result
+        return
+
+    headers = {}
+    if offset and urlparse(url).scheme in ("http", "https"):
+        headers["Range"] = f"bytes={offset}-"
+    with urlopen(Request(url, headers=headers)) as response:
+        if getattr(response, "status", None) != 206:
+            offset = 0
+        length = response.headers.get("Content-Length")
+        yield response, offset, (offset + int(length) if length else None)
+
+
+@contextmanager
+def _open_ftp_url(url, offset=0):
+    """ Open FTP URL for reading from the given offset (FTP REST command).
+    Yields the same values as `_open_url()`.
+    """
+    parsed = urlparse(url)
+    path = unquote(parsed.path)
+    ftp = FTP()
+    try:
+        ftp.connect(parsed.hostname, parsed.port or 0)
+        ftp.login(
+            unquote(parsed.username or "anonymous"),
+            unquote(parsed.password or ""),
+        )
+        ftp.voidcmd("TYPE I")
+        try:
+            size = ftp.size(path)
+        except error_perm:
+            size = None
+        try:
+            connection = ftp.transfercmd(f"RETR {path}", rest=(offset or None))
+        except error_perm:
+            if not offset:
+                raise
+            # REST command not supported
+            offset = 0
+            connection = ftp.transfercmd(f"RETR {path}")
+        with connection, connection.makefile("rb") as response:
+            yield response, offset, size
+        ftp.voidresp()
+    finally:
+        ftp.close()
+
+
+class _TeeStream:
+    """ Readable stream writing the read data to an output file. """
+
+    def __init__(self, stream, output):
+        self.stream = stream
+        self.output = output
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.output.write(data)
+        return data
+
+
+def _get_local_path(url):
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return url2pathname(parsed.path)
+    if not parsed.scheme:
+        return url
+    return None
+
+
+def _read(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise IOError("Unexpected end of the stream!")
+        data += chunk
+    return data
+
+
+def _skip(stream, size):
+    while size > 0:
+        size -= len(_read(stream, min(CHUNK_SIZE, size)))
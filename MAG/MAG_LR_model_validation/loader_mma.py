@@ -2,8 +2,16 @@
 # MMA model loader
 #
 
+import os
+import re
+import json
+import datetime
+import shutil
+import hashlib
+import tempfile
+import threading
 from spacepy import pycdf
-from numpy import array_equal, concatenate
+from numpy import array_equal, empty, searchsorted, ndarray, save, load
 from eoxmagmod.magnetic_model.parser_mma import (
     read_swarm_mma_2c_internal, read_swarm_mma_2c_external,
     read_swarm_mma_2f_geo_internal, read_swarm_mma_2f_geo_external,
@@ -22,124 +30,196 @@ from eoxmagmod.magnetic_model.coefficients import (
 MMA2C_NGP_LATITUDE = 90 - 9.92   # deg.
 MMA2C_NGP_LONGITUDE = 287.78 - 360.0  # deg.
 
+# Location of the on-disk cache of the parsed coefficients.
+# Set to None to disable the on-disk caching.
+CACHE_PATH = "./data/cache/mma"
+CACHE_INDEX = "index.json"
+
+# validity period in the Swarm product file name
+RE_PRODUCT_VALIDITY = re.compile(r"_(\d{8}T\d{6})_(\d{8}T\d{6})_\d{4}(?:\.|$)")
+MJD2000_EPOCH = datetime.datetime(2000, 1, 1)
+
+# Readers of the coefficient sets of the MMA products. All sets of a product
+# file are parsed in one pass and cached together.
+MMA_2C_READERS = {
+    "internal": read_swarm_mma_2c_internal,
+    "external": read_swarm_mma_2c_external,
+}
+MMA_2F_READERS = {
+    "geo_internal": read_swarm_mma_2f_geo_internal,
+    "geo_external": read_swarm_mma_2f_geo_external,
+    "sm_internal": read_swarm_mma_2f_sm_internal,
+    "sm_external": read_swarm_mma_2f_sm_external,
+}
+
+# in-process cache of the parsed coefficients
+_DATA_CACHE = {}
+_COVERAGE_CACHE = {}
+_DATA_CACHE_LOCK = threading.Lock()
+
 
 def load_model_swarm_mma_2c_internal(*paths, lat_ngp=MMA2C_NGP_LATITUDE,
-                                     lon_ngp=MMA2C_NGP_LONGITUDE):
+                                     lon_ngp=MMA2C_NGP_LONGITUDE,
+                                     time_range=None):
     """ Load internal (secondary field) model from a Swarm MMA_SHA_2C product.
+    The optional `time_range` restricts the loaded coefficients
+    (see `load_coeff_swarm_mma_2c_internal()`).
     """
     return DipoleSphericalHarmomicGeomagneticModel(
-        load_coeff_swarm_mma_2c_internal(*paths),
+        load_coeff_swarm_mma_2c_internal(*paths, time_range=time_range),
         north_pole=(lat_ngp, lon_ngp),
     )
 
 
 def load_model_swarm_mma_2c_external(*paths, lat_ngp=MMA2C_NGP_LATITUDE,
-                                     lon_ngp=MMA2C_NGP_LONGITUDE):
+                                     lon_ngp=MMA2C_NGP_LONGITUDE,
+                                     time_range=None):
     """ Load external (primary field) model from a Swarm MMA_SHA_2C product.
+    The optional `time_range` restricts the loaded coefficients
+    (see `load_coeff_swarm_mma_2c_internal()`).
     """
     return DipoleSphericalHarmomicGeomagneticModel(
-        load_coeff_swarm_mma_2c_external(*paths),
+        load_coeff_swarm_mma_2c_external(*paths, time_range=time_range),
         north_pole=(lat_ngp, lon_ngp),
     )
 
 
-def load_model_swarm_mma_2f_geo_internal(*paths):
+def load_model_swarm_mma_2f_geo_internal(*paths, time_range=None):
     """ Load geographic frame internal (secondary field) model from a Swarm
     MMA_SHA_2F product.
     """
     return SphericalHarmomicGeomagneticModel(
-        load_coeff_swarm_mma_2f_geo_internal(*paths)
+        load_coeff_swarm_mma_2f_geo_internal(*paths, time_range=time_range)
     )
 
 
-def load_model_swarm_mma_2f_geo_external(*paths):
+def load_model_swarm_mma_2f_geo_external(*paths, time_range=None):
     """ Load geographic frame internal (primary field) model from a Swarm
     MMA_SHA_2F product.
     """
     return SphericalHarmomicGeomagneticModel(
-        load_coeff_swarm_mma_2f_geo_external(*paths)
+        load_coeff_swarm_mma_2f_geo_external(*paths, time_range=time_range)
     )
 
 
-def load_model_swarm_mma_2f_sm_internal(*paths):
+def load_model_swarm_mma_2f_sm_internal(*paths, time_range=None):
     """ Load solar magnetic frame internal (secondary field) model from a Swarm
     MMA_SHA_2F product.
     """
     # FIXME: solar-magnetic frame model
     return SphericalHarmomicGeomagneticModel(
-        load_coeff_swarm_mma_2f_sm_internal(*paths),
+        load_coeff_swarm_mma_2f_sm_internal(*paths, time_range=time_range),
     )
 
 
-def load_model_swarm_mma_2f_sm_external(*paths):
+def load_model_swarm_mma_2f_sm_external(*paths, time_range=None):
     """ Load solar magnetic frame internal (primary field) model from a Swarm
     MMA_SHA_2F product.
     """
     # FIXME: solar-magnetic frame model
     return SphericalHarmomicGeomagneticModel(
-        load_coeff_swarm_mma_2f_sm_external(*paths)
+        load_coeff_swarm_mma_2f_sm_external(*paths, time_range=time_range)
     )
 
 
 
-def load_coeff_swarm_mma_2c_internal(*paths):
+def load_coeff_swarm_mma_2c_internal(*paths, time_range=None):
     """ Load internal model coefficients from one or more Swarm MMA_SHA_2C product files.
     Note the models are loaded and merged in the order of the arguments.
+
+    The optional `time_range` is a (start, end) pair of MJD2000 times.
+    If provided, only the files and coefficients needed to evaluate
+    the model within the time range are loaded.
     """
     return _load_coeff_mma_multi_set(
-        paths, read_swarm_mma_2c_internal, "gh", is_internal=True
+        paths, MMA_2C_READERS, "internal", "gh", is_internal=True,
+        time_range=time_range,
     )
 
 
-def load_coeff_swarm_mma_2c_external(*paths):
+def load_coeff_swarm_mma_2c_external(*paths, time_range=None):
     """ Load internal model coefficients from one or more Swarm MMA_SHA_2C product files.
     Note the models are loaded and merged in the order of the arguments.
+    See `load_coeff_swarm_mma_2c_internal()` for the optional `time_range`.
     """
     return _load_coeff_mma_multi_set(
-        paths, read_swarm_mma_2c_external, "qs", is_internal=False
+        paths, MMA_2C_READERS, "external", "qs", is_internal=False,
+        time_range=time_range,
     )
 
 
-def load_coeff_swarm_mma_2f_geo_internal(*paths):
+def load_coeff_swarm_mma_2f_geo_internal(*paths, time_range=None):
     """ Load internal geographic frame model coefficients from a Swarm
     MMA_SHA_2F product file.
     """
     return _load_coeff_mma_single_set(
-        paths, read_swarm_mma_2f_geo_internal, "gh", is_internal=True
+        paths, MMA_2F_READERS, "geo_internal", "gh", is_internal=True,
+        time_range=time_range,
     )
 
 
-def load_coeff_swarm_mma_2f_geo_external(*paths):
+def load_coeff_swarm_mma_2f_geo_external(*paths, time_range=None):
     """ Load external geographic frame model coefficients from a Swarm
     MMA_SHA_2F product file.
     """
     return _load_coeff_mma_single_set(
-        paths, read_swarm_mma_2f_geo_external, "qs", is_internal=False
+        paths, MMA_2F_READERS, "geo_external", "qs", is_internal=False,
+        time_range=time_range,
     )
 
 
-def load_coeff_swarm_mma_2f_sm_internal(*paths):
+def load_coeff_swarm_mma_2f_sm_internal(*paths, time_range=None):
     """ Load internal solar magnetic frame model coefficients from a Swarm
     MMA_SHA_2F product file.
     """
     return _load_coeff_mma_single_set(
-        paths, read_swarm_mma_2f_sm_internal, "gh", is_internal=True
+        paths, MMA_2F_READERS, "sm_internal", "gh", is_internal=True,
+        time_range=time_range,
     )
 
 
-def load_coeff_swarm_mma_2f_sm_external(*paths):
+def load_coeff_swarm_mma_2f_sm_external(*paths, time_range=None):
     """ Load external solar magnetic frame model coefficients from a Swarm
     MMA_SHA_2F product file.
     """
     return _load_coeff_mma_single_set(
-        paths, read_swarm_mma_2f_sm_external, "qs", is_internal=False
+        paths, MMA_2F_READERS, "sm_external", "qs", is_internal=False,
+        time_range=time_range,
     )
 
 
-def _load_coeff_mma_multi_set(paths, cdf_reader, variable, is_internal):
-    data = [_read_data(path, cdf_reader) for path in paths]
+def get_time_coverage(path, readers, part):
+    """ Get (start, end) MJD2000 time coverage of a coefficient set (`part`
+    of the `readers`, e.g., MMA_2C_READERS) of an MMA product file.
+    The time coverage is parsed from the Swarm product file name, if possible,
+    or extracted from the (cached) parsed coefficients.
+    """
+    key = (*_get_cache_key(path, readers), part)
+    with _DATA_CACHE_LOCK:
+        coverage = _COVERAGE_CACHE.get(key)
+    if coverage is None:
+        coverage = _parse_time_coverage(path)
+        if coverage is None:
+            data = _read_data(path, readers)[part]
+            sets = [
+                set_ for set_ in ([data] if isinstance(data, dict) else data)
+                if set_["t"].size
+            ]
+            coverage = (
+                min(float(set_["t"][0]) for set_ in sets),
+                max(float(set_["t"][-1]) for set_ in sets),
+            )
+        with _DATA_CACHE_LOCK:
+            _COVERAGE_CACHE[key] = coverage
+    return coverage
+
+
+def _load_coeff_mma_multi_set(paths, readers, part, variable, is_internal,
+                              time_range=None):
+    paths = _select_files(paths, readers, part, time_range)
+    data = [_read_data(path, readers)[part] for path in paths]
     data = [
-        _merge_coefficients(*items, variable=variable)
+        _merge_coefficients(*items, variable=variable, time_range=time_range)
         for items in zip(*data)
     ]
     return CombinedSHCoefficients(*[
@@ -149,28 +229,234 @@ def _load_coeff_mma_multi_set(paths, cdf_reader, variable, is_internal):
     ])
 
 
-def _load_coeff_mma_single_set(paths, cdf_reader, variable, is_internal):
-    data = [_read_data(path, cdf_reader) for path in paths]
-    _merge_coefficients(*data, variable=variable)
+def _load_coeff_mma_single_set(paths, readers, part, variable, is_internal,
+                               time_range=None):
+    paths = _select_files(paths, readers, part, time_range)
+    data = [_read_data(path, readers)[part] for path in paths]
+    data = _merge_coefficients(*data, variable=variable, time_range=time_range)
     return SparseSHCoefficientsTimeDependent(
         data["nm"], data[variable], data["t"], is_internal=is_internal
     )
 
 
-def _read_data(path, cdf_reader):
-    with pycdf.CDF(path) as cdf:
-        return cdf_reader(cdf)
-
-
-def _merge_coefficients(*sets, variable):
+def _merge_coefficients(*sets, variable, time_range=None):
+    """ Merge sets of coefficients, optionally restricted to the time range.
+    The merged arrays are allocated once and filled from the sliced sets.
+    """
     head, *tail = sets
     for tail_set in tail:
         if not array_equal(head["nm"], tail_set["nm"]):
             raise ValueError("Incompatible sets of coefficients!")
+
+    slices = [_get_time_slice(set_["t"], time_range) for set_ in sets]
+    size = sum(slice_.stop - slice_.start for slice_ in slices)
+    times = empty(size, dtype=head["t"].dtype)
+    coefficients = empty(
+        (head[variable].shape[0], size), dtype=head[variable].dtype
+    )
+    offset = 0
+    for set_, slice_ in zip(sets, slices):
+        next_offset = offset + slice_.stop - slice_.start
+        times[offset:next_offset] = set_["t"][slice_]
+        coefficients[:, offset:next_offset] = set_[variable][:, slice_]
+        offset = next_offset
+
     return {
         "degree_min": head["degree_min"],
         "degree_max": head["degree_max"],
         "nm": head["nm"],
-        "t": concatenate([set_["t"] for set_ in sets], axis=0),
-        variable: concatenate([set_[variable] for set_ in sets], axis=1),
-    }
\ No newline at end of file
+        "t": times,
+        variable: coefficients,
+    }
+
+
+def _get_time_slice(times, time_range):
+    """ Get slice of the time nodes covering the time range including
+    the nodes just before the start and after the end needed for
+    the interpolation.
+    """
+    if time_range is None:
+        return slice(0, times.size)
+    start, end = time_range
+    first = max(0, searchsorted(times, start, "right") - 1)
+    last = min(times.size, searchsorted(times, end, "left") + 1)
+    return slice(first, max(first, last))
+
+
+def _select_files(paths, readers, part, time_range):
+    """ Select files needed to evaluate the model within the time range
+    preserving the order of the paths. In addition to the files overlapping
+    the time range, the neighbouring files before and after them are
+    selected to bridge possible gaps between the files.
+
+    Note that the nominal validity of a file may start before its first
+    and end after its last coefficient node. Therefore, the neighbouring
+    files are selected even if the time range is fully covered by the
+    nominal validity of the overlapping files.
+    """
+    if time_range is None or not paths:
+        return paths
+    start, end = time_range
+    coverage = [get_time_coverage(path, readers, part) for path in paths]
+    order = sorted(range(len(paths)), key=lambda index: coverage[index])
+    first = max([
+        position for position, index in enumerate(order)
+        if coverage[index][0] <= start
+    ], default=0)
+    last = min([
+        position for position, index in enumerate(order)
+        if coverage[index][1] >= end
+    ], default=len(order) - 1)
+    first, last = max(first - 1, 0), min(max(first, last) + 1, len(order) - 1)
+    selected = set(order[first:last + 1])
+    return [path for index, path in enumerate(paths) if index in selected]
+
+
+def _parse_time_coverage(path):
+    match = RE_PRODUCT_VALIDITY.search(os.path.basename(path))
+    if not match:
+        return None
+    return tuple(
+        (datetime.datetime.strptime(value, "%Y%m%dT%H%M%S") - MJD2000_EPOCH)
+        / datetime.timedelta(days=1) for value in match.groups()
+    )
+
+
+def clear_cache(on_disk=False):
+    """ Clear the in-process cache of the parsed coefficients and optionally
+    also the on-disk cache.
+    """
+    with _DATA_CACHE_LOCK:
+        _DATA_CACHE.clear()
+        _COVERAGE_CACHE.clear()
+    if on_disk and CACHE_PATH and os.path.isdir(CACHE_PATH):
+        shutil.rmtree(CACHE_PATH)
+
+
+def _read_data(path, readers):
+    """ Read parsed coefficients of all sets of the product file as
+    a dictionary indexed by the `readers` keys. The file is opened and parsed
+    only once and the parsed coefficients are cached in-process and on-disk
+    as memory-mapped .npy files. The cache key includes the source file path,
+    size and modification time so that a modified source file is parsed again.
+    """
+    key = _get_cache_key(path, readers)
+    with _DATA_CACHE_LOCK:
+        data = _DATA_CACHE.get(key)
+    if data is None:
+        data = _read_cached_data(key, path, readers)
+        with _DATA_CACHE_LOCK:
+            data = _DATA_CACHE.setdefault(key, data)
+    return data
+
+
+def _read_cached_data(key, path, readers):
+    if not CACHE_PATH:
+        return _read_cdf_data(path, readers)
+    cache_dir = os.path.join(
+        CACHE_PATH, hashlib.sha1(json.dumps(key).encode("utf8")).hexdigest()
+    )
+    try:
+        return _load_cached_data(cache_dir)
+    except (OSError, ValueError, KeyError):
+        pass
+    data = _read_cdf_data(path, readers)
+    _save_cached_data(cache_dir, key, data)
+    return data
+
+
+def _read_cdf_data(path, readers):
+    with pycdf.CDF(path) as cdf:
+        return {part: cdf_reader(cdf) for part, cdf_reader in readers.items()}
+
+
+def _get_cache_key(path, readers):
+    stat = os.stat(path)
+    return (
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+        *(
+            f"{part}:{cdf_reader.__module__}.{cdf_reader.__qualname__}"
+            for part, cdf_reader in sorted(readers.items())
+        ),
+    )
+
+
+def _load_cached_data(cache_dir):
+    """ Load the parsed coefficients from the on-disk cache. """
+    with open(os.path.join(cache_dir, CACHE_INDEX), encoding="utf8") as file:
+        index = json.load(file)
+
+    def _load_set(prefix, item):
+        return {
+            **item["values"],
+            **{
+                name: load(
+                    os.path.join(cache_dir, f"{prefix}_{name}.npy"),
+                    mmap_mode="r",
+                )
+                for name in item["arrays"]
+            },
+        }
+
+    def _load_part(part, part_index):
+        sets = [
+            _load_set(f"{part}_{set_index}", item)
+            for set_index, item in enumerate(part_index["sets"])
+        ]
+        return sets[0] if part_index["single"] else tuple(sets)
+
+    return {
+        part: _load_part(part, part_index)
+        for part, part_index in index["parts"].items()
+    }
+
+
+def _save_cached_data(cache_dir, key, data):
+    """ Save the parsed coefficients to the on-disk cache. The cache entry
+    is written to a temporary directory and moved to its final location
+    to prevent concurrent readers from seeing an incomplete entry.
+    """
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=CACHE_PATH, prefix=".tmp_")
+
+    def _save_set(prefix, item):
+        arrays = {
+            name: value for name, value in item.items()
+            if isinstance(value, ndarray)
+        }
+        for name, value in arrays.items():
+            save(os.path.join(tmp_dir, f"{prefix}_{name}.npy"), value)
+        return {
+            "arrays": list(arrays),
+            "values": {
+                name: getattr(value, "item", lambda: value)()
+                for name, value in item.items() if name not in arrays
+            },
+        }
+
+    def _save_part(part, part_data):
+        single = isinstance(part_data, dict)
+        sets = [part_data] if single else list(part_data)
+        return {
+            "single": single,
+            "sets": [
+                _save_set(f"{part}_{set_index}", item)
+                for set_index, item in enumerate(sets)
+            ],
+        }
+
+    try:
+        index = {
+            "key": key,
+            "parts": {
+                part: _save_part(part, part_data)
+                for part, part_data in data.items()
+            },
+        }
+        with open(os.path.join(tmp_dir, CACHE_INDEX), "w", encoding="utf8") as file:
+            json.dump(index, file)
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # The cache is optional and the entry may have been already written
+        # by another process.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
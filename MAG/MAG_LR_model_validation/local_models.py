@@ -2,16 +2,25 @@
 # Local model execution subroutines
 #
 
+import os
 import re
+import sys
 import time
 import datetime
-from os.path import join, exists, basename
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+from numpy.lib.format import open_memmap
+from os.path import join, exists
 from os import remove
-from zipfile import ZipFile
 from urllib.parse import urljoin
-from urllib.request import urlopen
-from shutil import copyfileobj
-from numpy import datetime64, stack, zeros, asarray
+from numpy import (
+    stack, zeros, empty, asarray, ndarray, prod, dtype as dtype_,
+)
 from eoxmagmod.data import (
     CHAOS7_STATIC,
     IGRF13,
@@ -23,95 +32,189 @@ from eoxmagmod import (
     load_model_swarm_mio_internal,
     load_model_swarm_mio_external,
 )
+from eoxmagmod.magnetic_model.model import (
+    SphericalHarmomicGeomagneticModel,
+    DipoleSphericalHarmomicGeomagneticModel,
+)
+from eoxmagmod.magnetic_model.coefficients import CombinedSHCoefficients
 #from eoxmagmod.magnetic_model.parser_mma import _cdf_rawtime_to_mjd2000 as cdf_rawtime_to_mjd2000
 from loader_mma import (
     load_model_swarm_mma_2c_internal,
     load_model_swarm_mma_2c_external,
 )
-from validation import get_data
+from validation import get_data, get_cached_data_file
+from data_cache import load_dataset
+from file_download import download_file, download_zipped_file
+# shared modules located in the common/ directory of the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from cdf_time import cdf_rawtime_to_mjd2000, datetime64_to_mjd2000
 from spacepy import pycdf
 
 LOCAL_PATH = "./data"
 
-EPOCH_2000 = datetime64("2000-01-01T00:00:00", "ns")
-NS_TO_DATE = 1.0 / 86400000000000.0
+# data file of the compared model values retrieved without a cache
+DATA_FILE = join(LOCAL_PATH, "data.cdf")
 
-CDF_EPOCH_TYPE = pycdf.const.CDF_EPOCH.value
-CDF_EPOCH_2000 = 63113904000000.0
+# maximum number of concurrent model file downloads
+DOWNLOAD_WORKERS = 4
 
+# memory budget of the loaded models registry
+MODEL_REGISTRY_MEMORY_BUDGET = 2 * 1024**3 # bytes
 
-def cdf_rawtime_to_mjd2000(raw_time, cdf_type):
-    """ Convert an array of CDF raw time values to array of MJD2000 values.
-    """
-    if cdf_type == CDF_EPOCH_TYPE:
-        return (raw_time - CDF_EPOCH_2000) / 86400000.0
-    raise TypeError("Unsupported CDF time type %r !" % cdf_type)
+# size of the parallel model evaluation chunks
+CHUNK_SIZE = 8192 # samples
 
+# size of the streamed model evaluation blocks
+BLOCK_SIZE = 262144 # records
 
-def datetime64_to_mjd2000(times):
-    """ Convert Numpy.datetime64 array to MJD2000. """
-    return (times.astype("datetime64[ns]") - EPOCH_2000).astype("int64") * NS_TO_DATE
+# model options with per-sample values
+SAMPLE_OPTIONS = ("f107", "lat_sol", "lon_sol")
 
 
-def get_model_files(url, sources, pattern, extension, zip_extension=None, data_path=LOCAL_PATH):
+def get_model_files(url, sources, pattern, extension, zip_extension=None,
+                    data_path=LOCAL_PATH, max_workers=DOWNLOAD_WORKERS,
+                    checksums=None):
     """ Download and unpack sources matched by the provided regex pattern.
     The function then returns a list of local files.
+
+    The missing files are downloaded concurrently by a pool of `max_workers`
+    threads. The files are written atomically, i.e., an interrupted download
+    never leaves an incomplete file behind, and partial downloads are
+    resumed. The optional `checksums` dictionary maps the source names
+    to the SHA-256 hex-digests of the (unpacked) files. The `url` can be
+    also a local `file://` URL.
     """
+    checksums = checksums or {}
 
     def get_file(name):
         """ Download file and unzip it is not present already. """
         target_file = join(data_path, name + extension)
         if not exists(target_file):
-            downloaded_file = join(data_path, name + (zip_extension or extension))
-            if not exists(downloaded_file):
-                remote_url = urljoin(url, basename(downloaded_file))
-                download_file(remote_url, downloaded_file)
-            if downloaded_file != target_file:
-                unzip_file(downloaded_file, target_file)
-                if exists(target_file):
-                    remove(downloaded_file)
+            remote_url = urljoin(url, name + (zip_extension or extension))
+            if zip_extension and zip_extension != extension:
+                download_zipped_file(remote_url, target_file, checksums.get(name))
+            else:
+                download_file(remote_url, target_file, checksums.get(name))
         return target_file
 
-    return [
-        get_file(source) for source in sources
-        if pattern.match(source)
-    ]
-
-
-def unzip_file(source, destination):
-    """ Extract file from a Zip archive. """
-    print(f"extracting {source} --> {destination} ... ", end="")
-    with ZipFile(source) as zip_:
-        for zipped_file in zip_.namelist():
-            if basename(zipped_file) != basename(destination):
-                continue
-            with zip_.open(zipped_file) as file_in:
-                with open(destination, "wb") as file_out:
-                    copyfileobj(file_in, file_out)
-        else:
-            zip_.open(zipped_file) # throws an error
-    print("OK")
+    names = [source for source in sources if pattern.match(source)]
+    with ThreadPoolExecutor(max(1, min(max_workers, len(names)))) as executor:
+        return list(executor.map(get_file, names))
 
 
-def download_file(source, destination):
-    """ Download file from a URL (supports both HTTP and FTP). """
-    print(f"donwloading {source} --> {destination} ... ", end="")
-    with urlopen(source) as response:
-        with open(destination, "wb") as file:
-            copyfileobj(response, file)
-    print("OK")
+def get_models(models, sources, registry=None):
+    """ Get list of models loaded from the given list of sources.
+    The model components are loaded once and shared via the models registry.
+    """
+    registry = registry or MODEL_REGISTRY
+    return {
+        model: [
+            registry.get(component, sources)
+            for component in MODEL_COMPONENTS.get(model, [])
+        ]
+        for model in models
+    }
 
 
-def get_models(models, sources):
-    """ Get list of models loaded from the given list of sources. """
+class ModelRegistry:
+    """ Registry of the loaded model components.
 
-    def get_model(model):
-        return MODEL_LOADERS.get(model, lambda sources: [])(sources)
+    Each model component is loaded once per list of the server sources and
+    shared by all models using it. The least recently used components are
+    evicted when the estimated memory size of the loaded components exceeds
+    the memory budget.
+    """
 
-    return {
-        model: get_model(model)
-        for model in models
-    }
+    def __init__(self, memory_budget=MODEL_REGISTRY_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._models = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_duration = 0.0
+
+    def get(self, component, sources):
+        """ Get model component loaded from the given list of sources. """
+        # Note: the source files are resolved (and possibly downloaded)
+        #       only when the component is loaded.
+        key = (component, tuple(sources))
+        with self._lock:
+            if key in self._models:
+                self.hits += 1
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            # concurrent requests of the same component wait for one load
+            lock = self._loading.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                if key in self._models:
+                    # loaded by a concurrent request
+                    self.hits += 1
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+                self.misses += 1
+            loader, source = COMPONENT_LOADERS[component]
+            start = time.perf_counter()
+            model = loader(*MODEL_SOURCES[source](sources))
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.load_duration += duration
+                self._models[key] = (model, _estimate_size(model))
+                self._loading.pop(key, None)
+                self._evict()
+        return model
+
+    def clear(self):
+        """ Remove all loaded model components. """
+        with self._lock:
+            self._models.clear()
+
+    def get_statistics(self):
+        """ Get the registry statistics. """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loadDuration": self.load_duration,
+                "count": len(self._models),
+                "size": self.size,
+            }
+
+    @property
+    def size(self):
+        """ Estimated memory size of the loaded model components in bytes. """
+        with self._lock:
+            return sum(size for _, size in self._models.values())
+
+    def _evict(self):
+        # The most recently loaded component is always kept.
+        while len(self._models) > 1 and self.size > self.memory_budget:
+            self._models.popitem(last=False)
+            self.evictions += 1
+
+
+def _estimate_size(obj, _visited=None):
+    """ Estimate memory size of an object as the total size of the Numpy
+    arrays it refers to.
+    """
+    visited = set() if _visited is None else _visited
+    if id(obj) in visited:
+        return 0
+    visited.add(id(obj))
+    if isinstance(obj, ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        items = obj.values()
+    elif isinstance(obj, (list, tuple)):
+        items = obj
+    elif hasattr(obj, "__dict__"):
+        items = vars(obj).values()
+    else:
+        return 0
+    return sum(_estimate_size(item, visited) for item in items)
 
 
 MODEL_SOURCES = {
@@ -140,44 +243,312 @@ MODEL_SOURCES = {
 }
 
 
-MODEL_LOADERS = {
-    "CHAOS": lambda sources: [
-        load_model_shc(*MODEL_SOURCES["CHAOS-Core"](sources)),
-        load_model_shc(*MODEL_SOURCES["CHAOS-Static"](sources)),
-        load_model_swarm_mma_2c_internal(*MODEL_SOURCES["CHAOS-MMA"](sources)),
-        load_model_swarm_mma_2c_external(*MODEL_SOURCES["CHAOS-MMA"](sources)),
-    ],
-    "CHAOS-Static": lambda sources: [
-        load_model_shc(*MODEL_SOURCES["CHAOS-Static"](sources)),
-    ],
-    "CHAOS-Core": lambda sources: [
-        load_model_shc(*MODEL_SOURCES["CHAOS-Core"](sources)),
-    ],
-    "CHAOS-MMA": lambda sources: [
-        load_model_swarm_mma_2c_internal(*MODEL_SOURCES["CHAOS-MMA"](sources)),
-        load_model_swarm_mma_2c_external(*MODEL_SOURCES["CHAOS-MMA"](sources)),
-    ],
-    "CHAOS-MMA-Primary": lambda sources: [
-        load_model_swarm_mma_2c_external(*MODEL_SOURCES["CHAOS-MMA"](sources)),
-    ],
-    "CHAOS-MMA-Secondary": lambda sources: [
-        load_model_swarm_mma_2c_internal(*MODEL_SOURCES["CHAOS-MMA"](sources)),
-    ],
-    "MIO_SHA_2C": lambda sources: [
-        load_model_swarm_mio_internal(*MODEL_SOURCES["MIO_SHA_2C"](sources)),
-        load_model_swarm_mio_external(*MODEL_SOURCES["MIO_SHA_2C"](sources)),
-    ],
-    "MIO_SHA_2C-Primary": lambda sources: [
-        load_model_swarm_mio_external(*MODEL_SOURCES["MIO_SHA_2C"](sources)),
-    ],
-    "MIO_SHA_2C-Secondary": lambda sources: [
-        load_model_swarm_mio_internal(*MODEL_SOURCES["MIO_SHA_2C"](sources)),
+# model components and their loaders and sources
+COMPONENT_LOADERS = {
+    "CHAOS-Core": (load_model_shc, "CHAOS-Core"),
+    "CHAOS-Static": (load_model_shc, "CHAOS-Static"),
+    "CHAOS-MMA-Primary": (load_model_swarm_mma_2c_external, "CHAOS-MMA"),
+    "CHAOS-MMA-Secondary": (load_model_swarm_mma_2c_internal, "CHAOS-MMA"),
+    "MIO_SHA_2C-Primary": (load_model_swarm_mio_external, "MIO_SHA_2C"),
+    "MIO_SHA_2C-Secondary": (load_model_swarm_mio_internal, "MIO_SHA_2C"),
+}
+
+
+# models and their components
+MODEL_COMPONENTS = {
+    "CHAOS": [
+        "CHAOS-Core", "CHAOS-Static", "CHAOS-MMA-Secondary", "CHAOS-MMA-Primary",
     ],
+    "CHAOS-Static": ["CHAOS-Static"],
+    "CHAOS-Core": ["CHAOS-Core"],
+    "CHAOS-MMA": ["CHAOS-MMA-Secondary", "CHAOS-MMA-Primary"],
+    "CHAOS-MMA-Primary": ["CHAOS-MMA-Primary"],
+    "CHAOS-MMA-Secondary": ["CHAOS-MMA-Secondary"],
+    "MIO_SHA_2C": ["MIO_SHA_2C-Secondary", "MIO_SHA_2C-Primary"],
+    "MIO_SHA_2C-Primary": ["MIO_SHA_2C-Primary"],
+    "MIO_SHA_2C-Secondary": ["MIO_SHA_2C-Secondary"],
+}
+
 
+MODEL_REGISTRY = ModelRegistry()
+
+
+MODEL_LOADERS = {
+    model: (lambda sources, model=model: get_models([model], sources)[model])
+    for model in MODEL_COMPONENTS
 }
 
 
-def eval_models(name, models, data):
+def evaluate_models(models, times, coords, **options):
+    """ Evaluate sum of the models. The compatible models are fused
+    (see `fuse_models()`) and the results accumulated in a single output
+    array.
+    """
+    return _evaluate_fused_models(fuse_models(models), times, coords, **options)
+
+
+def evaluate_models_parallel(models, times, coords, n_workers=None,
+                             chunk_size=CHUNK_SIZE, processes=False,
+                             **options):
+    """ Evaluate sum of the models in parallel.
+
+    The samples are split in chunks of `chunk_size` samples evaluated by
+    a pool of `n_workers` threads or, if `processes` is True, processes.
+    The processes read the inputs from and write the results to shared
+    memory buffers so that the data are not pickled.
+
+    Returns the evaluated models and list of the per-chunk timings.
+    """
+    n_workers = n_workers or os.cpu_count()
+    inputs, constants = _split_inputs(times, coords, options)
+    chunks = _get_chunks(inputs["times"].shape[0], chunk_size)
+    models = fuse_models(models)
+    if processes:
+        with _open_process_evaluator(
+            models, constants, inputs, inputs["times"].shape[0], n_workers
+        ) as evaluate:
+            return evaluate(inputs, chunks)
+    output = empty(inputs["coords"].shape)
+    with ThreadPoolExecutor(n_workers) as executor:
+        timings = list(executor.map(
+            lambda chunk: _evaluate_chunk(models, inputs, constants, output, chunk),
+            chunks
+        ))
+    return output, timings
+
+
+def print_chunk_timings(timings):
+    """ Print summary of the per-chunk timings. """
+    durations = sorted(timing["duration"] for timing in timings)
+    if not durations:
+        return
+    print(
+        f"{len(durations)} chunks, "
+        f"min {durations[0]:.3g} s, "
+        f"median {durations[len(durations) // 2]:.3g} s, "
+        f"max {durations[-1]:.3g} s"
+    )
+
+
+def _evaluate_chunk(models, inputs, constants, output, chunk):
+    start, end = chunk
+    start_time = time.perf_counter()
+    output[start:end] = _evaluate_fused_models(
+        models,
+        inputs["times"][start:end],
+        inputs["coords"][start:end],
+        **{
+            name: value[start:end] for name, value in inputs.items()
+            if name not in ("times", "coords")
+        },
+        **constants,
+    )
+    return {
+        "start": start,
+        "end": end,
+        "duration": time.perf_counter() - start_time,
+    }
+
+
+def _split_inputs(times, coords, options):
+    """ Split model inputs to the per-sample arrays and constant options. """
+    inputs = {
+        "times": asarray(times),
+        "coords": asarray(coords),
+        **{
+            name: asarray(value) for name, value in options.items()
+            if name in SAMPLE_OPTIONS
+        },
+    }
+    constants = {
+        name: value for name, value in options.items()
+        if name not in SAMPLE_OPTIONS
+    }
+    return inputs, constants
+
+
+def _get_chunks(size, chunk_size):
+    return [
+        (start, min(start + chunk_size, size))
+        for start in range(0, size, chunk_size)
+    ]
+
+
+@contextmanager
+def _open_process_evaluator(models, constants, inputs, size, n_workers):
+    """ Start a pool of model evaluation processes reading the inputs from
+    and writing the results to shared memory buffers of `size` samples.
+    The models and constant options are passed to the workers only once.
+
+    Yields function evaluating inputs of up to `size` samples in the given
+    chunks and returning the evaluated models and the per-chunk timings.
+    """
+    with ExitStack() as stack:
+
+        def _create_shared_array(shape, dtype):
+            dtype = dtype_(dtype)
+            buffer = SharedMemory(
+                create=True, size=max(1, int(prod(shape)) * dtype.itemsize)
+            )
+            stack.callback(buffer.unlink)
+            stack.callback(buffer.close)
+            return (buffer.name, shape, dtype.str), ndarray(
+                shape, dtype=dtype, buffer=buffer.buf
+            )
+
+        input_descriptors, input_arrays = {}, {}
+        for name, value in inputs.items():
+            input_descriptors[name], input_arrays[name] = _create_shared_array(
+                (size, *value.shape[1:]), value.dtype
+            )
+        output_descriptor, output = _create_shared_array(
+            (size, *inputs["coords"].shape[1:]), "float64"
+        )
+
+        executor = stack.enter_context(ProcessPoolExecutor(
+            n_workers, initializer=_init_worker, initargs=(
+                models, constants, input_descriptors, output_descriptor
+            )
+        ))
+
+        def _evaluate(inputs, chunks):
+            count = inputs["times"].shape[0]
+            for name, value in inputs.items():
+                input_arrays[name][:count] = value
+            timings = list(executor.map(_evaluate_chunk_in_worker, chunks))
+            return output[:count].copy(), timings
+
+        yield _evaluate
+
+
+# state of the model evaluation worker process
+_WORKER = {}
+
+
+def _init_worker(models, constants, input_descriptors, output_descriptor):
+
+    def _attach_shared_array(name, shape, dtype):
+        buffer = _attach_shared_memory(name)
+        _WORKER.setdefault("buffers", []).append(buffer)
+        return ndarray(shape, dtype=dtype, buffer=buffer.buf)
+
+    # Note: the atexit handlers are not executed by the worker processes.
+    Finalize(None, _close_worker, exitpriority=0)
+    _WORKER.update(
+        models=models,
+        constants=constants,
+        inputs={
+            name: _attach_shared_array(*descriptor)
+            for name, descriptor in input_descriptors.items()
+        },
+        output=_attach_shared_array(*output_descriptor),
+    )
+
+
+def _close_worker():
+    """ Release the shared memory of the worker process. """
+    # the array views must be released before the buffers are closed
+    _WORKER.pop("inputs", None)
+    _WORKER.pop("output", None)
+    for buffer in _WORKER.pop("buffers", []):
+        buffer.close()
+
+
+def _attach_shared_memory(name):
+    """ Attach shared memory segment owned by the parent process.
+
+    The segment is not registered with the resource tracker which would
+    report it as leaked or unlink it when the worker exits. The tracker
+    is shared with the parent and an unregistration by the worker would
+    also remove the registration of the owner.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _evaluate_chunk_in_worker(chunk):
+    return _evaluate_chunk(
+        _WORKER["models"], _WORKER["inputs"], _WORKER["constants"],
+        _WORKER["output"], chunk,
+    )
+
+
+def _evaluate_fused_models(models, times, coords, **options):
+    result = None
+    for model in models:
+        if result is None:
+            result = model.eval(times, coords, **options)
+        else:
+            result += model.eval(times, coords, **options)
+    if result is None:
+        result = zeros(asarray(coords).shape)
+    return result
+
+
+def fuse_models(models):
+    """ Fuse compatible spherical harmonic models into a single model.
+
+    The models of the same type, frame (i.e., the north pole of the dipole
+    frame) and source (internal or external) are replaced by one model
+    with combined coefficients. The basis functions of the fused model
+    are then evaluated only once per sample. The other models are kept
+    unchanged.
+    """
+    groups = {}
+    fused = []
+    for model in models:
+        key = _get_fusion_key(model)
+        if key is None:
+            fused.append([model])
+        elif key in groups:
+            groups[key].append(model)
+        else:
+            groups[key] = [model]
+            fused.append(groups[key])
+    return [
+        group[0] if len(group) == 1 else _fuse_model_group(group)
+        for group in fused
+    ]
+
+
+def _get_fusion_key(model):
+    if type(model) is SphericalHarmomicGeomagneticModel:
+        frame = None
+    elif type(model) is DipoleSphericalHarmomicGeomagneticModel:
+        frame = tuple(asarray(model.north_pole, dtype="float").flat)
+    else:
+        return None
+    return (type(model), frame, model.coefficients.is_internal)
+
+
+def _fuse_model_group(models):
+    head = models[0]
+    coefficients = CombinedSHCoefficients(*[
+        model.coefficients for model in models
+    ])
+    if type(head) is DipoleSphericalHarmomicGeomagneticModel:
+        return DipoleSphericalHarmomicGeomagneticModel(
+            coefficients, north_pole=head.north_pole,
+        )
+    return SphericalHarmomicGeomagneticModel(coefficients)
+
+
+def _eval_models(models, times, coords, n_workers, processes, options):
+    if n_workers is None:
+        return evaluate_models(models, times, coords, **options), None
+    return evaluate_models_parallel(
+        models, times, coords, n_workers=n_workers, processes=processes,
+        **options
+    )
+
+
+def eval_models(name, models, data, n_workers=None, processes=False):
     print(f"evaluating model {name} ... ", end="")
     times = datetime64_to_mjd2000(data["Timestamp"].values)
     coords = stack([
@@ -186,7 +557,6 @@ def eval_models(name, models, data):
         data["Radius"].values * 1e-3,
     ], axis=1)
     start = time.perf_counter_ns()
-    result = zeros(coords.shape)
     # Note: The F10.7 index and sub-solar point parameters are required
     #       by the MIO models. Other models just ignore them.
     options = {
@@ -195,15 +565,17 @@ def eval_models(name, models, data):
         "lon_sol": data["SunLongitude"].values,
         "scale": asarray([1.0, 1.0, -1.0]),
     }
-    for item in models:
-        result += item.eval(times, coords, **options)
+    result, timings = _eval_models(models, times, coords, n_workers, processes, options)
     stop = time.perf_counter_ns()
     duration = (stop - start) * 1e-9
     print(f"OK  {duration:g} s")
+    if timings:
+        print_chunk_timings(timings)
     return result
 
 
-def eval_models_from_data_file(name, models, data_file):
+def eval_models_from_data_file(name, models, data_file, n_workers=None,
+                               processes=False):
     with pycdf.CDF(data_file) as cdf:
         times_var = cdf.raw_var("Timestamp")
         times = cdf_rawtime_to_mjd2000(times_var[...], times_var.type())
@@ -220,17 +592,151 @@ def eval_models_from_data_file(name, models, data_file):
         }
     print(f"evaluating model {name} ... ", end="")
     start = time.perf_counter_ns()
-    result = zeros(coords.shape)
     # Note: The F10.7 index and sub-solar point parameters are required
     #       by the MIO models. Other models just ignore them.
-
-    for item in models:
-        result += item.eval(times, coords, **options)
+    result, timings = _eval_models(models, times, coords, n_workers, processes, options)
     stop = time.perf_counter_ns()
     duration = (stop - start) * 1e-9
     print(f"OK  {duration:g} s")
+    if timings:
+        print_chunk_timings(timings)
     return result
 
+def eval_models_streaming(name, models, data_file, output_file,
+                          block_size=BLOCK_SIZE, n_workers=None,
+                          processes=False):
+    """ Evaluate models for the inputs read from a CDF data file in blocks
+    of records and write the results incrementally to the output file.
+    The peak memory use is bounded by the block size regardless of the size
+    of the data file.
+
+    The output file is either a NPY file containing the (N, 3) array
+    of the model values or a CDF file containing the copied Timestamp
+    and the `B_NEC_<name>` model values.
+
+    With `processes` set, one pool of worker processes, receiving the models
+    only once, evaluates all blocks.
+
+    Returns the number of evaluated records.
+    """
+    print(f"evaluating model {name} ... ", end="")
+    start = time.perf_counter_ns()
+    models = fuse_models(models)
+    with pycdf.CDF(data_file) as cdf, ExitStack() as stack:
+        size = len(cdf["Timestamp"])
+        write_block = stack.enter_context(
+            _open_model_output(output_file, name, size, cdf)
+        )
+        evaluate = None
+        for block_start, inputs in iter_inputs_from_data_file(cdf, block_size):
+            if evaluate is None:
+                evaluate = stack.enter_context(_open_block_evaluator(
+                    models, inputs, block_size, n_workers, processes
+                ))
+            write_block(block_start, inputs, evaluate(inputs))
+    stop = time.perf_counter_ns()
+    duration = (stop - start) * 1e-9
+    print(f"OK  {duration:g} s")
+    return size
+
+
+def iter_inputs_from_data_file(cdf, block_size=BLOCK_SIZE):
+    """ Iterate model inputs read from an opened CDF data file in blocks
+    of records. Yields the block offset and the block inputs.
+    """
+    size = len(cdf["Timestamp"])
+    times_var = cdf.raw_var("Timestamp")
+    for start in range(0, size, block_size):
+        end = min(start + block_size, size)
+        raw_times = times_var[start:end]
+        coords = empty((end - start, 3))
+        coords[:, 0] = cdf["Latitude"][start:end]
+        coords[:, 1] = cdf["Longitude"][start:end]
+        coords[:, 2] = cdf["Radius"][start:end]
+        coords[:, 2] *= 1e-3
+        yield start, {
+            "raw_times": raw_times,
+            "times": cdf_rawtime_to_mjd2000(raw_times, times_var.type()),
+            "coords": coords,
+            "options": {
+                "f107": cdf["F107"][start:end],
+                "lat_sol": cdf["SunDeclination"][start:end],
+                "lon_sol": cdf["SunLongitude"][start:end],
+                "scale": asarray([1.0, 1.0, -1.0]),
+            },
+        }
+
+
+@contextmanager
+def _open_block_evaluator(models, inputs, block_size, n_workers, processes):
+    """ Yield function evaluating models for blocks of inputs (see
+    `iter_inputs_from_data_file()`). The worker processes are started
+    once for all blocks.
+    """
+    if n_workers is None or not processes:
+        yield lambda inputs: _eval_models(
+            models, inputs["times"], inputs["coords"], n_workers, processes,
+            inputs["options"],
+        )[0]
+        return
+
+    sample_inputs, constants = _split_inputs(
+        inputs["times"], inputs["coords"], inputs["options"]
+    )
+    with _open_process_evaluator(
+        models, constants, sample_inputs, block_size, n_workers
+    ) as evaluate:
+
+        def _evaluate_block(inputs):
+            sample_inputs, _ = _split_inputs(
+                inputs["times"], inputs["coords"], inputs["options"]
+            )
+            return evaluate(
+                sample_inputs,
+                _get_chunks(sample_inputs["times"].shape[0], CHUNK_SIZE),
+            )[0]
+
+        yield _evaluate_block
+
+
+@contextmanager
+def _open_model_output(output_file, name, size, source_cdf):
+    """ Open output file and yield function writing blocks of the results. """
+    if output_file.lower().endswith(".npy"):
+        output = open_memmap(output_file, mode="w+", dtype="float64", shape=(size, 3))
+
+        def _write_block(start, inputs, result):
+            output[start:start + result.shape[0]] = result
+            output.flush()
+
+        try:
+            yield _write_block
+        finally:
+            del output
+
+    elif output_file.lower().endswith(".cdf"):
+        if exists(output_file):
+            remove(output_file)
+        with pycdf.CDF(output_file, "") as cdf:
+            cdf.new(
+                "Timestamp", type=source_cdf.raw_var("Timestamp").type(),
+                recVary=True,
+            )
+            cdf.new(
+                f"B_NEC_{name}", type=pycdf.const.CDF_DOUBLE, dims=[3],
+                recVary=True,
+            )
+
+            def _write_block(start, inputs, result):
+                end = start + result.shape[0]
+                cdf.raw_var("Timestamp")[start:end] = inputs["raw_times"]
+                cdf[f"B_NEC_{name}"][start:end] = result
+
+            yield _write_block
+    else:
+        raise ValueError(f"Unsupported output file format! {output_file}")
+
+
 def get_inputs_from_data(data):
     return {
         "times": datetime64_to_mjd2000(data["Timestamp"].values),
@@ -254,7 +760,12 @@ def get_inputs_from_data_file(data_file):
         }
 
 
-def get_compared_model_values(url, collection, start_time, end_time, models, **options):
+def get_compared_model_values(url, collection, start_time, end_time, models,
+                              cache=None, **options):
+    """ Get model values from the VirES server and the locally evaluated
+    models. If a `data_cache.DataCache` is given, the data are read from
+    the cached CDF file instead of being written to the fixed DATA_FILE.
+    """
     options = dict(
         collection=collection,
         start_time=start_time,
@@ -268,8 +779,12 @@ def get_compared_model_values(url, collection, start_time, end_time, models, **o
         if "=" in model:
             raise ValueError("Local evaluation of model expressions is not yet supported.")
 
-    data_file = "./data/data.cdf"
-    data = get_data(url=url, data_file=data_file, **options)
+    if cache is None:
+        data_file = DATA_FILE
+        data = get_data(url=url, data_file=data_file, **options)
+    else:
+        data_file = get_cached_data_file(url=url, cache=cache, **options)
+        data = load_dataset(data_file)
 
     model_names = [
         model.partition("=")[0].strip() for model in models
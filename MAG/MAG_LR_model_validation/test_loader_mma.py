@@ -0,0 +1,76 @@
+#
+# tests of the time-range restricted loading of the MMA coefficients
+#
+
+import pytest
+import numpy
+
+pytest.importorskip("spacepy")
+pytest.importorskip("eoxmagmod")
+
+import loader_mma  # noqa: E402
+
+# nodes of the daily files start 45 minutes after midnight
+NODE_OFFSET = 0.75 / 24  # days
+NODE_STEP = 1.5 / 24  # days
+DAYS = ["20200101", "20200102", "20200103", "20200104"]
+
+
+def _get_day_set(day_index):
+    start = 7305 + day_index  # MJD2000 of 2020-01-01
+    times = start + NODE_OFFSET + NODE_STEP * numpy.arange(16)
+    return {
+        "degree_min": 1,
+        "degree_max": 1,
+        "nm": numpy.array([[1, 0]]),
+        "t": times,
+        "gh": numpy.ones((1, times.size)),
+    }
+
+
+@pytest.fixture
+def daily_files(tmp_path, monkeypatch):
+    paths, data = [], {}
+    for index, day in enumerate(DAYS):
+        path = str(tmp_path / f"SW_OPER_MMA_SHA_2F_{day}T000000_{day}T235959_0101.cdf")
+        open(path, "wb").close()
+        paths.append(path)
+        data[path] = {"geo_internal": _get_day_set(index)}
+    monkeypatch.setattr(loader_mma, "_read_data", lambda path, readers: data[path])
+    loader_mma.clear_cache()
+    yield paths
+    loader_mma.clear_cache()
+
+
+def test_window_starting_before_the_first_node(daily_files):
+    # window starting between midnight and the first node of the second day
+    start = 7306 + 10 / 1440
+    end = 7306 + 0.5
+    paths = loader_mma._select_files(
+        daily_files, loader_mma.MMA_2F_READERS, "geo_internal", (start, end)
+    )
+    assert paths[:2] == daily_files[:2]
+    merged = loader_mma._merge_coefficients(*[
+        loader_mma._read_data(path, None)["geo_internal"] for path in paths
+    ], variable="gh", time_range=(start, end))
+    times = merged["t"]
+    # the start is bridged by the last node of the previous day
+    assert times[0] < start < times[1]
+    assert times[0] == _get_day_set(0)["t"][-1]
+    assert times[-1] > end
+
+
+def test_window_ending_after_the_last_node(daily_files):
+    # window ending between the last node and midnight of the second day
+    start = 7306 + 0.5
+    end = 7307 - 10 / 1440
+    paths = loader_mma._select_files(
+        daily_files, loader_mma.MMA_2F_READERS, "geo_internal", (start, end)
+    )
+    merged = loader_mma._merge_coefficients(*[
+        loader_mma._read_data(path, None)["geo_internal"] for path in paths
+    ], variable="gh", time_range=(start, end))
+    times = merged["t"]
+    assert times[0] < start
+    assert times[-2] < end < times[-1]
+    assert times[-1] == _get_day_set(2)["t"][0]
@@ -9,19 +9,28 @@ import time
 import json
 import datetime
 import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
 from viresclient import SwarmRequest
 from viresclient._wps.time_util import parse_datetime, parse_duration
+from data_cache import concatenate_datasets
 
 TZ_UTC = zoneinfo.ZoneInfo("UTC")
 
+MEASUREMENTS = ["B_NEC"]
+SAMPLING_STEP = "PT60S"
 
-def get_random_collection(collections):
-    return random.choice(collections)
+# time-sliced parallel data retrieval
+SLICE_DURATION = datetime.timedelta(days=1)
+MAX_CONCURRENCY = 4
 
 
-def get_random_time(start, end):
+def get_random_collection(collections, rng=random):
+    return rng.choice(collections)
+
+
+def get_random_time(start, end, rng=random):
     total_seconds = max(0, int((end - start).total_seconds()))
-    random_seconds = random.randrange(total_seconds)
+    random_seconds = rng.randrange(total_seconds)
     return start + datetime.timedelta(seconds=random_seconds)
 
 
@@ -34,14 +43,69 @@ def get_collection_date_range(url, collection):
     )
 
 
-def get_data(url, collection, start_time, end_time, auxiliaries=None, models=None, filters=None, data_file=None):
+def get_data(url, collection, start_time, end_time, auxiliaries=None, models=None, filters=None, data_file=None, cache=None):
+    """ Get data from the VirES server as an xarray dataset. If a
+    `data_cache.DataCache` is given, the cached data are reused and only
+    the missing time windows are requested from the server.
+    """
+    if cache is None:
+        data = _get_between(
+            url, collection, start_time, end_time, auxiliaries=auxiliaries,
+            models=models, filters=filters,
+        )
+        if data_file:
+            data.to_file(data_file, overwrite=True)
+        return data.as_xarray()
+
+    request, fetch = _get_cached_request(
+        url, collection, auxiliaries=auxiliaries, models=models, filters=filters,
+    )
+    return cache.get_data(
+        request, start_time, end_time, fetch, data_file=data_file
+    )
+
+
+def get_cached_data_file(url, collection, start_time, end_time, cache,
+                         auxiliaries=None, models=None, filters=None):
+    """ Get path of the `data_cache.DataCache` CDF file containing exactly
+    the requested time window. The data are requested from the VirES server
+    if not cached.
+    """
+    request, fetch = _get_cached_request(
+        url, collection, auxiliaries=auxiliaries, models=models, filters=filters,
+    )
+    return cache.get_data_file(request, start_time, end_time, fetch)
+
+
+def _get_cached_request(url, collection, auxiliaries=None, models=None, filters=None):
+    """ Get the cache request parameters and the data fetching callback. """
+
+    def _fetch(start_time, end_time, filename):
+        _get_between(
+            url, collection, start_time, end_time, auxiliaries=auxiliaries,
+            models=models, filters=filters,
+        ).to_file(filename, overwrite=True)
+
+    request = {
+        "url": url,
+        "collection": collection,
+        "measurements": MEASUREMENTS,
+        "auxiliaries": auxiliaries,
+        "models": models,
+        "filters": filters,
+        "sampling_step": SAMPLING_STEP,
+    }
+    return request, _fetch
+
+
+def _get_between(url, collection, start_time, end_time, auxiliaries=None, models=None, filters=None):
     request = SwarmRequest(f"{url}/ows")
     request.set_collection(collection)
     request.set_products(
-        measurements=["B_NEC"],
+        measurements=MEASUREMENTS,
         auxiliaries=auxiliaries,
         models=models,
-        sampling_step="PT60S"
+        sampling_step=SAMPLING_STEP,
     )
     for filter_ in filters or ():
         request.add_filter(filter_)
@@ -55,22 +119,108 @@ def get_data(url, collection, start_time, end_time, auxiliaries=None, models=Non
     request_stop = time.perf_counter_ns()
     request_duration = (request_stop - request_start) * 1e-9
     print(f"{url} {request_duration:g}s")
-    if data_file:
-        data.to_file(data_file, overwrite=True)
-    return data.as_xarray()
+    return data
+
 
+def get_data_parallel(url, collection, start_time, end_time,
+                      slice_duration=SLICE_DURATION,
+                      max_concurrency=MAX_CONCURRENCY, **options):
+    """ Get data from the VirES server as an xarray dataset. Long time
+    windows are split into slices fetched in parallel and joined in order.
+    """
+    slices = _get_slices(start_time, end_time, slice_duration, options.get("data_file"))
+    with ThreadPoolExecutor(max_concurrency) as executor:
+        return _join_slices(slices, [
+            _submit_slice(executor, url, collection, slice_, **options)
+            for slice_ in slices
+        ])
 
-def get_compared_model_values(tested_url, reference_url, collection, start_time, end_time, models, **options):
+
+def _get_slices(start_time, end_time, slice_duration, data_file=None):
+    """ Split the time window into the (start, end) time slices. """
+    if not slice_duration or data_file:
+        return [(start_time, end_time)]
+    slices = []
+    slice_start = start_time
+    while slice_start < end_time:
+        slice_end = min(slice_start + slice_duration, end_time)
+        slices.append((slice_start, slice_end))
+        slice_start = slice_end
+    return slices
+
+
+def _submit_slice(executor, url, collection, slice_, **options):
+    """ Submit request of one time slice and return its future. """
+    slice_start, slice_end = slice_
+    return executor.submit(
+        get_data, url=url, collection=collection, start_time=slice_start,
+        end_time=slice_end, **options
+    )
+
+
+def _join_slices(slices, futures):
+    """ Join datasets of the time slices. Each slice except the last one is
+    trimmed to the [start, end) interval so that the samples at the slice
+    boundaries are not duplicated if the server end time is inclusive.
+    """
+    datasets = []
+    for index, ((slice_start, slice_end), future) in enumerate(zip(slices, futures)):
+        is_last = index == len(slices) - 1
+        datasets.append(_trim_dataset(
+            future.result(), slice_start, None if is_last else slice_end
+        ))
+    return concatenate_datasets(datasets)
+
+
+def _trim_dataset(dataset, start_time, end_time=None):
+    times = dataset["Timestamp"].values
+    mask = times >= numpy.datetime64(_to_naive_utc(start_time))
+    if end_time is not None:
+        mask &= times < numpy.datetime64(_to_naive_utc(end_time))
+    if mask.all():
+        return dataset
+    return dataset.isel(Timestamp=mask)
+
+
+def _to_naive_utc(time):
+    if time.tzinfo is not None:
+        time = time.astimezone(TZ_UTC).replace(tzinfo=None)
+    return time
+
+
+def get_compared_model_values(tested_url, reference_url, collection, start_time, end_time, models,
+                              slice_duration=SLICE_DURATION, max_concurrency=MAX_CONCURRENCY, **options):
+    """ Get model values from the tested and reference servers. Both servers
+    are queried concurrently and long time windows are split into slices
+    fetched in parallel by at most `max_concurrency` requests.
+    """
     options = dict(
         collection=collection,
-        start_time=start_time,
-        end_time=end_time,
         models=models,
         **options,
     )
 
-    reference_data = get_data(url=reference_url, **options)
-    tested_data = get_data(url=tested_url, **options)
+    slices = _get_slices(
+        start_time, end_time, slice_duration, options.get("data_file")
+    )
+    # Note: only the tested data are written to the optional data file
+    #       so that the concurrent requests never write the same file.
+    reference_options = {
+        key: value for key, value in options.items() if key != "data_file"
+    }
+    with ThreadPoolExecutor(max_concurrency) as executor:
+        # Note: the slice requests of the two servers are interleaved
+        #       so that both servers are queried concurrently.
+        reference_futures, tested_futures = [], []
+        for slice_ in slices:
+            reference_futures.append(_submit_slice(
+                executor, url=reference_url, slice_=slice_, **reference_options
+            ))
+            tested_futures.append(_submit_slice(
+                executor, url=tested_url, slice_=slice_, **options
+            ))
+        reference_data = _join_slices(slices, reference_futures)
+        tested_data = _join_slices(slices, tested_futures)
 
     for key in ["Timestamp", "Radius", "Latitude", "Longitude"]:
         if not numpy.array_equal(tested_data[key].values, reference_data[key].values):
@@ -0,0 +1,596 @@
+#
+# offline stand-in VirES server
+#
+# Minimal local imitation of the VirES for Swarm server providing
+# the HAPI interface (capabilities, catalog, info and data) and the subset
+# of the WPS /ows interface used by `SwarmRequest.get_between()` (synchronous
+# and asynchronous data requests). The served data are synthetic MAGx_LR_1B
+# like time-series generated on the fly.
+#
+# The server allows measurement of the client-side overhead of the test
+# harnesses and running them without network access. Configurable server
+# latency and bandwidth allow checking of the throughput scaling.
+#
+# Usage:
+#
+#   python3 vires_standin.py [--port 8000] [--latency 0.1] [--bandwidth 1e7]
+#
+# and set the server URL to `http://localhost:8000`. Alternatively,
+# the server can be started in a background thread by `start_server()`.
+#
+# Note that `SwarmRequest` requires an access token configured for the server
+# URL (any token is accepted), e.g.,
+#
+#   viresclient set_token http://localhost:8000/ows
+#
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import argparse
+import datetime
+import tempfile
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.etree import ElementTree
+import numpy
+from cdflib.cdfwrite import CDF
+
+NS_WPS = "http://www.opengis.net/wps/1.0.0"
+NS_OWS = "http://www.opengis.net/ows/1.1"
+
+DATASETS = {
+    f"SW_OPER_MAG{spacecraft}_LR_1B": {
+        "spacecraft": spacecraft,
+        "startDate": "2013-11-25T00:00:00Z",
+        "stopDate": "2023-12-31T23:59:59Z",
+        "sampling": "PT1S",
+        "maxTimeSelection": "P10D",
+    } for spacecraft in "ABC"
+}
+
+HAPI_PARAMETERS = [
+    {"name": "Timestamp", "type": "isotime", "length": 24, "units": "UTC", "fill": None},
+    {"name": "Latitude", "type": "double", "units": "deg", "fill": None},
+    {"name": "Longitude", "type": "double", "units": "deg", "fill": None},
+    {"name": "Radius", "type": "double", "units": "m", "fill": None},
+    {"name": "F", "type": "double", "units": "nT", "fill": None},
+    {"name": "B_NEC", "type": "double", "size": [3], "units": "nT", "fill": None},
+    {"name": "Flags_B", "type": "integer", "units": "-", "fill": None},
+]
+
+HAPI_FORMATS = ["csv", "binary", "json"]
+HAPI_TYPES = {"double": "<f8", "integer": "<i4"}
+
+CHUNK_SIZE = 64 * 1024 # bytes
+
+# CDF_EPOCH offset of the Unix epoch (1970-01-01T00:00:00Z) in milliseconds
+CDF_EPOCH_1970 = 62167219200000.0
+CDF_EPOCH_TYPE = 31
+CDF_DOUBLE_TYPE = 45
+CDF_UINT1_TYPE = 11
+
+# orbit parameters of the synthetic trajectory
+ORBIT_PERIOD = 5640.0 # seconds
+ORBIT_INCLINATION = 87.4 # deg
+ORBIT_RADIUS = 6.83e6 # m
+EARTH_ROTATION_PERIOD = 86164.0 # seconds
+REFERENCE_RADIUS = 6.3712e6 # m
+DIPOLE_G10 = -29404.8 # nT
+
+
+def start_server(host="localhost", port=0, latency=0.0, bandwidth=None):
+    """ Start the stand-in server in a background thread. Returns the server
+    object and its base URL. Call `server.shutdown()` to stop it.
+    """
+    server = StandInServer((host, port), latency=latency, bandwidth=bandwidth)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+class StandInServer(ThreadingHTTPServer):
+    """ Stand-in VirES server. """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, bandwidth=None):
+        super().__init__(address, StandInRequestHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.jobs = {}
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """ Stand-in VirES request handler. """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/hapi/capabilities":
+                self.send_json(get_hapi_capabilities())
+            elif url.path == "/hapi/catalog":
+                self.send_json(get_hapi_catalog())
+            elif url.path == "/hapi/info":
+                self.send_json(get_hapi_info(query["dataset"]))
+            elif url.path == "/hapi/data":
+                self.send_hapi_data(query)
+            elif url.path.startswith("/ows/jobs/"):
+                self.send_job(url.path)
+            else:
+                self.send_error(404)
+        except (KeyError, ValueError) as error:
+            self.send_data(400, "text/plain", f"Bad request! {error}\n".encode("utf8"))
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/ows":
+            self.send_error(404)
+            return
+        request = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            process, inputs = parse_wps_execute(request)
+            if process == "vires:fetch_filtered_data":
+                self.send_data(200, "application/x-cdf", get_cdf_data(inputs))
+            elif process == "vires:fetch_filtered_data_async":
+                self.submit_job(inputs)
+            elif process == "listJobs":
+                self.send_json({"vires:fetch_filtered_data_async": []})
+            elif process == "removeJob":
+                self.server.jobs.pop(inputs.get("job_id"), None)
+                self.send_json(True)
+            else:
+                raise ValueError(f"Unsupported process {process}!")
+        except (KeyError, ValueError, ElementTree.ParseError) as error:
+            self.send_data(400, "text/xml", get_ows_exception(error))
+
+    def submit_job(self, inputs):
+        """ Submit asynchronous job. The job output is produced immediately. """
+        job_id = str(uuid.uuid4())
+        self.server.jobs[job_id] = get_cdf_data(inputs)
+        self.send_data(200, "text/xml", get_wps_execute_response(job_id))
+
+    def send_job(self, path):
+        """ Send asynchronous job status or output. """
+        match = re.match(r"^/ows/jobs/([0-9a-f-]+)/(status\.xml|output\.cdf)$", path)
+        job_id, item = match.groups() if match else (None, None)
+        if job_id not in self.server.jobs:
+            self.send_error(404)
+        elif item == "status.xml":
+            self.send_data(200, "text/xml", get_wps_execute_response(job_id, finished=True))
+        else:
+            self.send_data(200, "application/x-cdf", self.server.jobs[job_id])
+
+    def send_hapi_data(self, query):
+        dataset = query["dataset"]
+        format_ = query.get("format", "csv")
+        if format_ not in HAPI_FORMATS:
+            raise ValueError(f"Unsupported format {format_}!")
+        parameters = get_hapi_parameters(query.get("parameters"))
+        data = generate_data(
+            DATASETS[dataset],
+            parse_datetime(query["start"]),
+            parse_datetime(query["stop"]),
+            variables=[parameter["name"] for parameter in parameters],
+        )
+        header = None
+        if query.get("include") == "header":
+            header = {**get_hapi_info(dataset), "parameters": parameters, "format": format_}
+        self.send_data(200, HAPI_CONTENT_TYPES[format_], HAPI_ENCODERS[format_](
+            data, parameters, header
+        ))
+
+    def send_json(self, data):
+        self.send_data(200, "application/json", json.dumps(data).encode("utf8"))
+
+    def send_data(self, status, content_type, payload):
+        """ Send response with the configured latency and bandwidth. """
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if not self.server.bandwidth:
+            self.wfile.write(payload)
+            return
+        start = time.perf_counter()
+        for offset in range(0, len(payload), CHUNK_SIZE):
+            chunk = payload[offset:offset + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            delay = start + (offset + len(chunk)) / self.server.bandwidth - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def get_hapi_capabilities():
+    return {
+        "HAPI": "3.1",
+        "status": {"code": 1200, "message": "OK"},
+        "outputFormats": HAPI_FORMATS,
+    }
+
+
+def get_hapi_catalog():
+    return {
+        "HAPI": "3.1",
+        "status": {"code": 1200, "message": "OK"},
+        "catalog": [{"id": dataset} for dataset in DATASETS],
+    }
+
+
+def get_hapi_info(dataset):
+    info = DATASETS[dataset]
+    return {
+        "HAPI": "3.1",
+        "status": {"code": 1200, "message": "OK"},
+        "startDate": info["startDate"],
+        "stopDate": info["stopDate"],
+        "cadence": info["sampling"],
+        "x_maxTimeSelection": info["maxTimeSelection"],
+        "parameters": HAPI_PARAMETERS,
+    }
+
+
+def get_hapi_parameters(names):
+    """ Get HAPI parameters for a comma-separated list of names. The time
+    parameter is always included.
+    """
+    if not names:
+        return HAPI_PARAMETERS
+    names = set(names.split(",")) | {"Timestamp"}
+    return [parameter for parameter in HAPI_PARAMETERS if parameter["name"] in names]
+
+
+def encode_hapi_csv(data, parameters, header=None):
+    output = io.StringIO()
+    _write_hapi_header(output, header)
+    columns = []
+    for parameter in parameters:
+        values = data[parameter["name"]]
+        if parameter["type"] == "isotime":
+            values = format_isotime(values)
+        elif parameter["type"] == "double":
+            values = numpy.char.mod("%.9g", values)
+        else:
+            values = values.astype("U")
+        columns.extend(values.reshape((values.shape[0], -1)).T)
+    if columns:
+        lines = columns[0]
+        for column in columns[1:]:
+            lines = numpy.char.add(numpy.char.add(lines, ","), column)
+        output.write("\n".join(lines))
+        output.write("\n")
+    return output.getvalue().encode("utf8")
+
+
+def encode_hapi_binary(data, parameters, header=None):
+    output = io.StringIO()
+    _write_hapi_header(output, header)
+    records = numpy.empty(data["Timestamp"].shape, dtype=[
+        _get_hapi_field(parameter) for parameter in parameters
+    ])
+    for parameter in parameters:
+        values = data[parameter["name"]]
+        if parameter["type"] == "isotime":
+            values = numpy.char.encode(format_isotime(values), "ascii")
+        records[parameter["name"]] = values
+    return output.getvalue().encode("utf8") + records.tobytes()
+
+
+def encode_hapi_json(data, parameters, header=None):
+    columns = []
+    for parameter in parameters:
+        values = data[parameter["name"]]
+        if parameter["type"] == "isotime":
+            values = format_isotime(values)
+        columns.append(values.tolist())
+    return json.dumps({
+        **(header or {}),
+        "data": [list(record) for record in zip(*columns)],
+    }).encode("utf8")
+
+
+def _get_hapi_field(parameter):
+    if parameter["type"] == "isotime":
+        type_ = f"S{parameter['length']}"
+    else:
+        type_ = HAPI_TYPES[parameter["type"]]
+    return (parameter["name"], type_, tuple(parameter.get("size") or ()))
+
+
+def _write_hapi_header(output, header):
+    if header:
+        for line in json.dumps(header, indent=2).split("\n"):
+            output.write(f"#{line}\n")
+
+
+HAPI_ENCODERS = {
+    "csv": encode_hapi_csv,
+    "binary": encode_hapi_binary,
+    "json": encode_hapi_json,
+}
+
+HAPI_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "binary": "application/octet-stream",
+    "json": "application/json",
+}
+
+
+def parse_wps_execute(request):
+    """ Parse WPS Execute request. Returns process identifier and dictionary
+    of the inputs.
+    """
+    root = ElementTree.fromstring(request)
+    process = root.findtext(f"{{{NS_OWS}}}Identifier")
+    inputs = {}
+    for element in root.iterfind(f".//{{{NS_WPS}}}Input"):
+        identifier = element.findtext(f"{{{NS_OWS}}}Identifier")
+        data = element.find(f"{{{NS_WPS}}}Data")
+        inputs[identifier] = "".join(data.itertext()).strip() if data is not None else None
+    return process, inputs
+
+
+def get_wps_execute_response(job_id, finished=False):
+    """ Get WPS asynchronous execute response. """
+    status_url = f"/ows/jobs/{job_id}/status.xml"
+    if finished:
+        status = "<wps:ProcessSucceeded>done</wps:ProcessSucceeded>"
+        outputs = (
+            "<wps:ProcessOutputs><wps:Output>"
+            "<ows:Identifier>output</ows:Identifier>"
+            f'<wps:Reference href="/ows/jobs/{job_id}/output.cdf" mimeType="application/x-cdf"/>'
+            "</wps:Output></wps:ProcessOutputs>"
+        )
+    else:
+        status = "<wps:ProcessAccepted>accepted</wps:ProcessAccepted>"
+        outputs = ""
+    return (
+        '<?xml version="1.0"?>'
+        f'<wps:ExecuteResponse xmlns:wps="{NS_WPS}" xmlns:ows="{NS_OWS}" '
+        f'statusLocation="{status_url}">'
+        f"<wps:Status>{status}</wps:Status>{outputs}"
+        "</wps:ExecuteResponse>"
+    ).encode("utf8")
+
+
+def get_ows_exception(error):
+    return (
+        '<?xml version="1.0"?>'
+        f'<ows:ExceptionReport xmlns:ows="{NS_OWS}" version="2.0.0">'
+        '<ows:Exception exceptionCode="InvalidParameterValue">'
+        f"<ows:ExceptionText>{error}</ows:ExceptionText>"
+        "</ows:Exception></ows:ExceptionReport>"
+    ).encode("utf8")
+
+
+def get_cdf_data(inputs):
+    """ Generate CDF data response for the parsed WPS request inputs. """
+    collections = [
+        collection
+        for collections in json.loads(inputs["collection_ids"]).values()
+        for collection in collections
+    ]
+    variables = [
+        variable.strip() for variable in (inputs.get("variables") or "").split(",")
+        if variable.strip()
+    ]
+    models = [
+        model.partition("=")[0].strip().strip("'\"")
+        for model in _split_models(inputs.get("model_ids") or "")
+    ]
+    start = parse_datetime(inputs["begin_time"])
+    end = parse_datetime(inputs["end_time"])
+    sampling_step = inputs.get("sampling_step")
+    datasets = [DATASETS[collection] for collection in collections]
+
+    data = [
+        generate_data(
+            dataset, start, end, variables=["Spacecraft", *variables],
+            models=models, sampling_step=sampling_step,
+        ) for dataset in datasets
+    ]
+    data = {
+        variable: numpy.concatenate([item[variable] for item in data])
+        for variable in data[0]
+    }
+    return encode_cdf(data, {
+        "ORIGINAL_PRODUCT_NAMES": [
+            f"{collection}_{start:%Y%m%dT000000}_{start:%Y%m%dT235959}_0000"
+            for collection in collections
+        ],
+        "MAGNETIC_MODELS": models,
+        "DATA_FILTERS": [inputs["filters"]] if inputs.get("filters") else [],
+    })
+
+
+def _split_models(model_ids):
+    """ Split model expressions separated by commas outside of brackets. """
+    models, level, start = [], 0, 0
+    for idx, char in enumerate(model_ids):
+        if char == "(":
+            level += 1
+        elif char == ")":
+            level -= 1
+        elif char == "," and level == 0:
+            models.append(model_ids[start:idx])
+            start = idx + 1
+    models.append(model_ids[start:])
+    return [model for model in models if model.strip()]
+
+
+def encode_cdf(data, global_attributes):
+    """ Encode the data as a CDF file. """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "data.cdf")
+        cdf = CDF(filename)
+        cdf.write_globalattrs({
+            name: {idx: value for idx, value in enumerate(values)}
+            for name, values in global_attributes.items() if values
+        })
+        for variable, values in data.items():
+            if variable == "Timestamp":
+                values = datetime64_to_cdf_epoch(values)
+                data_type = CDF_EPOCH_TYPE
+            elif variable == "Spacecraft":
+                cdf.write_var({
+                    "Variable": variable, "Data_Type": 51, # CDF_CHAR
+                    "Num_Elements": 1, "Rec_Vary": True, "Dim_Sizes": [],
+                }, var_data=values.tolist())
+                continue
+            elif values.dtype.kind in "iu":
+                data_type = CDF_UINT1_TYPE
+            else:
+                data_type = CDF_DOUBLE_TYPE
+            cdf.write_var({
+                "Variable": variable,
+                "Data_Type": data_type,
+                "Num_Elements": 1,
+                "Rec_Vary": True,
+                "Dim_Sizes": list(values.shape[1:]),
+            }, var_data=values)
+        cdf.close()
+        with open(filename, "rb") as file:
+            return file.read()
+
+
+def generate_data(dataset, start, end, variables=None, models=(), sampling_step=None):
+    """ Generate synthetic MAGx_LR_1B like data for the given time interval.
+    The trajectory is a circular polar orbit and the magnetic field
+    an axial dipole. Model values differ from the data by a small
+    model-specific offset.
+    """
+    step = parse_duration(sampling_step or dataset["sampling"])
+    start = max(start, parse_datetime(dataset["startDate"]))
+    end = min(end, parse_datetime(dataset["stopDate"]))
+    step_ns = int(step.total_seconds() * 1e9)
+    start_ns = -(-_datetime_to_ns(start) // step_ns) * step_ns
+    end_ns = _datetime_to_ns(end)
+    times = numpy.arange(start_ns, end_ns, step_ns, dtype="int64")
+    seconds = times * 1e-9
+
+    phase = 2 * numpy.pi * seconds / ORBIT_PERIOD + (ord(dataset["spacecraft"]) - 65)
+    inclination = numpy.radians(ORBIT_INCLINATION)
+    latitude = numpy.degrees(numpy.arcsin(
+        numpy.sin(inclination) * numpy.sin(phase)
+    ))
+    longitude = numpy.degrees(
+        numpy.arctan2(numpy.cos(inclination) * numpy.sin(phase), numpy.cos(phase))
+        - 2 * numpy.pi * seconds / EARTH_ROTATION_PERIOD
+    )
+    longitude = (longitude + 180.0) % 360.0 - 180.0
+    radius = numpy.full(times.shape, ORBIT_RADIUS)
+
+    scale = DIPOLE_G10 * (REFERENCE_RADIUS / radius) ** 3
+    sin_latitude = numpy.sin(numpy.radians(latitude))
+    cos_latitude = numpy.cos(numpy.radians(latitude))
+    b_nec = numpy.stack([
+        -scale * cos_latitude,
+        numpy.zeros(times.shape),
+        -2 * scale * sin_latitude,
+    ], axis=1)
+
+    data = {
+        "Timestamp": times.astype("datetime64[ns]"),
+        "Spacecraft": numpy.full(times.shape, dataset["spacecraft"]),
+        "Latitude": latitude,
+        "Longitude": longitude,
+        "Radius": radius,
+        "B_NEC": b_nec,
+        "F": numpy.linalg.norm(b_nec, axis=1),
+        "Flags_B": numpy.zeros(times.shape, dtype="uint8"),
+        "F107": numpy.full(times.shape, 100.0),
+        "SunDeclination": numpy.full(times.shape, 0.0),
+        "SunLongitude": numpy.full(times.shape, 0.0),
+        "QDLat": latitude,
+        "QDLon": longitude,
+        "MLT": (longitude / 15.0 + seconds / 3600.0) % 24.0,
+    }
+    for idx, model in enumerate(models, 1):
+        data[f"B_NEC_{model}"] = b_nec * (1.0 - 1e-3 * idx)
+        data[f"F_{model}"] = numpy.linalg.norm(data[f"B_NEC_{model}"], axis=1)
+
+    if variables is not None:
+        variables = [
+            "Timestamp", "Latitude", "Longitude", "Radius", *variables,
+            *(f"B_NEC_{model}" for model in models if "B_NEC" in variables),
+            *(f"F_{model}" for model in models if "F" in variables),
+        ]
+        data = {
+            variable: data[variable] for variable in dict.fromkeys(variables)
+            if variable in data
+        }
+    return data
+
+
+def format_isotime(times):
+    """ Format datetime64 array as HAPI ISO-8601 time strings. """
+    return numpy.char.add(
+        numpy.datetime_as_string(times.astype("datetime64[ms]"), unit="ms"), "Z"
+    )
+
+
+def datetime64_to_cdf_epoch(times):
+    """ Convert datetime64 array to CDF_EPOCH values. """
+    return times.astype("datetime64[ms]").astype("int64") + CDF_EPOCH_1970
+
+
+def parse_datetime(value):
+    """ Parse ISO-8601 date-time string to naive UTC datetime object. """
+    value = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_duration(value):
+    """ Parse simple ISO-8601 duration (days, hours, minutes, seconds). """
+    match = re.match(
+        r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d*)?)S)?)?$",
+        value.strip(),
+    )
+    if not match:
+        raise ValueError(f"Unsupported duration {value}!")
+    days, hours, minutes, seconds = (float(item or 0) for item in match.groups())
+    return datetime.timedelta(
+        days=days, hours=hours, minutes=minutes, seconds=seconds
+    )
+
+
+def _datetime_to_ns(value):
+    return int(numpy.datetime64(value, "ns").astype("int64"))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Stand-in VirES server.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="response latency in seconds",
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=None,
+        help="response bandwidth in bytes per second",
+    )
+    args = parser.parse_args(argv)
+    server = StandInServer(
+        (args.host, args.port), latency=args.latency, bandwidth=args.bandwidth,
+    )
+    print(f"serving at http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
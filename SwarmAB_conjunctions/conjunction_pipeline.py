@@ -0,0 +1,223 @@
+#
+# chunked parallel conjunction search over long time intervals
+#
+# The time interval is split in chunks (by default one day) processed
+# concurrently. The chunks are aligned to multiples of the chunk duration
+# from a fixed origin so that runs of different time intervals write
+# the same chunks. The orbits of each chunk are retrieved with overlapping
+# margins so that the minima near the chunk boundaries are found exactly
+# as in a single-pass run. Each chunk is written to its own output file
+# and the already processed chunks are skipped when the run is resumed.
+#
+
+import os
+import re
+import json
+import datetime
+from os.path import join, exists
+from functools import partial
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, as_completed,
+)
+import numpy
+from conjunctions import (
+    ANGULAR_DISTANCE_THRESHOLD, ONE_SEC, get_orbit, extract_orbit,
+    find_conjunctions, _get_empty_result,
+)
+
+OUTPUT_DIR = "./data/conjunctions"
+CHUNK_DURATION = datetime.timedelta(days=1)
+CHUNK_ORIGIN = datetime.datetime(2000, 1, 1)
+# Note: the margin must be longer than any local minimum range.
+CHUNK_MARGIN = datetime.timedelta(minutes=10)
+MAX_FETCH_WORKERS = 4
+MAX_PENDING_CHUNKS = 8
+
+PARAMETERS_FILE = "parameters.json"
+TIME_FORMAT = "%Y%m%dT%H%M%S"
+RE_CHUNK_FILE = re.compile(r"^\d{8}T\d{6}_\d{8}T\d{6}\.npz$")
+
+
+def run_conjunction_pipeline(spacecrafts, start_time, end_time,
+                             output_dir=OUTPUT_DIR,
+                             threshold=ANGULAR_DISTANCE_THRESHOLD, pairs=None,
+                             chunk_duration=CHUNK_DURATION, margin=CHUNK_MARGIN,
+                             chunk_origin=CHUNK_ORIGIN,
+                             step=ONE_SEC, max_workers=None,
+                             max_fetch_workers=MAX_FETCH_WORKERS,
+                             max_pending_chunks=MAX_PENDING_CHUNKS,
+                             fetch=get_orbit, **options):
+    """ Find conjunctions of the given spacecraft between the start
+    and end times and write them, chunk by chunk, to the output directory.
+
+    The orbits of all spacecraft are retrieved concurrently by a pool of
+    `max_fetch_workers` threads and the conjunctions are calculated
+    by a pool of `max_workers` processes. At most `max_pending_chunks`
+    chunks are held in memory at once.
+
+    The `fetch(spacecraft, start_time, end_time, **options)` callback
+    retrieves the orbit of one spacecraft (see `conjunctions.get_orbit()`).
+
+    The chunks are aligned to multiples of `chunk_duration` from
+    `chunk_origin` and the time interval is extended to the enclosing chunk
+    boundaries.
+
+    An interrupted run is resumed, or extended to another time interval, by
+    calling the function again with the same parameters. Use
+    `load_conjunctions()` to read the results.
+
+    Returns number of the processed chunks.
+    """
+    pairs = [tuple(pair) for pair in pairs] if pairs is not None else None
+    _check_parameters(output_dir, {
+        "spacecrafts": sorted(spacecrafts),
+        "pairs": pairs,
+        "threshold": threshold,
+        "chunkDuration": chunk_duration.total_seconds(),
+        "chunkOrigin": _parse_time(chunk_origin).isoformat(),
+        "margin": margin.total_seconds(),
+        "step": str(step),
+    })
+    chunks = [
+        (chunk_start, chunk_end)
+        for chunk_start, chunk_end in generate_chunks(
+            start_time, end_time, chunk_duration, chunk_origin
+        )
+        if not exists(_get_chunk_filename(output_dir, chunk_start, chunk_end))
+    ]
+    if not chunks:
+        return 0
+
+    fetch = partial(fetch, **options)
+
+    with ThreadPoolExecutor(max_fetch_workers) as fetch_pool, \
+            ProcessPoolExecutor(max_workers) as process_pool, \
+            ThreadPoolExecutor(max_pending_chunks) as chunk_pool:
+
+        def _process_chunk(chunk_start, chunk_end):
+            orbit_futures = {
+                spacecraft: fetch_pool.submit(
+                    _fetch_orbit, fetch, spacecraft,
+                    chunk_start - margin, chunk_end + margin, step,
+                ) for spacecraft in spacecrafts
+            }
+            orbits = {
+                spacecraft: future.result()
+                for spacecraft, future in orbit_futures.items()
+            }
+            result = process_pool.submit(
+                find_chunk_conjunctions, orbits, chunk_start, chunk_end,
+                threshold=threshold, pairs=pairs,
+            ).result()
+            write_chunk(output_dir, chunk_start, chunk_end, result)
+            return result["Timestamp"].size
+
+        futures = {
+            chunk_pool.submit(_process_chunk, *chunk): chunk for chunk in chunks
+        }
+        for count, future in enumerate(as_completed(futures), 1):
+            chunk_start, chunk_end = futures[future]
+            print(
+                f"[{count}/{len(chunks)}] {chunk_start.isoformat()}/"
+                f"{chunk_end.isoformat()}: {future.result()} conjunctions"
+            )
+
+    return len(chunks)
+
+
+def find_chunk_conjunctions(orbits, chunk_start, chunk_end, **options):
+    """ Find conjunctions within the chunk time interval from orbits
+    covering the chunk including the margins.
+    """
+    result = find_conjunctions(orbits, **options)
+    times = result["Timestamp"]
+    mask = (
+        (times >= numpy.datetime64(chunk_start, "ns")) &
+        (times < numpy.datetime64(chunk_end, "ns"))
+    )
+    return {key: values[mask] for key, values in result.items()}
+
+
+def generate_chunks(start_time, end_time, chunk_duration=CHUNK_DURATION,
+                    chunk_origin=CHUNK_ORIGIN):
+    """ Generate (start, end) time intervals of the chunks covering the time
+    interval. The chunks are aligned to multiples of the chunk duration
+    from the chunk origin.
+    """
+    start_time, end_time = _parse_time(start_time), _parse_time(end_time)
+    chunk_origin = _parse_time(chunk_origin)
+    chunk_start = chunk_origin + chunk_duration * (
+        (start_time - chunk_origin) // chunk_duration
+    )
+    while chunk_start < end_time:
+        chunk_end = chunk_start + chunk_duration
+        yield chunk_start, chunk_end
+        chunk_start = chunk_end
+
+
+def write_chunk(output_dir, chunk_start, chunk_end, result):
+    """ Write conjunctions of one chunk to a NumPy .npz file. """
+    filename = _get_chunk_filename(output_dir, chunk_start, chunk_end)
+    tmp_filename = f"{filename[:-4]}.{os.getpid()}.tmp.npz"
+    numpy.savez(tmp_filename, **{
+        key: (values.astype("str") if values.dtype == object else values)
+        for key, values in result.items()
+    })
+    os.replace(tmp_filename, filename)
+
+
+def load_conjunctions(output_dir=OUTPUT_DIR):
+    """ Load conjunctions of all processed chunks sorted by time. """
+    filenames = sorted(
+        filename for filename in os.listdir(output_dir)
+        if RE_CHUNK_FILE.match(filename)
+    ) if os.path.isdir(output_dir) else []
+    results = []
+    for filename in filenames:
+        with numpy.load(join(output_dir, filename)) as data:
+            results.append({key: data[key] for key in data.files})
+    if not results:
+        return _get_empty_result(("Spacecraft1", "Spacecraft2"))
+    return {
+        key: numpy.concatenate([result[key] for result in results])
+        for key in results[0]
+    }
+
+
+def _fetch_orbit(fetch, spacecraft, start_time, end_time, step):
+    return extract_orbit(fetch(spacecraft, start_time, end_time), step=step)
+
+
+def _check_parameters(output_dir, parameters):
+    """ Save the pipeline parameters or check that they match the parameters
+    of the previous run.
+    """
+    parameters = json.loads(json.dumps(parameters))
+    filename = join(output_dir, PARAMETERS_FILE)
+    if exists(filename):
+        with open(filename, encoding="utf8") as file:
+            saved_parameters = json.load(file)
+        if saved_parameters != parameters:
+            raise ValueError(
+                f"{output_dir} contains results of a run with different "
+                f"parameters! {saved_parameters}"
+            )
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    with open(filename, "w", encoding="utf8") as file:
+        json.dump(parameters, file, indent=2)
+
+
+def _get_chunk_filename(output_dir, chunk_start, chunk_end):
+    return join(
+        output_dir, f"{chunk_start:{TIME_FORMAT}}_{chunk_end:{TIME_FORMAT}}.npz"
+    )
+
+
+def _parse_time(time):
+    """ Convert ISO-8601 string or datetime to naive UTC datetime. """
+    if isinstance(time, str):
+        time = datetime.datetime.fromisoformat(time.replace("Z", "+00:00"))
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time
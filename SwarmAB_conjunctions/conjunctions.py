@@ -0,0 +1,302 @@
+#
+# vectorized multi-spacecraft conjunction search
+#
+# The conjunction points are the local minima of the angular distance
+# between two spacecraft positions below the given threshold.
+# See SwarmAB_conjunctions.ipynb for the description of the algorithm.
+#
+
+from itertools import combinations
+from collections import namedtuple
+from numpy import (
+    asarray, stack, concatenate, empty, zeros, ones, arange, repeat, cumsum,
+    flatnonzero, searchsorted, lexsort, unique, sign, diff,
+    add, sin, cos, arcsin, radians, degrees, minimum, argsort, full,
+    timedelta64,
+)
+from numpy.linalg import norm
+from viresclient import SwarmRequest
+
+ANGULAR_DISTANCE_THRESHOLD = 1.0 # deg
+
+SERVER_URL = "https://vires.services/ows"
+
+# VirES collections providing the spacecraft positions
+SPACECRAFT_COLLECTIONS = {
+    "Swarm-A": "SW_OPER_MODA_SC_1B",
+    "Swarm-B": "SW_OPER_MODB_SC_1B",
+    "Swarm-C": "SW_OPER_MODC_SC_1B",
+    "GRACE-A": "GRACE_A_MAG",
+    "GRACE-B": "GRACE_B_MAG",
+    "GRACE-FO-1": "GF1_OPER_FGM_ACAL_CORR",
+    "GRACE-FO-2": "GF2_OPER_FGM_ACAL_CORR",
+    "CryoSat-2": "CS_OPER_MAG",
+}
+
+SwarmRequest.COLLECTIONS.setdefault("MOD_SC", [
+    "SW_OPER_MOD{}_SC_1B".format(x) for x in "ABC"
+])
+SwarmRequest.PRODUCT_VARIABLES.setdefault("MOD_SC", [])
+
+ONE_SEC = timedelta64(1, "s")
+
+# Upper bound of the rate of change of the angular distance between two
+# LEO spacecraft in the Earth-fixed frame (2 x orbital + Earth rotation rate).
+MAX_ANGULAR_RATE = 0.15 # deg/s
+
+# step of the coarse evaluation of the angular distance used to prune
+# the time intervals which cannot get below the threshold
+PRUNING_STEP = 60 # samples
+
+
+class Orbit(namedtuple("Orbit", ["timestamp", "ticks", "step", "position", "unit_vector"])):
+    """ Spacecraft orbit with the times rounded to the sampling step.
+
+    timestamp - rounded datetime64[ns] times
+    ticks - times as integer multiples of the sampling step
+    step - sampling step (timedelta64)
+    position - geocentric spherical (latitude, longitude, radius) positions
+    unit_vector - unit Cartesian position vectors
+    """
+
+    @property
+    def size(self):
+        return self.ticks.size
+
+
+def get_orbit(spacecraft, start_time, end_time, server_url=SERVER_URL,
+              asynchronous=False, **opts):
+    """ Retrieve spacecraft positions for the given time-interval from
+    the VirES server. The spacecraft is one of the SPACECRAFT_COLLECTIONS.
+    """
+    print(f"Retrieving {spacecraft} orbit from {start_time} to {end_time} ... ")
+    request = SwarmRequest(server_url)
+    request.set_collection(SPACECRAFT_COLLECTIONS[spacecraft])
+    request.set_products(measurements=[], **opts)
+    return request.get_between(
+        start_time=start_time,
+        end_time=end_time,
+        asynchronous=asynchronous,
+    ).as_xarray()
+
+
+def get_orbits(spacecrafts, start_time, end_time, **options):
+    """ Retrieve orbits of multiple spacecrafts. """
+    return {
+        spacecraft: get_orbit(spacecraft, start_time, end_time, **options)
+        for spacecraft in spacecrafts
+    }
+
+
+def extract_orbit(data, step=ONE_SEC):
+    """ Extract spacecraft orbit from the VirES response (xarray dataset
+    or dictionary of arrays). The times are rounded to the sampling step
+    and only the first sample of the duplicate rounded times is kept.
+    """
+    step_ns = timedelta64(step, "ns").astype("int64")
+    timestamp = asarray(data["Timestamp"]).astype("datetime64[ns]").astype("int64")
+    ticks, index = unique((timestamp + step_ns // 2) // step_ns, return_index=True)
+    position = stack((
+        asarray(data["Latitude"])[index],
+        asarray(data["Longitude"])[index],
+        asarray(data["Radius"])[index],
+    ), axis=-1)
+    return Orbit(
+        timestamp=(ticks * step_ns).astype("datetime64[ns]"),
+        ticks=ticks,
+        step=step,
+        position=position,
+        unit_vector=get_unit_vectors(position[:, 0], position[:, 1]),
+    )
+
+
+def get_unit_vectors(latitude, longitude):
+    """ Get unit Cartesian vectors from the geocentric latitudes and longitudes
+    in degrees.
+    """
+    latitude, longitude = radians(latitude), radians(longitude)
+    cos_latitude = cos(latitude)
+    return stack((
+        cos_latitude * cos(longitude),
+        cos_latitude * sin(longitude),
+        sin(latitude),
+    ), axis=-1)
+
+
+def get_angular_distance(unit_vector1, unit_vector2):
+    """ Calculate angular distance in degrees between two unit vectors.
+
+    The angle is calculated from the chord length which, unlike arccos
+    of the dot product, is accurate also for small angles.
+    """
+    chord = norm(unit_vector1 - unit_vector2, axis=-1)
+    return degrees(2 * arcsin(minimum(0.5 * chord, 1.0)))
+
+
+def get_local_minima(values, segments=None):
+    """ Find indices of the local minima of the given series.
+
+    The minima are detected from the sign changes of the central differences
+    and the minimum of each descending-ascending range is returned.
+    The optional segment identifiers split the series into independent
+    segments, i.e., no minimum range spans multiple segments.
+    """
+    values = asarray(values)
+    if values.size < 3:
+        return empty(0, dtype="int64")
+    slope_sign = sign(values[2:] - values[:-2])
+    if segments is not None:
+        segments = asarray(segments)
+        # Note: -2 neither starts nor ends a minimum range
+        slope_sign[segments[2:] != segments[:-2]] = -2
+
+    # last descending slopes before the minima
+    idx0 = flatnonzero((slope_sign[:-1] == -1) & (slope_sign[1:] > -1))
+    # first ascending slopes after the minima
+    ascending = flatnonzero(slope_sign == +1)
+    next_ascending = searchsorted(ascending, idx0, side="right")
+    mask = next_ascending < ascending.size
+    idx0 = idx0[mask]
+    idx1 = ascending[next_ascending[mask]]
+    if segments is not None:
+        mask = segments[idx0] == segments[idx1]
+        idx0, idx1 = idx0[mask], idx1[mask]
+    if not idx0.size:
+        return empty(0, dtype="int64")
+
+    # find minimum of each range [idx0 + 1, idx1 + 2)
+    lengths = idx1 - idx0 + 1
+    offsets = cumsum(lengths) - lengths
+    range_ids = repeat(arange(lengths.size), lengths)
+    positions = repeat(idx0 + 1 - offsets, lengths) + arange(lengths.sum())
+    order = lexsort((positions, values[positions], range_ids))
+    return unique(positions[order[offsets]])
+
+
+def find_conjunctions(orbits, threshold=ANGULAR_DISTANCE_THRESHOLD, pairs=None,
+                      **options):
+    """ Find conjunctions of multiple spacecraft.
+
+    The orbits are passed as a dictionary of the spacecraft orbits
+    (see `extract_orbit()`) indexed by the spacecraft name. By default,
+    all spacecraft pairs are evaluated.
+
+    Returns dictionary of arrays of the conjunctions sorted by time.
+    """
+    if pairs is None:
+        pairs = combinations(sorted(orbits), 2)
+    results = []
+    for spacecraft1, spacecraft2 in pairs:
+        result = find_pair_conjunctions(
+            orbits[spacecraft1], orbits[spacecraft2], threshold, **options
+        )
+        size = result["Timestamp"].size
+        results.append({
+            "Timestamp": result["Timestamp"],
+            "Spacecraft1": full(size, spacecraft1, dtype=object),
+            "Spacecraft2": full(size, spacecraft2, dtype=object),
+            "Position1": result["Position1"],
+            "Position2": result["Position2"],
+            "AngularDistance": result["AngularDistance"],
+        })
+    if not results:
+        return _get_empty_result(("Spacecraft1", "Spacecraft2"))
+    index = argsort(concatenate([
+        result["Timestamp"] for result in results
+    ]), kind="stable")
+    return {
+        key: concatenate([result[key] for result in results])[index]
+        for key in results[0]
+    }
+
+
+def find_pair_conjunctions(orbit1, orbit2, threshold=ANGULAR_DISTANCE_THRESHOLD,
+                           max_rate=MAX_ANGULAR_RATE, pruning_step=PRUNING_STEP):
+    """ Find conjunctions of two spacecraft.
+
+    The orbits are aligned on the common rounded times. The angular distance
+    is first evaluated at every `pruning_step`-th sample and only
+    the intervals which can get below the threshold, given the maximum
+    rate of change of the angular distance `max_rate` (deg/s), and their
+    neighbours are evaluated at the full resolution.
+    """
+    if orbit1.step != orbit2.step:
+        raise ValueError("Orbits of different sampling steps!")
+    index1, index2 = _intersect_sorted(orbit1.ticks, orbit2.ticks)
+    ticks = orbit1.ticks[index1]
+    unit_vector1 = orbit1.unit_vector[index1]
+    unit_vector2 = orbit2.unit_vector[index2]
+
+    step = orbit1.step / ONE_SEC
+    selection = _get_candidate_mask(
+        ticks, unit_vector1, unit_vector2, threshold,
+        max_rate * step, pruning_step,
+    )
+    selection = flatnonzero(selection)
+
+    # new segment at data gaps and at gaps in the selection
+    is_new_segment = ones(selection.shape, dtype="bool")
+    is_new_segment[1:] = (diff(selection) > 1) | (diff(ticks[selection]) > 1)
+
+    angular_distance = get_angular_distance(
+        unit_vector1[selection], unit_vector2[selection]
+    )
+    minima = get_local_minima(angular_distance, cumsum(is_new_segment))
+    minima = minima[angular_distance[minima] <= threshold]
+    index = selection[minima]
+
+    return {
+        "Timestamp": orbit1.timestamp[index1[index]],
+        "Position1": orbit1.position[index1[index]],
+        "Position2": orbit2.position[index2[index]],
+        "AngularDistance": angular_distance[minima],
+    }
+
+
+def _intersect_sorted(values1, values2):
+    """ Get indices of the common values of two sorted unique arrays. """
+    if not values2.size:
+        return empty(0, dtype="int64"), empty(0, dtype="int64")
+    index2 = searchsorted(values2, values1).clip(0, values2.size - 1)
+    index1 = flatnonzero(values2[index2] == values1)
+    return index1, index2[index1]
+
+
+def _get_candidate_mask(ticks, unit_vector1, unit_vector2, threshold,
+                        max_rate, pruning_step):
+    """ Get mask of the samples which need to be evaluated at the full
+    resolution.
+    """
+    size = ticks.size
+    if size < 2:
+        return zeros(size, dtype="bool")
+    nodes = arange(0, size, pruning_step)
+    if nodes[-1] != size - 1:
+        nodes = concatenate((nodes, [size - 1]))
+    distance = get_angular_distance(unit_vector1[nodes], unit_vector2[nodes])
+
+    # lower bound of the angular distance between two neighbouring nodes
+    lower_bound = 0.5 * (
+        distance[:-1] + distance[1:] - max_rate * diff(ticks[nodes])
+    )
+    is_candidate = lower_bound <= threshold
+    # the neighbouring intervals are needed by the minima detection
+    is_selected = is_candidate.copy()
+    is_selected[1:] |= is_candidate[:-1]
+    is_selected[:-1] |= is_candidate[1:]
+
+    # mark samples of the selected intervals including both nodes
+    counts = zeros(size + 1, dtype="int64")
+    add.at(counts, nodes[:-1][is_selected], 1)
+    add.at(counts, nodes[1:][is_selected] + 1, -1)
+    return cumsum(counts[:-1]) > 0
+
+
+def _get_empty_result(extra_keys=()):
+    return {
+        "Timestamp": empty(0, dtype="datetime64[ns]"),
+        **{key: empty(0, dtype=object) for key in extra_keys},
+        "Position1": empty((0, 3)),
+        "Position2": empty((0, 3)),
+        "AngularDistance": empty(0),
+    }
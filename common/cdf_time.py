@@ -0,0 +1,243 @@
+#
+# vectorized CDF time conversion subroutines
+#
+# The MJD2000 times are days since 2000-01-01T00:00:00Z without leap seconds.
+# All conversions accept an optional `out` array the result is written to.
+#
+# The module is shared by the notebooks and scripts of several directories.
+# Add the common/ directory to the Python path before importing it, e.g.,
+#
+#   import sys
+#   sys.path.append("../common")
+#   from cdf_time import cdf_rawtime_to_mjd2000
+#
+
+import numpy
+from numpy import (
+    asarray, empty, empty_like, subtract, multiply, divide, add, floor,
+    isnat, isfinite, searchsorted, nan,
+)
+
+# CDF data type codes
+CDF_EPOCH = 31
+CDF_EPOCH16 = 32
+CDF_TIME_TT2000 = 33
+
+MS_PER_DAY = 86400000.0
+S_PER_DAY = 86400.0
+NS_PER_DAY = 86400000000000
+NS_TO_DAY = 1.0 / NS_PER_DAY
+PS_TO_DAY = 1e-12 / S_PER_DAY
+
+# CDF_EPOCH fill value
+CDF_EPOCH_FILL_VALUE = -1e31
+
+# CDF_EPOCH (milliseconds since 0000-01-01T00:00:00) of 2000-01-01T00:00:00
+CDF_EPOCH_2000 = 63113904000000.0
+# CDF_EPOCH of 1970-01-01T00:00:00
+CDF_EPOCH_1970 = 62167219200000.0
+# CDF_EPOCH16 seconds of 2000-01-01T00:00:00
+CDF_EPOCH16_2000 = 63113904000.0
+
+# datetime64[ns] value of 2000-01-01T00:00:00
+EPOCH_2000_NS = numpy.datetime64("2000-01-01T00:00:00", "ns").astype("int64")
+
+# TT2000 (nanoseconds since 2000-01-01T12:00:00 TT) is related to the leap
+# seconds free UTC time in nanoseconds since 2000-01-01T12:00:00 UTC by
+#   TT2000 = UTC + (TAI - UTC) + 32.184 s
+TT_TAI_OFFSET_NS = 32184000000
+NOON_NS = NS_PER_DAY // 2
+
+# TAI - UTC leap seconds (UTC date of the change, TAI - UTC in seconds)
+# Note: times before 1972 use the 1972 offset.
+LEAP_SECONDS = [
+    ("1972-01-01", 10), ("1972-07-01", 11), ("1973-01-01", 12),
+    ("1974-01-01", 13), ("1975-01-01", 14), ("1976-01-01", 15),
+    ("1977-01-01", 16), ("1978-01-01", 17), ("1979-01-01", 18),
+    ("1980-01-01", 19), ("1981-07-01", 20), ("1982-07-01", 21),
+    ("1983-07-01", 22), ("1985-07-01", 23), ("1988-01-01", 24),
+    ("1990-01-01", 25), ("1991-01-01", 26), ("1992-07-01", 27),
+    ("1993-07-01", 28), ("1994-07-01", 29), ("1996-01-01", 30),
+    ("1997-07-01", 31), ("1999-01-01", 32), ("2006-01-01", 33),
+    ("2009-01-01", 34), ("2012-07-01", 35), ("2015-07-01", 36),
+    ("2017-01-01", 37),
+]
+
+# leap second changes as UTC nanoseconds since 2000-01-01T12:00:00
+_LEAP_UTC_NS = asarray([
+    numpy.datetime64(date, "ns").astype("int64") - EPOCH_2000_NS - NOON_NS
+    for date, _ in LEAP_SECONDS
+], dtype="int64")
+_LEAP_OFFSET_NS = asarray([
+    offset * 1000000000 + TT_TAI_OFFSET_NS for _, offset in LEAP_SECONDS
+], dtype="int64")
+# leap second changes as TT2000 values
+_LEAP_TT2000 = _LEAP_UTC_NS + _LEAP_OFFSET_NS
+
+
+def cdf_rawtime_to_mjd2000(raw_time, cdf_type, out=None):
+    """ Convert an array of CDF raw time values to array of MJD2000 values.
+    """
+    try:
+        convert = CDF_TIME_TO_MJD2000[cdf_type]
+    except KeyError:
+        raise TypeError("Unsupported CDF time type %r !" % cdf_type) from None
+    return convert(raw_time, out=out)
+
+
+def mjd2000_to_cdf_rawtime(time, cdf_type, out=None):
+    """ Convert an array of MJD2000 values to array of CDF raw time values.
+    """
+    try:
+        convert = MJD2000_TO_CDF_TIME[cdf_type]
+    except KeyError:
+        raise TypeError("Unsupported CDF time type %r !" % cdf_type) from None
+    return convert(time, out=out)
+
+
+def cdf_epoch_to_mjd2000(epoch, out=None):
+    """ Convert CDF_EPOCH values to MJD2000. """
+    out = subtract(epoch, CDF_EPOCH_2000, out=out)
+    return divide(out, MS_PER_DAY, out=out)
+
+
+def mjd2000_to_cdf_epoch(time, out=None):
+    """ Convert MJD2000 values to CDF_EPOCH. """
+    out = multiply(time, MS_PER_DAY, out=out)
+    return add(out, CDF_EPOCH_2000, out=out)
+
+
+def cdf_epoch16_to_mjd2000(epoch16, out=None):
+    """ Convert CDF_EPOCH16 values to MJD2000. The CDF_EPOCH16 values are
+    either complex numbers (seconds + picoseconds * 1j) or arrays with
+    the last dimension of size 2 (seconds, picoseconds).
+    """
+    epoch16 = asarray(epoch16)
+    if numpy.iscomplexobj(epoch16):
+        seconds, picoseconds = epoch16.real, epoch16.imag
+    else:
+        seconds, picoseconds = epoch16[..., 0], epoch16[..., 1]
+    out = subtract(seconds, CDF_EPOCH16_2000, out=out)
+    divide(out, S_PER_DAY, out=out)
+    # Note: the picoseconds are added with the precision of the MJD2000 value.
+    out += picoseconds * PS_TO_DAY
+    return out
+
+
+def mjd2000_to_cdf_epoch16(time, out=None):
+    """ Convert MJD2000 values to CDF_EPOCH16 array with the last dimension
+    of size 2 (seconds, picoseconds).
+    """
+    time = asarray(time)
+    if out is None:
+        out = empty(time.shape + (2,))
+    seconds, picoseconds = out[..., 0], out[..., 1]
+    multiply(time, S_PER_DAY, out=picoseconds)
+    floor(picoseconds, out=seconds)
+    # fraction of the second
+    subtract(picoseconds, seconds, out=picoseconds)
+    multiply(picoseconds, 1e12, out=picoseconds)
+    picoseconds.round(out=picoseconds)
+    seconds += CDF_EPOCH16_2000
+    return out
+
+
+def cdf_tt2000_to_mjd2000(tt2000, out=None):
+    """ Convert CDF_TIME_TT2000 values to MJD2000 removing the leap seconds.
+    """
+    tt2000 = asarray(tt2000, dtype="int64")
+    index = searchsorted(_LEAP_TT2000, tt2000, side="right") - 1
+    offset = _LEAP_OFFSET_NS[index.clip(0, None, out=index)]
+    # UTC nanoseconds since 2000-01-01T00:00:00
+    offset -= tt2000
+    offset -= NOON_NS
+    if out is None:
+        out = empty_like(tt2000, dtype="float64")
+    multiply(offset, -NS_TO_DAY, out=out)
+    return out
+
+
+def mjd2000_to_cdf_tt2000(time, out=None):
+    """ Convert MJD2000 values to CDF_TIME_TT2000 adding the leap seconds. """
+    time = asarray(time)
+    if out is None:
+        out = empty(time.shape, dtype="int64")
+    utc_ns = (time * NS_PER_DAY).round()
+    subtract(utc_ns, NOON_NS, out=utc_ns)
+    out[...] = utc_ns
+    index = searchsorted(_LEAP_UTC_NS, out, side="right") - 1
+    out += _LEAP_OFFSET_NS[index.clip(0, None, out=index)]
+    return out
+
+
+def datetime64_to_mjd2000(times, out=None):
+    """ Convert Numpy.datetime64 array to MJD2000. NaT is converted to NaN. """
+    times = asarray(times)
+    nanoseconds = times.astype("datetime64[ns]", copy=False).view("int64")
+    if out is None:
+        out = empty(times.shape, dtype="float64")
+    subtract(nanoseconds, EPOCH_2000_NS, out=out)
+    multiply(out, NS_TO_DAY, out=out)
+    mask = isnat(times)
+    if mask.any():
+        out[mask] = nan
+    return out
+
+
+def mjd2000_to_datetime64(time, unit="ns", out=None):
+    """ Convert MJD2000 values to Numpy.datetime64 array of the given unit.
+    NaN is converted to NaT.
+    """
+    return _to_datetime64(time, 0.0, _get_units_per_day(unit), unit, out)
+
+
+def cdf_epoch_to_datetime64(epoch, unit="us", out=None):
+    """ Convert CDF_EPOCH values to Numpy.datetime64 array of the given unit.
+    NaN and the fill values are converted to NaT.
+    """
+    return _to_datetime64(
+        epoch, CDF_EPOCH_2000, _get_units_per_day(unit) / MS_PER_DAY, unit, out,
+        fill_value=CDF_EPOCH_FILL_VALUE,
+    )
+
+
+def _to_datetime64(values, offset, scale, unit, out, fill_value=None):
+    """ Convert (values - offset) * scale to datetime64 array relative
+    to 2000-01-01T00:00:00. The non-finite values, the fill values and
+    the values out of the datetime64 range are converted to NaT.
+    """
+    values = asarray(values)
+    is_invalid = ~isfinite(values)
+    if fill_value is not None:
+        is_invalid |= values == fill_value
+    values = subtract(values, offset, dtype="float64")
+    values *= scale
+    values.round(out=values)
+    is_invalid |= ~(abs(values) < 2.0**63)
+    if out is None:
+        out = empty(values.shape, dtype=f"datetime64[{unit}]")
+    has_invalid = is_invalid.any()
+    if has_invalid:
+        values[is_invalid] = 0
+    out.view("int64")[...] = values
+    out.view("int64")[...] += numpy.datetime64("2000-01-01", unit).astype("int64")
+    if has_invalid:
+        out[is_invalid] = numpy.datetime64("NaT")
+    return out
+
+
+def _get_units_per_day(unit):
+    return NS_PER_DAY // numpy.timedelta64(1, unit).astype("timedelta64[ns]").astype("int64")
+
+
+CDF_TIME_TO_MJD2000 = {
+    CDF_EPOCH: cdf_epoch_to_mjd2000,
+    CDF_EPOCH16: cdf_epoch16_to_mjd2000,
+    CDF_TIME_TT2000: cdf_tt2000_to_mjd2000,
+}
+
+MJD2000_TO_CDF_TIME = {
+    CDF_EPOCH: mjd2000_to_cdf_epoch,
+    CDF_EPOCH16: mjd2000_to_cdf_epoch16,
+    CDF_TIME_TT2000: mjd2000_to_cdf_tt2000,
+}
@@ -0,0 +1,143 @@
+#
+# CDF time conversion round-trip checks and micro-benchmark
+#
+# Usage:
+#
+#   python3 cdf_time_benchmark.py [--size 10000000] [--repeat 5]
+#
+
+import sys
+import time
+import argparse
+import numpy
+from cdf_time import (
+    CDF_EPOCH, CDF_EPOCH16, CDF_TIME_TT2000,
+    cdf_rawtime_to_mjd2000, mjd2000_to_cdf_rawtime,
+    datetime64_to_mjd2000, mjd2000_to_datetime64, cdf_epoch_to_datetime64,
+    CDF_EPOCH_2000, CDF_EPOCH_1970,
+)
+
+# maximum round-trip errors in days
+# Note: the double precision CDF_EPOCH resolution is about 8us.
+TOLERANCE = {
+    CDF_EPOCH: 1e-5 / 86400, # 10us
+    CDF_EPOCH16: 1e-6 / 86400, # 1us
+    CDF_TIME_TT2000: 1e-6 / 86400, # 1us
+}
+
+CDF_TYPE_NAMES = {
+    CDF_EPOCH: "CDF_EPOCH",
+    CDF_EPOCH16: "CDF_EPOCH16",
+    CDF_TIME_TT2000: "CDF_TIME_TT2000",
+}
+
+# known TT2000 values (UTC time, TT2000 nanoseconds) computed by cdflib
+TT2000_REFERENCE = [
+    ("2000-01-01T11:58:55.816", 0),
+    ("2000-01-01T00:00:00", -43135816000000),
+    ("2016-12-31T23:59:59", 536500867184000000),
+    ("2017-01-01T00:00:00", 536500869184000000),
+    ("1985-03-01T12:00:00", -468201545816000000),
+]
+
+
+def check_round_trips(size=100000, seed=0):
+    """ Check round-trip conversions of random times. """
+    rng = numpy.random.default_rng(seed)
+    # random times between 1980 and 2040 including the leap second days
+    times = numpy.concatenate([
+        rng.uniform(-7305.0, 14610.0, size),
+        numpy.asarray([6209.0, 6209.999999, 6210.0, 4565.5, 0.0, -0.5]),
+    ])
+    for cdf_type in (CDF_EPOCH, CDF_EPOCH16, CDF_TIME_TT2000):
+        raw_times = mjd2000_to_cdf_rawtime(times, cdf_type)
+        result = cdf_rawtime_to_mjd2000(raw_times, cdf_type)
+        error = numpy.abs(result - times).max()
+        _check(
+            error <= TOLERANCE[cdf_type],
+            f"{CDF_TYPE_NAMES[cdf_type]} round-trip error {error * 86400:.3g}s",
+        )
+
+    datetimes = mjd2000_to_datetime64(times, "ns")
+    error = numpy.abs(datetime64_to_mjd2000(datetimes) - times).max()
+    _check(error <= 1e-6 / 86400, f"datetime64 round-trip error {error * 86400:.3g}s")
+
+    # NaT handling
+    result = datetime64_to_mjd2000(numpy.asarray(["NaT", "2000-01-02"], "datetime64[ns]"))
+    _check(numpy.isnan(result[0]) and result[1] == 1.0, "NaT conversion")
+
+    # TT2000 leap seconds
+    for utc_time, tt2000 in TT2000_REFERENCE:
+        mjd2000 = datetime64_to_mjd2000(numpy.asarray([utc_time], "datetime64[ns]"))
+        result = mjd2000_to_cdf_rawtime(mjd2000, CDF_TIME_TT2000)[0]
+        _check(
+            abs(int(result) - tt2000) < 1000,
+            f"TT2000 of {utc_time} {result} != {tt2000}",
+        )
+
+    # CDF_EPOCH to datetime64
+    result = cdf_epoch_to_datetime64(numpy.asarray([CDF_EPOCH_1970, CDF_EPOCH_2000 + 1.5]))
+    _check(
+        (result == numpy.asarray(["1970-01-01", "2000-01-01T00:00:00.0015"], "datetime64[us]")).all(),
+        "CDF_EPOCH to datetime64 conversion",
+    )
+
+    # in-place conversion
+    out = numpy.empty(times.shape)
+    result = cdf_rawtime_to_mjd2000(
+        mjd2000_to_cdf_rawtime(times, CDF_EPOCH), CDF_EPOCH, out=out
+    )
+    _check(result is out, "output buffer")
+    print("round-trip checks passed")
+
+
+def run_benchmark(size=10000000, repeat=5, seed=0):
+    """ Measure conversion throughput. """
+    rng = numpy.random.default_rng(seed)
+    times = rng.uniform(0.0, 9000.0, size)
+    out = numpy.empty(size)
+    inputs = {
+        cdf_type: mjd2000_to_cdf_rawtime(times, cdf_type)
+        for cdf_type in (CDF_EPOCH, CDF_EPOCH16, CDF_TIME_TT2000)
+    }
+    datetimes = mjd2000_to_datetime64(times)
+
+    def _measure(label, function):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start)
+        duration = min(durations)
+        print(f"{label:<40} {duration * 1e3:8.2f} ms  {size / duration / 1e6:8.1f} Msamples/s")
+
+    for cdf_type, raw_times in inputs.items():
+        name = CDF_TYPE_NAMES[cdf_type]
+        _measure(f"{name} -> MJD2000", lambda: cdf_rawtime_to_mjd2000(raw_times, cdf_type))
+        _measure(f"{name} -> MJD2000 (out=)", lambda: cdf_rawtime_to_mjd2000(raw_times, cdf_type, out=out))
+        _measure(f"MJD2000 -> {name}", lambda: mjd2000_to_cdf_rawtime(times, cdf_type))
+    _measure("datetime64 -> MJD2000", lambda: datetime64_to_mjd2000(datetimes))
+    _measure("datetime64 -> MJD2000 (out=)", lambda: datetime64_to_mjd2000(datetimes, out=out))
+    _measure("datetime64 -> MJD2000 (previous)", lambda: (
+        (datetimes.astype("datetime64[ns]") - numpy.datetime64("2000-01-01", "ns"))
+        .astype("int64") * (1.0 / 86400000000000.0)
+    ))
+    _measure("MJD2000 -> datetime64", lambda: mjd2000_to_datetime64(times))
+
+
+def _check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=10000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    check_round_trips()
+    run_benchmark(size=args.size, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+#
+# level-of-detail downsampling of large time-series and latitude plots
+#
+# The plotted data are reduced in the pixel space before drawing while
+# the extreme values are preserved:
+#
+#   - time-series (sorted x) are reduced by the min/max (M4) binning
+#     of a precomputed multi-resolution pyramid or by the LTTB algorithm,
+#   - scatter plots (e.g., residuals vs. latitude) are reduced to one point
+#     per occupied pixel.
+#
+# The plots are re-aggregated when drawn after the axes have been zoomed
+# or panned.
+#
+# The module is shared by the MAG, AEBS and PRISM notebooks. Add the common/
+# directory to the Python path before importing it, e.g.,
+#
+#   import sys
+#   sys.path.append("../common")
+#   from lod_plot import plot_lod
+#
+# Usage:
+#
+#   plot_lod(ax, data["Timestamp"].values, data["F"].values, "-")
+#   plot_lod(ax, data["QDLat"].values, delta, ".", ms=2)
+#
+
+import numpy
+from numpy import (
+    asarray, empty, full, arange, repeat, concatenate, unique, lexsort, flatnonzero,
+    searchsorted, isfinite, diff, floor, argmax, abs as absolute,
+)
+from matplotlib.dates import date2num
+
+PYRAMID_FACTOR = 4
+DEFAULT_PIXELS = 1000
+
+METHOD_MINMAX = "minmax"
+METHOD_LTTB = "lttb"
+METHOD_PIXEL = "pixel"
+
+
+def minmax_downsample(x, y, n_bins, x_range=None):
+    """ Get sorted indices of the first, last, minimum and maximum points
+    of each of the `n_bins` equidistant x bins (M4 aggregation).
+    """
+    x, y = asarray(x, dtype="float64"), asarray(y, dtype="float64")
+    index = flatnonzero(isfinite(x) & isfinite(y))
+    if not index.size:
+        return index
+    x_min, x_max = x_range or (x[index].min(), x[index].max())
+    index = index[(x[index] >= x_min) & (x[index] <= x_max)]
+    if not index.size:
+        return index
+    bins = _get_bins(x[index], x_min, x_max, n_bins)
+
+    if (diff(bins) >= 0).all():
+        return index[_sorted_minmax(x[index], y[index], bins)]
+
+    # groups sorted by bin and then by y or x
+    by_y = lexsort((y[index], bins))
+    by_x = index[lexsort((x[index], bins))]
+    bins, by_y = bins[by_y], index[by_y]
+    first = flatnonzero(concatenate(([True], diff(bins) != 0)))
+    last = concatenate((first[1:], [index.size])) - 1
+    return unique(concatenate((by_y[first], by_y[last], by_x[first], by_x[last])))
+
+
+def lttb_downsample(x, y, n_out):
+    """ Get indices of the points selected by the Largest-Triangle-Three-Buckets
+    algorithm. The x values must be sorted.
+    """
+    x, y = asarray(x, dtype="float64"), asarray(y, dtype="float64")
+    index = flatnonzero(isfinite(x) & isfinite(y))
+    if index.size <= max(n_out, 2):
+        return index
+    x, y = x[index], y[index]
+    size = x.size
+    # bucket edges of the inner points (the first and last points are kept)
+    edges = (1 + arange(n_out - 1) * (size - 2) / (n_out - 2)).astype("int64")
+    edges[-1] = size - 1
+    selected = empty(n_out, dtype="int64")
+    selected[0], selected[-1] = 0, size - 1
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < edges.size else size
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        prev_x, prev_y = x[selected[bucket]], y[selected[bucket]]
+        # doubled areas of the triangles
+        area = absolute(
+            (prev_x - next_x) * (y[start:end] - prev_y) -
+            (prev_x - x[start:end]) * (next_y - prev_y)
+        )
+        selected[bucket + 1] = start + argmax(area)
+    return index[selected]
+
+
+def pixel_downsample(x, y, width, height, x_range=None, y_range=None):
+    """ Get indices of one point per occupied pixel of the given
+    `width` x `height` raster.
+    """
+    x, y = asarray(x, dtype="float64"), asarray(y, dtype="float64")
+    index = flatnonzero(isfinite(x) & isfinite(y))
+    if not index.size:
+        return index
+    x_min, x_max = x_range or (x[index].min(), x[index].max())
+    y_min, y_max = y_range or (y[index].min(), y[index].max())
+    index = index[
+        (x[index] >= x_min) & (x[index] <= x_max) &
+        (y[index] >= y_min) & (y[index] <= y_max)
+    ]
+    pixels = (
+        _get_bins(y[index], y_min, y_max, height) * width +
+        _get_bins(x[index], x_min, x_max, width)
+    )
+    # any point of a pixel is its representative
+    raster = full(width * height, -1, dtype="int64")
+    raster[pixels] = arange(pixels.size)
+    return index[numpy.sort(raster[raster >= 0])]
+
+
+class MinMaxPyramid:
+    """ Multi-resolution pyramid of the minimum and maximum values
+    of a time-series with sorted x values.
+
+    The level L keeps indices of the minimum and maximum y values
+    and of the first and last finite y values of consecutive blocks
+    of `factor`**L samples.
+    """
+
+    def __init__(self, x, y, factor=PYRAMID_FACTOR):
+        self.x = asarray(x, dtype="float64")
+        self.y = asarray(y, dtype="float64")
+        self.factor = factor
+        # NaN values are never selected
+        values = numpy.where(isfinite(self.y), self.y, numpy.nan)
+        index = arange(self.y.size)
+        # (idx_min, idx_max, idx_first, idx_last)
+        self.levels = [(index, index, index, index)]
+        while self.levels[-1][0].size > 1:
+            self.levels.append(self._reduce(values, *self.levels[-1]))
+
+    def _reduce(self, values, idx_min, idx_max, idx_first, idx_last):
+        size = idx_min.size
+        blocks = -(-size // self.factor)
+        padding = blocks * self.factor - size
+
+        def _reshape(index):
+            return concatenate((
+                index, index[-1:].repeat(padding)
+            )).reshape(blocks, self.factor)
+
+        idx_min, idx_max = _reshape(idx_min), _reshape(idx_max)
+        idx_first, idx_last = _reshape(idx_first), _reshape(idx_last)
+        rows = arange(blocks)
+        return (
+            idx_min[rows, _nanargbest(values[idx_min], numpy.fmin)],
+            idx_max[rows, _nanargbest(values[idx_max], numpy.fmax)],
+            idx_first[rows, _get_first_finite(values[idx_first])],
+            idx_last[rows, self.factor - 1 - _get_first_finite(
+                values[idx_last][:, ::-1]
+            )],
+        )
+
+    def query(self, x_range, n_bins):
+        """ Get indices of the points representing the data within the x range
+        reduced to `n_bins` min/max bins.
+
+        The blocks straddling the bin edges are recursively replaced by
+        their sub-blocks down to the individual samples so that the selected
+        points are the same as of the full resolution min/max binning.
+        """
+        start = searchsorted(self.x, x_range[0], side="left")
+        end = searchsorted(self.x, x_range[1], side="right")
+        if end <= start:
+            return empty(0, dtype="int64")
+        block_size, level = 1, 0
+        while level + 1 < len(self.levels) and (
+            (end - start) // (block_size * self.factor) >= 2 * n_bins
+        ):
+            block_size *= self.factor
+            level += 1
+        block_start = -(-start // block_size)
+        block_end = end // block_size
+        candidates = [
+            # partial blocks at the edges of the view
+            arange(start, min(block_start * block_size, end)),
+            arange(max(block_end * block_size, start), end),
+        ]
+        blocks = arange(block_start, max(block_end, block_start))
+        while level > 0 and blocks.size:
+            first = blocks * block_size
+            last = first + block_size - 1
+            is_split = (
+                _get_bins(self.x[first], *x_range, n_bins) !=
+                _get_bins(self.x[last], *x_range, n_bins)
+            )
+            # blocks within one bin are represented by their first, last,
+            # minimum and maximum finite points
+            whole = blocks[~is_split]
+            candidates.extend(index[whole] for index in self.levels[level])
+            blocks = (
+                blocks[is_split][:, None] * self.factor + arange(self.factor)
+            ).ravel()
+            block_size //= self.factor
+            level -= 1
+        candidates.append(blocks)
+        candidates = unique(concatenate(candidates))
+        selected = minmax_downsample(
+            self.x[candidates], self.y[candidates], n_bins, tuple(x_range),
+        )
+        return candidates[selected]
+
+
+def plot_lod(ax, x, y, fmt="-", method=None, **options):
+    """ Plot level-of-detail downsampled data and re-aggregate them when
+    the axes are zoomed or panned.
+
+    By default, sorted x values are plotted as a min/max reduced time-series
+    and unsorted values as a pixel reduced scatter plot. Returns the plotted
+    line.
+    """
+    x, y = asarray(x), asarray(y)
+    x_numeric = _to_numeric(x)
+    if method is None:
+        is_sorted = x_numeric.size < 2 or (diff(x_numeric) >= 0).all()
+        method = METHOD_MINMAX if is_sorted else METHOD_PIXEL
+
+    if method == METHOD_MINMAX:
+        pyramid = MinMaxPyramid(x_numeric, y)
+
+        def _select(x_range, y_range, width, height):
+            return pyramid.query(x_range, width)
+
+    elif method == METHOD_LTTB:
+
+        def _select(x_range, y_range, width, height):
+            start = max(searchsorted(x_numeric, x_range[0], side="left") - 1, 0)
+            end = min(searchsorted(x_numeric, x_range[1], side="right") + 1, x_numeric.size)
+            return start + lttb_downsample(
+                x_numeric[start:end], y[start:end], 2 * width
+            )
+
+    elif method == METHOD_PIXEL:
+
+        def _select(x_range, y_range, width, height):
+            return pixel_downsample(
+                x_numeric, y, width, height, x_range=x_range, y_range=y_range,
+            )
+
+    else:
+        raise ValueError(f"Invalid downsampling method {method!r}!")
+
+    def _get_view():
+        x_range = tuple(sorted(ax.get_xlim()))
+        y_range = tuple(sorted(ax.get_ylim())) if method == METHOD_PIXEL else None
+        width = int(ax.bbox.width) or DEFAULT_PIXELS
+        height = int(ax.bbox.height) or DEFAULT_PIXELS
+        return x_range, y_range, width, height
+
+    # initial view of the whole data
+    index = _select(
+        _get_finite_range(x_numeric), _get_finite_range(y),
+        int(ax.bbox.width) or DEFAULT_PIXELS,
+        int(ax.bbox.height) or DEFAULT_PIXELS,
+    )
+    line, = ax.plot(x[index], y[index], fmt, **options)
+
+    # The data are re-aggregated when the line is drawn and the view has
+    # changed, i.e., once for any number of the axes limits changes.
+    draw_line = line.draw
+    last_view = [None]
+
+    def _draw(renderer):
+        view = _get_view()
+        if view != last_view[0]:
+            last_view[0] = view
+            index = _select(*view)
+            line.set_data(x[index], y[index])
+        return draw_line(renderer)
+
+    line.draw = _draw
+    return line
+
+
+def _to_numeric(x):
+    """ Convert x values to the numeric axis units. """
+    if numpy.issubdtype(x.dtype, numpy.datetime64):
+        return date2num(x)
+    return asarray(x, dtype="float64")
+
+
+def _get_finite_range(values):
+    values = asarray(values, dtype="float64")
+    values = values[isfinite(values)]
+    if not values.size:
+        return (0.0, 1.0)
+    return (values.min(), values.max())
+
+
+def _get_bins(values, min_value, max_value, n_bins):
+    scale = n_bins / (max_value - min_value) if max_value > min_value else 0.0
+    return floor((values - min_value) * scale).astype("int64").clip(0, n_bins - 1)
+
+
+def _sorted_minmax(x, y, bins):
+    """ Get indices of the first, last, minimum and maximum points
+    of the non-decreasing bins.
+    """
+    starts = flatnonzero(concatenate(([True], diff(bins) != 0)))
+    ends = concatenate((starts[1:], [bins.size]))
+    counts = ends - starts
+    minima = numpy.minimum.reduceat(y, starts)
+    maxima = numpy.maximum.reduceat(y, starts)
+    return unique(concatenate((
+        starts, ends - 1,
+        _get_first_match(y == repeat(minima, counts), starts),
+        _get_first_match(y == repeat(maxima, counts), starts),
+    )))
+
+
+def _get_first_match(mask, starts):
+    """ Get index of the first true value at or after each start. """
+    matches = flatnonzero(mask)
+    return matches[searchsorted(matches, starts)]
+
+
+def _get_first_finite(values):
+    """ Get column indices of the first finite value of each row or 0
+    for the rows without any finite value.
+    """
+    return argmax(isfinite(values), axis=1)
+
+
+def _nanargbest(values, reduce):
+    """ Get column indices of the minimum or maximum of each row ignoring NaN.
+    """
+    best = reduce.reduce(values, axis=1)
+    is_best = (values == best[:, None])
+    # all-NaN rows
+    is_best[~is_best.any(axis=1), 0] = True
+    return argmax(is_best, axis=1)
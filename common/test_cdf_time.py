@@ -0,0 +1,44 @@
+#
+# tests of the CDF time conversions of missing values
+#
+
+import warnings
+import numpy
+from numpy.testing import assert_equal
+from cdf_time import (
+    CDF_EPOCH_FILL_VALUE, datetime64_to_mjd2000, mjd2000_to_datetime64,
+    cdf_epoch_to_datetime64, mjd2000_to_cdf_epoch,
+)
+
+TIMES = numpy.array([
+    "2000-01-01T00:00:00", "NaT", "2015-06-30T23:59:59.999", "NaT",
+    "1999-12-31T12:00:00",
+], dtype="datetime64[ms]")
+
+
+def test_datetime64_mjd2000_round_trip_with_nat():
+    mjd2000 = datetime64_to_mjd2000(TIMES)
+    assert_equal(numpy.isnan(mjd2000), numpy.isnat(TIMES))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = mjd2000_to_datetime64(mjd2000, unit="ms")
+    assert_equal(result, TIMES)
+
+
+def test_mjd2000_to_datetime64_non_finite():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = mjd2000_to_datetime64([0.0, numpy.nan, numpy.inf, -numpy.inf])
+    assert_equal(
+        result, numpy.array(["2000-01-01", "NaT", "NaT", "NaT"], dtype="datetime64[ns]")
+    )
+
+
+def test_cdf_epoch_to_datetime64_fill_value():
+    epoch = mjd2000_to_cdf_epoch(datetime64_to_mjd2000(TIMES))
+    assert_equal(numpy.isnan(epoch), numpy.isnat(TIMES))
+    epoch[1] = CDF_EPOCH_FILL_VALUE
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = cdf_epoch_to_datetime64(epoch, unit="ms")
+    assert_equal(result, TIMES)
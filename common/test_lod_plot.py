@@ -0,0 +1,61 @@
+#
+# tests of the level-of-detail downsampling
+#
+
+import pytest
+import numpy
+from numpy.testing import assert_equal
+
+pytest.importorskip("matplotlib")
+
+from lod_plot import MinMaxPyramid, minmax_downsample  # noqa: E402
+
+
+def _get_random_walk(rng, size, nan_fraction=0.0):
+    x = numpy.sort(rng.uniform(0, 1000, size))
+    y = numpy.cumsum(rng.normal(size=size))
+    y[rng.random(size) < nan_fraction] = numpy.nan
+    return x, y
+
+
+def _get_reference(x, y, x_range, n_bins):
+    index = numpy.flatnonzero((x >= x_range[0]) & (x <= x_range[1]))
+    return index[minmax_downsample(x[index], y[index], n_bins, x_range)]
+
+
+def test_minmax_downsample_empty_range():
+    x = numpy.arange(10.0)
+    assert minmax_downsample(x, x, 5, (20, 30)).size == 0
+
+
+@pytest.mark.parametrize("nan_fraction", [0.0, 0.05, 0.9])
+def test_pyramid_query_matches_minmax_downsample(nan_fraction):
+    rng = numpy.random.default_rng(0)
+    x, y = _get_random_walk(rng, 100000, nan_fraction)
+    pyramid = MinMaxPyramid(x, y)
+    for _ in range(100):
+        x_range = tuple(numpy.sort(rng.uniform(-10, 1010, 2)))
+        n_bins = int(rng.integers(1, 1000))
+        assert_equal(
+            pyramid.query(x_range, n_bins),
+            _get_reference(x, y, x_range, n_bins),
+        )
+
+
+def test_pyramid_query_keeps_spikes():
+    rng = numpy.random.default_rng(1)
+    x, _ = _get_random_walk(rng, 100000)
+    y = rng.normal(size=x.size) * 0.01
+    spikes = rng.choice(x.size, 100, replace=False)
+    y[spikes] += 10
+    x_range = (x[0], x[-1])
+    selected = MinMaxPyramid(x, y).query(x_range, 1000)
+    assert_equal(selected, _get_reference(x, y, x_range, 1000))
+    # each bin keeps its largest spike
+    reference_bins = numpy.unique(numpy.floor(
+        (x[spikes] - x[0]) * 1000 / (x[-1] - x[0])
+    ).clip(0, 999))
+    selected_bins = numpy.unique(numpy.floor(
+        (x[selected[y[selected] > 5]] - x[0]) * 1000 / (x[-1] - x[0])
+    ).clip(0, 999))
+    assert_equal(selected_bins, reference_bins)